@@ -0,0 +1,472 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+from echoswift.connections import NEW, REUSED, connection_settings, phase_fields
+from echoswift.prompt_store import shared_prompt_store
+from echoswift.result_sink import RESULT_FIELDNAMES, ResultSink
+from echoswift.streaming import EMPTY_STREAM, StreamCollector, get_adapter, request_timeouts
+from echoswift.token_counter import TokenCounter
+from echoswift.token_index import DEFAULT_REVISION, DEFAULT_TOKENIZER, ensure_token_index, load_tokenizer
+from echoswift.utils.itl import encode_itl_record, inter_token_gaps, itl_summary
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ARRIVAL_PROCESSES = ("poisson", "constant")
+
+
+def arrival_offsets(count: int, request_rate: float, arrival: str = "poisson", rng: random.Random = None) -> List[float]:
+    """Send times in seconds, relative to the start of a cell, for an open-loop load at request_rate."""
+    if request_rate <= 0:
+        raise ValueError(f"Request rate must be positive, got {request_rate}")
+    if arrival == "constant":
+        return [i / request_rate for i in range(count)]
+    if arrival == "poisson":
+        rng = rng or random.Random()
+        offsets, t = [], 0.0
+        for _ in range(count):
+            offsets.append(t)
+            t += rng.expovariate(request_rate)
+        return offsets
+    raise ValueError(f"Unknown arrival process '{arrival}'. Expected one of: {', '.join(ARRIVAL_PROCESSES)}")
+
+
+def truncate_history(history: List[Tuple[dict, int]], max_context_tokens: int = None) -> List[Tuple[dict, int]]:
+    """Drop the oldest messages until the history fits max_context_tokens, always keeping the newest one."""
+    if not max_context_tokens:
+        return history
+    total = sum(tokens for _, tokens in history)
+    start = 0
+    while total > max_context_tokens and start < len(history) - 1:
+        total -= history[start][1]
+        start += 1
+    # A conversation resumes with a user message
+    while start < len(history) - 1 and history[start][0]["role"] != "user":
+        start += 1
+    return history[start:]
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    """Stamps a request's connection events into the dict passed to the request as trace_request_ctx."""
+    trace = aiohttp.TraceConfig()
+
+    def stamp(event):
+        async def on_event(session, context, params):
+            context.trace_request_ctx[event] = time.perf_counter()
+        return on_event
+
+    trace.on_connection_queued_start.append(stamp("queued"))
+    trace.on_connection_queued_end.append(stamp("dequeued"))
+    trace.on_connection_create_start.append(stamp("connecting"))
+    trace.on_connection_create_end.append(stamp("connected"))
+    trace.on_connection_reuseconn.append(stamp("reused"))
+    return trace
+
+
+class ScheduledRequest(NamedTuple):
+    """One request of a schedule: when to send it (seconds from the start), what, and its target lengths."""
+    offset: float
+    prompt: str
+    prompt_tokens: int
+    input_tokens: int
+    output_tokens: int
+
+
+class _Recorder:
+    """Writes every attempt to the result sink, and counts the successful ones."""
+
+    def __init__(self, results: Optional[ResultSink], itl_dump: Optional[ResultSink], on_result, on_error,
+                 stop: asyncio.Event):
+        self.results = results
+        self.itl_dump = itl_dump
+        self.on_result = on_result
+        self.on_error = on_error
+        self.stop = stop
+        self.completed = 0
+
+    def record(self, request_number, response, cell: dict, max_new_tokens: int):
+        row, itl_gaps, _ = response
+        row.update(cell, request=request_number)
+        if self.results:
+            self.results.write(row)
+        if row['error']:
+            if self.on_error:
+                self.on_error(row)
+            return
+        if self.itl_dump:
+            self.itl_dump.write(encode_itl_record(request_number, max_new_tokens, itl_gaps))
+        self.completed += 1
+        if self.on_result and self.on_result(row):
+            self.stop.set()
+
+    async def close(self, loop):
+        # Closing drains the writer threads; run it off the event loop
+        if self.results:
+            await loop.run_in_executor(None, self.results.close)
+        if self.itl_dump:
+            await loop.run_in_executor(None, self.itl_dump.close)
+
+
+class AsyncLoadEngine:
+    """
+    Runs benchmark cells inside one long-lived asyncio event loop.
+
+    The tokenizer and the pooled HTTP session are created once and reused
+    for every (users, input_tokens, output_tokens) cell, instead of paying
+    a Locust process start-up per cell. By default users within a cell
+    advance in lockstep waves, matching the barrier behaviour of the Locust
+    engine. Given a request rate, a cell instead runs open-loop: requests
+    are sent at scheduled arrival times, with the user count capping how
+    many are in flight. Every request is bounded by the connect, read and
+    total timeouts (see request_timeouts). With connections["pool_size"]
+    set, a cell gets that many connections per user, and with keep_alive
+    off every request opens its own (see connection_settings).
+    """
+
+    def __init__(self, api_url: str, inference_server: str, model_name: str = None,
+                 max_requests: int = 5, tokenizer_name: str = DEFAULT_TOKENIZER,
+                 tokenizer_revision: str = DEFAULT_REVISION, result_format: str = "csv", timeouts: dict = None,
+                 connections: dict = None):
+        self.api_url = api_url
+        self.inference_server = inference_server
+        self.adapter = get_adapter(inference_server)
+        self.model_name = model_name
+        self.max_requests = max_requests
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer_revision = tokenizer_revision
+        self.result_format = result_format
+        self.timeouts = request_timeouts(timeouts)
+        self.connections = connection_settings(connections)
+        self.tokenizer = load_tokenizer(tokenizer_name, tokenizer_revision)
+        self.token_counter = TokenCounter(self.tokenizer)
+        self._datasets = {}
+        self._loop = asyncio.new_event_loop()
+        self._session = None
+        self._session_limit = None
+
+    def run_cell(self, users: int, input_tokens: int, max_new_tokens: int, dataset_file: Path,
+                 output_file: Optional[Path], on_result: Callable[[dict], None] = None, itl_dump_file: Path = None,
+                 request_rate: float = None, arrival: str = "poisson", seed=None,
+                 on_error: Callable[[dict], None] = None, sessions: dict = None, lengths=None) -> int:
+        """
+        Run one benchmark cell and append its per-request rows to output_file
+        (a CSV file, or a Parquet directory when result_format is parquet).
+        Every successful row is also passed to on_result; output_file may be
+        None when the caller collects the rows itself. When on_result returns
+        True the cell is cut short: requests in flight finish but no new ones
+        are sent. Failed requests are written too, with their error, and
+        passed to on_error instead.
+        When itl_dump_file is given, the raw inter-token gaps of every request
+        are appended to it as well. With request_rate set, users * max_requests
+        requests arrive at that rate (poisson or constant spacing).
+        A seed makes the prompt sequence (and arrival times) reproducible.
+        With sessions ({"turns", "think_time", "max_context_tokens"}) every
+        user holds multi-turn conversations instead; see _run_sessions.
+        With lengths (a LengthMix), every request draws its own prompt and
+        output length, and rows carry them as target_input_tokens and
+        target_output_tokens; input_tokens, max_new_tokens and dataset_file
+        are then unused. Returns the number of successful requests.
+        """
+        return self._loop.run_until_complete(
+            self._run_cell(users, input_tokens, max_new_tokens, dataset_file, output_file, on_result,
+                           itl_dump_file, request_rate, arrival, seed, on_error, sessions, lengths)
+        )
+
+    def run_schedule(self, requests: List[ScheduledRequest], output_file: Optional[Path],
+                     on_result: Callable[[dict], None] = None, on_error: Callable[[dict], None] = None,
+                     max_in_flight: int = 0, itl_dump_file: Path = None) -> int:
+        """
+        Send every request at its own offset with its own prompt and output
+        length, e.g. to replay a recorded trace, with at most max_in_flight
+        requests outstanding (0 for no limit). Rows carry each request's target
+        lengths in the cell columns, and its send offset and lag. on_result and
+        on_error behave as in run_cell. Returns the number of successful requests.
+        """
+        return self._loop.run_until_complete(
+            self._run_schedule(requests, output_file, on_result, on_error, max_in_flight, itl_dump_file)
+        )
+
+    def close(self):
+        if self._session is not None:
+            self._loop.run_until_complete(self._session.close())
+            self._session = None
+        self._loop.close()
+        self.token_counter.close()
+
+    def _load_dataset(self, dataset_file: Path):
+        """Prompts and their precomputed token counts, loaded once per dataset file."""
+        key = str(dataset_file)
+        if key not in self._datasets:
+            index = ensure_token_index(dataset_file, self.tokenizer_name, self.tokenizer_revision, tokenizer=self.tokenizer)
+            self._datasets[key] = (shared_prompt_store(dataset_file), index.counts)
+        return self._datasets[key]
+
+    async def _get_session(self, users: int = 0) -> aiohttp.ClientSession:
+        """The pooled session, re-created when a per-user pool size gives this cell a different limit."""
+        pool_size = self.connections["pool_size"]
+        limit = pool_size * users if pool_size and users else 0
+        if self._session is not None and limit != self._session_limit:
+            await self._session.close()
+            self._session = None
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=limit, force_close=not self.connections["keep_alive"])
+            timeout = aiohttp.ClientTimeout(total=self.timeouts["total"], sock_connect=self.timeouts["connect"],
+                                            sock_read=self.timeouts["read"])
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  trace_configs=[_trace_config()])
+            self._session_limit = limit
+        return self._session
+
+    def _open_recorder(self, output_file, itl_dump_file, on_result, on_error) -> _Recorder:
+        results = ResultSink(output_file, RESULT_FIELDNAMES, self.result_format) if output_file else None
+        itl_dump = ResultSink(itl_dump_file, fmt="binary") if itl_dump_file else None
+        return _Recorder(results, itl_dump, on_result, on_error, asyncio.Event())
+
+    async def _run_cell(self, users, input_tokens, max_new_tokens, dataset_file, output_file, on_result,
+                        itl_dump_file, request_rate, arrival, seed, on_error, sessions=None, lengths=None):
+        session = await self._get_session(users)
+        recorder = self._open_recorder(output_file, itl_dump_file, on_result, on_error)
+        cell = {'users': users, 'request_rate': request_rate if request_rate is not None else ''}
+        rng = random.Random(seed)
+
+        if lengths is not None:
+            draw = lengths.draw
+
+            async def send(request):
+                response = await self._send_request(session, request.prompt, request.prompt_tokens,
+                                                    request.output_tokens)
+                response[0].update(target_input_tokens=request.input_tokens,
+                                   target_output_tokens=request.output_tokens)
+                return response
+
+            def record(request_number, response):
+                recorder.record(request_number, response, cell, response[0]['target_output_tokens'])
+        else:
+            prompts, token_counts = self._load_dataset(dataset_file)
+            cell.update(target_input_tokens=input_tokens, target_output_tokens=max_new_tokens)
+
+            def draw(prompt_rng):
+                return prompt_rng.randrange(len(prompts))
+
+            def send(prompt_index):
+                return self._send_request(session, prompts[prompt_index], int(token_counts[prompt_index]),
+                                          max_new_tokens)
+
+            def record(request_number, response):
+                recorder.record(request_number, response, cell, max_new_tokens)
+
+        try:
+            if sessions:
+                await self._run_sessions(users, session, prompts, token_counts, max_new_tokens, sessions,
+                                         record, recorder.stop, rng)
+            elif request_rate is None:
+                await self._run_waves(users, draw, send, record, recorder.stop, rng)
+            else:
+                await self._run_arrivals(users, request_rate, arrival, draw, send, record, recorder.stop, rng)
+        finally:
+            await recorder.close(self._loop)
+
+        return recorder.completed
+
+    async def _run_schedule(self, requests, output_file, on_result, on_error, max_in_flight, itl_dump_file):
+        session = await self._get_session(max_in_flight)
+        recorder = self._open_recorder(output_file, itl_dump_file, on_result, on_error)
+
+        def send(k):
+            request = requests[k]
+            return self._send_request(session, request.prompt, request.prompt_tokens, request.output_tokens)
+
+        def record(request_number, response):
+            request = requests[request_number - 1]
+            cell = {'users': max_in_flight or '', 'target_input_tokens': request.input_tokens,
+                    'target_output_tokens': request.output_tokens, 'request_rate': ''}
+            recorder.record(request_number, response, cell, request.output_tokens)
+
+        try:
+            send_offsets, send_lags = await self._send_on_schedule(
+                [r.offset for r in requests], send, record, recorder.stop, max_in_flight)
+        finally:
+            await recorder.close(self._loop)
+
+        if send_lags:
+            logging.info(f"Sent {len(send_offsets)} scheduled requests, max send lag {max(send_lags) * 1000:.1f} ms")
+        return recorder.completed
+
+    async def _run_waves(self, users, draw, send, record, stop, rng):
+        """Closed loop: every user sends one request per wave and waits for the slowest."""
+        for request_number in range(1, self.max_requests + 1):
+            if stop.is_set():
+                break
+            requests = [draw(rng) for _ in range(users)]
+            responses = await asyncio.gather(*(send(r) for r in requests))
+            for response in responses:
+                record(request_number, response)
+
+    async def _run_sessions(self, users, session, prompts, token_counts, max_new_tokens, sessions,
+                            record, stop, rng):
+        """
+        Chat sessions: every user holds conversations of sessions["turns"]
+        turns, one after another, until it has sent max_requests requests.
+        Each turn resends the history with the previous reply appended, after
+        sessions["think_time"] seconds. When the history exceeds
+        sessions["max_context_tokens"], the oldest turns are dropped.
+        """
+        turns = int(sessions.get("turns", 3))
+        think_time = float(sessions.get("think_time", 0))
+        max_context_tokens = sessions.get("max_context_tokens")
+        if turns < 1:
+            raise ValueError(f"Sessions need at least one turn, got {turns}")
+        session_numbers = itertools.count(1)
+
+        async def converse(user_rng):
+            sent = 0
+            while sent < self.max_requests and not stop.is_set():
+                session_number = next(session_numbers)
+                # (message, token count); counts come from the token index and the server's output counts
+                history = []
+                for turn in range(1, turns + 1):
+                    if sent >= self.max_requests or stop.is_set():
+                        break
+                    if turn > 1 and think_time:
+                        await asyncio.sleep(think_time)
+                    prompt_index = user_rng.randrange(len(prompts))
+                    history.append(({"role": "user", "content": prompts[prompt_index]}, int(token_counts[prompt_index])))
+                    history = truncate_history(history, max_context_tokens)
+                    response = await self._send_request(session, None, sum(tokens for _, tokens in history),
+                                                        max_new_tokens, messages=[m for m, _ in history])
+                    sent += 1
+                    row, _, text = response
+                    row.update(session=session_number, turn=turn)
+                    record(sent, response)
+                    if row['error']:
+                        # Without the reply the conversation cannot go on; start a new one
+                        break
+                    history.append(({"role": "assistant", "content": text}, int(row['output_tokens'])))
+
+        await asyncio.gather(*(converse(random.Random(rng.random())) for _ in range(users)))
+
+    async def _run_arrivals(self, users, request_rate, arrival, draw, send, record, stop, rng):
+        """Open loop: requests are sent at their scheduled times, at most `users` in flight."""
+        offsets = arrival_offsets(users * self.max_requests, request_rate, arrival, rng)
+        # Drawn up front so the n-th request gets the same prompt however sends interleave
+        requests = [draw(rng) for _ in offsets]
+        send_offsets, send_lags = await self._send_on_schedule(
+            offsets, lambda k: send(requests[k]), record, stop, users)
+
+        if len(send_offsets) > 1:
+            achieved = (len(send_offsets) - 1) / (max(send_offsets) - min(send_offsets))
+            logging.info(f"Offered {request_rate:.2f} req/s, achieved {achieved:.2f} req/s, "
+                         f"max send lag {max(send_lags) * 1000:.1f} ms")
+
+    async def _send_on_schedule(self, offsets, send, record, stop, max_in_flight=None):
+        """
+        Call send(k) at offsets[k] seconds from now, with at most max_in_flight
+        requests outstanding (unlimited when None or 0). Returns the actual send
+        offsets and the send lags.
+        """
+        in_flight = asyncio.Semaphore(max_in_flight or max(len(offsets), 1))
+        cell_start = time.perf_counter()
+        send_offsets = []
+        send_lags = []
+
+        async def fire(k, offset):
+            delay = cell_start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with in_flight:
+                if stop.is_set():
+                    return
+                sent_at = time.perf_counter() - cell_start
+                lag = sent_at - offset
+                send_offsets.append(sent_at)
+                send_lags.append(lag)
+                response = await send(k)
+            response[0].update({'start_offset(s)': f"{sent_at:.6f}",
+                                'send_lag(ms)': f"{lag * 1000:.3f}"})
+            record(k + 1, response)
+
+        await asyncio.gather(*(fire(k, offset) for k, offset in enumerate(offsets)))
+        return send_offsets, send_lags
+
+    async def _send_request(self, session, prompt, input_tokens, max_new_tokens,
+                            messages: List[dict] = None) -> Tuple[dict, array, str]:
+        """
+        Send one prompt (or a conversation); returns (row, ITL gaps, generated text).
+        A failed request still returns its row, with the error class in 'error'
+        and whatever TTFT and output tokens arrived before the stream was cut off.
+        The row's connection phases come from the session's trace hooks.
+        """
+        if messages is not None:
+            payload = self.adapter.build_chat_payload(messages, max_new_tokens, self.model_name)
+        else:
+            payload = self.adapter.build_payload(prompt, max_new_tokens, self.model_name)
+
+        start_epoch = time.time()
+        start_time = time.perf_counter()
+        collector = StreamCollector(self.adapter, start_time)
+        status, error, timed_out = '', '', False
+        stamps, headers, http_version = {}, None, ''
+        try:
+            async with session.post(self.api_url, json=payload, trace_request_ctx=stamps) as response:
+                headers = time.perf_counter() - start_time
+                status = response.status
+                http_version = f"{response.version.major}.{response.version.minor}"
+                response.raise_for_status()
+                async for line in response.content:
+                    if collector.feed(line):
+                        break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Error making request: {type(e).__name__} {e}")
+            error, timed_out = type(e).__name__, isinstance(e, asyncio.TimeoutError)
+        collector.log_parse_errors()
+
+        end_time = time.perf_counter()
+        ttft = collector.ttft
+        if ttft is None and not error:
+            logging.error("Stream ended without returning any generated text")
+            error = EMPTY_STREAM
+
+        output_tokens, source = collector.output_tokens() if ttft is not None else (0, '')
+        if output_tokens is None:
+            output_tokens = await asyncio.wrap_future(self.token_counter.submit(collector.text))
+        latency = end_time - start_time
+        itl_gaps = inter_token_gaps(collector.token_times)
+
+        row = {
+            'start_time': datetime.fromtimestamp(start_epoch).strftime('%H:%M:%S.%f'),
+            'end_time': datetime.fromtimestamp(start_epoch + latency).strftime('%H:%M:%S.%f'),
+            'start_epoch': f"{start_epoch:.6f}",
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'latency(ms)': f"{latency * 1000:.3f}",
+            'throughput(tokens/second)': '',
+            'latency_per_token(ms/token)': '',
+            'TTFT(ms)': f"{ttft * 1000:.3f}" if ttft is not None else '',
+            **itl_summary(itl_gaps),
+            'output_tokens_source': source,
+            'stopped_short': '',
+            'http_status': status,
+            'error': error,
+            'timed_out': int(timed_out),
+            **phase_fields(NEW if "connected" in stamps else REUSED if "reused" in stamps else '',
+                           queue=stamps["dequeued"] - stamps["queued"] if "dequeued" in stamps else None,
+                           connect=stamps["connected"] - stamps["connecting"] if "connected" in stamps else None,
+                           headers=headers, first_chunk=collector.first_chunk, http_version=http_version),
+        }
+        if not error:
+            throughput = (output_tokens - 1) / (latency - ttft) if output_tokens > 1 else 0
+            latency_per_token = (latency - ttft) * 1000 / (output_tokens - 1) if output_tokens > 1 else ttft * 1000
+            row.update({
+                'throughput(tokens/second)': f"{throughput:.3f}",
+                'latency_per_token(ms/token)': f"{latency_per_token:.3f}",
+                'stopped_short': int(output_tokens < max_new_tokens),
+            })
+        return row, itl_gaps, collector.text
@@ -3,6 +3,9 @@ import json
 from pathlib import Path
 from echoswift.llm_inference_benchmark import EchoSwift
 from echoswift.dataset import download_dataset_files
+from echoswift.synthetic import LENGTH_DISTRIBUTIONS, generate_synthetic_datasets
+from echoswift.token_index import DEFAULT_TOKENIZER, DEFAULT_REVISION, build_dataset_token_indexes, load_tokenizer
+from echoswift.utils.avg_locust_results import FAILURE_COLUMNS, GOODPUT_COLUMNS
 from echoswift.utils.plot_results import plot_benchmark_results 
 import logging
 from tabulate import tabulate
@@ -25,14 +28,15 @@ def cli():
     Usage:
     1. Run 'echoswift dataprep' to download the dataset and create config.json
     2. Run 'echoswift start --config path/to/config.json' to start the benchmark
-    3. Run 'echoswift plot --results-dir path/to/benchmark_results' to generate plots
+    3. Run 'echoswift plot --results-dir path/to/benchmark_results' to generate plots,
+       or 'echoswift report --results-dir path/to/benchmark_results' for an HTML report
 
     For more detailed information, visit: \n
     https://github.com/Infobellit-Solutions-Pvt-Ltd/EchoSwift
     """
     pass
 
-def create_config(output='config.json'):
+def create_config(output='config.json', tokenizer=None, input_tokens=None):
     config = {
         "_comment": "EchoSwift Configuration",
         "out_dir": "test_results",
@@ -41,8 +45,9 @@ def create_config(output='config.json'):
         "model": "meta-llama/Meta-Llama-3-8B",
         "max_requests": 5,
         "user_counts": [3],
-        "input_tokens": [32],
-        "output_tokens": [256]
+        "input_tokens": list(input_tokens) if input_tokens else [32],
+        "output_tokens": [256],
+        "tokenizer": tokenizer or DEFAULT_TOKENIZER
     }
 
     output_path = Path(output)
@@ -55,18 +60,106 @@ def create_config(output='config.json'):
     click.echo(f"Configuration file created: {output_path}")
     click.echo("Please review and modify this file before running the benchmark.")
 
+def require_dataset():
+    dataset_dir = Path("Input_Dataset")
+    if not dataset_dir.exists() or not any(dataset_dir.iterdir()):
+        error_msg = "Filtered dataset not found. Please run 'echoswift dataprep' before starting the benchmark."
+        logging.error(error_msg)
+        click.echo(error_msg, err=True)
+        raise click.Abort()
+
+    logging.info("Using Filtered_ShareGPT_Dataset for the benchmark.")
+    return dataset_dir
+
+def benchmark_settings(cfg, dataset_dir):
+    """EchoSwift keyword arguments shared by every target"""
+    return dict(
+        max_requests=cfg['max_requests'],
+        user_counts=cfg['user_counts'],
+        input_tokens=cfg['input_tokens'],
+        output_tokens=cfg['output_tokens'],
+        dataset_dir=str(dataset_dir),
+        engine=cfg.get('engine', 'locust'),
+        tokenizer=cfg.get('tokenizer', DEFAULT_TOKENIZER),
+        tokenizer_revision=cfg.get('tokenizer_revision', DEFAULT_REVISION),
+        dump_itl=cfg.get('dump_itl', False),
+        result_format=cfg.get('result_format', 'csv'),
+        load_mode=cfg.get('load_mode', 'closed'),
+        request_rates=cfg.get('request_rates'),
+        arrival=cfg.get('arrival', 'poisson'),
+        workers=cfg.get('workers'),
+        metrics_port=cfg.get('metrics_port'),
+        log_generated_text=cfg.get('log_generated_text', False),
+        server_metrics=cfg.get('server_metrics'),
+        sessions=cfg.get('sessions'),
+        lengths=cfg.get('lengths'),
+        slo=cfg.get('slo'),
+        timeouts=cfg.get('timeouts'),
+        connections=cfg.get('connections')
+    )
+
+def benchmark_from_config(cfg, dataset_dir):
+    """Create an EchoSwift benchmark (or one per entry of "targets") from a loaded config.json"""
+    if cfg.get('targets'):
+        from echoswift.multi_target import MultiTargetBenchmark
+        return MultiTargetBenchmark.from_targets(cfg['out_dir'], cfg['targets'], seed=cfg.get('seed'),
+                                                 **benchmark_settings(cfg, dataset_dir))
+    return EchoSwift(
+        output_dir=cfg['out_dir'],
+        api_url=cfg['base_url'],
+        inference_server=cfg['inference_server'],
+        model_name=cfg.get('model'),
+        seed=cfg.get('seed'),
+        **benchmark_settings(cfg, dataset_dir)
+    )
+
 @cli.command()
 @click.option('--config', default='config.json', help='Name of the output configuration file')
-def dataprep(config):
-    """Download the filtered ShareGPT dataset and create the config.json file"""
-    # Download dataset
-    click.echo("Downloading the filtered ShareGPT dataset...")
-    download_dataset_files("sarthakdwi/EchoSwift-8k")
-    
+@click.option('--tokenizer', default=None, help='HuggingFace tokenizer used to pre-compute prompt token counts')
+@click.option('--tokenizer-revision', default=DEFAULT_REVISION, show_default=True, help='Tokenizer revision (branch, tag or commit)')
+@click.option('--store-token-ids', is_flag=True, help='Also store the prompt token ids in the index')
+@click.option('--synthetic', is_flag=True, help='Generate synthetic prompts offline instead of downloading ShareGPT')
+@click.option('--input-tokens', 'synthetic_input_tokens', multiple=True, type=int,
+              help='Synthetic: prompt length in tokens, one dataset per value (repeatable)  [default: 32]')
+@click.option('--num-prompts', default=1000, show_default=True, help='Synthetic: prompts per dataset')
+@click.option('--prefix-ratio', default=0.0, show_default=True, help='Synthetic: share of each prompt that is a shared prefix')
+@click.option('--prefix-pool', default=1, show_default=True, help='Synthetic: number of distinct shared prefixes')
+@click.option('--length-dist', type=click.Choice(LENGTH_DISTRIBUTIONS), default='fixed', show_default=True,
+              help='Synthetic: distribution of prompt lengths around each --input-tokens value')
+@click.option('--length-spread', default=0.1, show_default=True, help='Synthetic: relative spread of prompt lengths')
+@click.option('--seed', default=0, show_default=True, help='Synthetic: random seed')
+def dataprep(config, tokenizer, tokenizer_revision, store_token_ids, synthetic, synthetic_input_tokens, num_prompts,
+             prefix_ratio, prefix_pool, length_dist, length_spread, seed):
+    """Download the filtered ShareGPT dataset (or generate a synthetic one) and create the config.json file"""
+    if synthetic:
+        # Synthetic prompts are sized with the benchmark tokenizer, so it is always needed
+        tokenizer = tokenizer or DEFAULT_TOKENIZER
+        synthetic_input_tokens = synthetic_input_tokens or (32,)
+        click.echo(f"Generating synthetic prompts with {tokenizer}...")
+        try:
+            generate_synthetic_datasets(load_tokenizer(tokenizer, tokenizer_revision), synthetic_input_tokens,
+                                        Path("Input_Dataset"), num_prompts=num_prompts, prefix_ratio=prefix_ratio,
+                                        prefix_pool_size=prefix_pool, length_distribution=length_dist,
+                                        length_spread=length_spread, seed=seed)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    else:
+        # Download dataset
+        click.echo("Downloading the filtered ShareGPT dataset...")
+        download_dataset_files("sarthakdwi/EchoSwift-8k")
+
+    # Pre-tokenize prompts; without --tokenizer the index is built on the first run
+    if tokenizer:
+        click.echo(f"\nBuilding prompt token index with {tokenizer}...")
+        count = build_dataset_token_indexes(Path("Input_Dataset"), tokenizer, tokenizer_revision, store_token_ids)
+        click.echo(f"Indexed {count} dataset files.")
 
     # Create config
     click.echo("\nCreating configuration file...")
-    create_config(config)
+    if synthetic:
+        create_config(config, tokenizer=tokenizer, input_tokens=synthetic_input_tokens)
+    else:
+        create_config(config, tokenizer=tokenizer)
     
     click.echo("Data preparation completed. You're now ready to run the benchmark.")
 
@@ -77,49 +170,45 @@ def start(config):
     config_path = Path(config)
     cfg = load_config(config_path)
     
-    dataset_dir = Path("Input_Dataset")
-    if not dataset_dir.exists() or not any(dataset_dir.iterdir()):
-        error_msg = "Filtered dataset not found. Please run 'echoswift dataprep' before starting the benchmark."
-        logging.error(error_msg)
-        click.echo(error_msg, err=True)
-        raise click.Abort()
-
-    logging.info("Using Filtered_ShareGPT_Dataset for the benchmark.")
+    dataset_dir = require_dataset()
     
     try:
-        benchmark = EchoSwift(
-            output_dir=cfg['out_dir'],
-            api_url=cfg['base_url'],
-            inference_server=cfg['inference_server'],
-            model_name=cfg.get('model'),
-            max_requests=cfg['max_requests'],
-            user_counts=cfg['user_counts'],
-            input_tokens=cfg['input_tokens'],
-            output_tokens=cfg['output_tokens'],
-            dataset_dir=str(dataset_dir)
-        )
+        benchmark = benchmark_from_config(cfg, dataset_dir)
         
-        benchmark.run_benchmark()
+        comparison = benchmark.run_benchmark()
+
+        if cfg.get('targets'):
+            if comparison is not None and not comparison.empty:
+                columns = [c for c in ['users', 'input tokens', 'output tokens', 'request rate', 'target',
+                                       'throughput(tokens/second)', 'latency(ms)', 'TTFT(ms)',
+                                       'latency_per_token(ms/token)'] + FAILURE_COLUMNS + GOODPUT_COLUMNS
+                           if c in comparison.columns]
+                click.echo(tabulate(comparison[columns].round(3), headers='keys', tablefmt='pretty', showindex=False))
+                click.echo(f"Comparison written to {Path(cfg['out_dir']) / 'comparison.csv'}")
+                click.echo("Tests completed successfully !!")
+            return
         
-        # Pretty print results after each user count completes
+        # Pretty print the averaged results of every cell the sweep ran
         all_results = []
-        for u in cfg['user_counts']:
-            user_dir = Path(cfg['out_dir']) / f"{u}_User"
-            for input_token in cfg['input_tokens']:
-                avg_file = user_dir / f"avg_{input_token}_input_tokens.csv"
-                if avg_file.exists():
-                    df = pd.read_csv(avg_file)
-                    df['Users'] = u
-                    df['Input Tokens'] = input_token
-                    all_results.append(df)
+        for u, input_token, _ in benchmark.sweep():
+            avg_file = Path(cfg['out_dir']) / f"{u}_User" / f"avg_{benchmark.result_name(input_token)}.csv"
+            if avg_file.exists():
+                df = pd.read_csv(avg_file)
+                df['Users'] = u
+                df['Input Tokens'] = input_token
+                all_results.append(df)
 
         if all_results:
             combined_df = pd.concat(all_results, ignore_index=True)
-            combined_df = combined_df[['Users', 'Input Tokens', 'output tokens', 'throughput(tokens/second)', 'latency(ms)', 'TTFT(ms)', 'latency_per_token(ms/token)']]
+            # Mixed-length cells have no single output token count
+            shape = ['Users', 'Input Tokens'] + [c for c in ['output tokens'] if c in combined_df.columns]
+            open_loop = [c for c in ['request rate', 'achieved rate(requests/second)'] if c in combined_df.columns]
+            outcomes = [c for c in FAILURE_COLUMNS + GOODPUT_COLUMNS if c in combined_df.columns]
+            combined_df = combined_df[shape + open_loop + ['throughput(tokens/second)', 'latency(ms)', 'TTFT(ms)', 'latency_per_token(ms/token)'] + outcomes]
             combined_df = combined_df.round(3)
             
             # Sort the DataFrame
-            combined_df = combined_df.sort_values(['Users', 'Input Tokens', 'output tokens'])
+            combined_df = combined_df.sort_values(shape + open_loop[:1])
 
             click.echo(tabulate(combined_df, headers='keys', tablefmt='pretty', showindex=False))
 
@@ -131,19 +220,181 @@ def start(config):
         click.echo(error_msg, err=True)
         raise click.Abort()
 
+def with_slo_overrides(slos, overrides):
+    """A copy of slos with the NAME=VALUE --slo options applied"""
+    slos = dict(slos)
+    for override in overrides:
+        name, sep, value = override.partition('=')
+        if not sep:
+            raise click.BadParameter(f"Expected NAME=VALUE, got '{override}'", param_hint='--slo')
+        slos[name] = float(value)
+    return slos
+
+@cli.command()
+@click.option('--config', required=True, type=click.Path(exists=True), help='Path to the configuration file')
+@click.option('--slo', 'slo_overrides', multiple=True, help='SLO as NAME=MS, e.g. ttft_p99=500 (repeatable, overrides the config)')
+@click.option('--input-tokens', type=int, default=None, help='Input token count to search (default: search section, else first input_tokens)')
+@click.option('--output-tokens', type=int, default=None, help='Output token count to search (default: search section, else first output_tokens)')
+def search(config, slo_overrides, input_tokens, output_tokens):
+    """Find the highest load that meets the SLOs in the config's search section"""
+    cfg = load_config(Path(config))
+    search_cfg = cfg.get('search', {})
+    slos = with_slo_overrides(search_cfg.get('slo', {}), slo_overrides)
+
+    dataset_dir = require_dataset()
+    try:
+        from echoswift.search import SaturationSearch
+        if cfg.get('targets'):
+            raise ValueError("The search runs against a single endpoint; remove \"targets\" from the config")
+        benchmark = benchmark_from_config(cfg, dataset_dir)
+        saturation = SaturationSearch(
+            benchmark, slos,
+            input_tokens=input_tokens or search_cfg.get('input_tokens', cfg['input_tokens'][0]),
+            output_tokens=output_tokens or search_cfg.get('output_tokens', cfg['output_tokens'][0]),
+            start=search_cfg.get('start', 1),
+            max_load=search_cfg.get('max', 1024),
+            early_abort=search_cfg.get('early_abort', True),
+            max_error_rate=search_cfg.get('max_error_rate', 0.01)
+        )
+        best = saturation.run()
+    except Exception as e:
+        error_msg = f"An error occurred while running the search: {str(e)}"
+        logging.error(error_msg)
+        click.echo(error_msg, err=True)
+        raise click.Abort()
+
+    click.echo(tabulate(pd.DataFrame(saturation.probes).round(3), headers='keys', tablefmt='pretty', showindex=False))
+    dimension = "request rate" if saturation.open_loop else "users"
+    if best is None:
+        click.echo(f"No probed {dimension} met the SLOs.")
+    else:
+        click.echo(f"Highest {dimension} meeting the SLOs: {best:g}")
+
+@cli.command()
+@click.option('--config', required=True, type=click.Path(exists=True), help='Path to the configuration file')
+@click.option('--trace', 'trace_file', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='JSONL trace with timestamp, input_tokens and output_tokens per request')
+@click.option('--speed', default=1.0, show_default=True, type=float, help='Time scaling: 2 replays twice as fast')
+@click.option('--prompts', type=click.Choice(['dataset', 'synthetic']), default='dataset', show_default=True,
+              help='Prompts for trace entries without one: closest-length dataset prompt, or synthesized')
+@click.option('--max-in-flight', default=0, show_default=True, type=int, help='Cap on outstanding requests (0 = unlimited)')
+@click.option('--seed', default=0, show_default=True, type=int, help='Seed for prompt selection')
+def replay(config, trace_file, speed, prompts, max_in_flight, seed):
+    """Replay a recorded request trace at its original timing"""
+    cfg = load_config(Path(config))
+    dataset_dir = Path("Input_Dataset") if prompts == 'synthetic' else require_dataset()
+    try:
+        from echoswift.replay import TraceReplay
+        if cfg.get('targets'):
+            raise ValueError("Replay runs against a single endpoint; remove \"targets\" from the config")
+        benchmark = benchmark_from_config({**cfg, 'engine': 'async'}, dataset_dir)
+        trace_replay = TraceReplay(benchmark, trace_file, speed=speed, prompts=prompts,
+                                   max_in_flight=max_in_flight, seed=seed)
+        summary = trace_replay.run()
+    except Exception as e:
+        error_msg = f"An error occurred while replaying the trace: {str(e)}"
+        logging.error(error_msg)
+        click.echo(error_msg, err=True)
+        raise click.Abort()
+
+    if summary.empty:
+        click.echo("No replayed request succeeded.")
+        return
+    columns = [c for c in ['requests', 'throughput(tokens/second)', 'latency(ms)', 'TTFT(ms)', 'TTFT(ms)_p99',
+                           'achieved rate(requests/second)', 'send_lag(ms)_p99', 'error rate'] if c in summary.columns]
+    click.echo(tabulate(summary[columns].round(3), headers='keys', tablefmt='pretty', showindex=False))
+    click.echo(f"Results written to {trace_replay.output_dir}")
+
 @cli.command()
 @click.option('--results-dir', required=True, type=click.Path(exists=True), help='Directory containing benchmark results')
-def plot(results_dir):
+@click.option('--config', default=None, type=click.Path(exists=True), help='Configuration file whose "slo" section sets the SLOs for goodput')
+@click.option('--slo', 'slo_overrides', multiple=True, help='Per-request SLO as NAME=MS, e.g. ttft=500 (repeatable, overrides the config)')
+def plot(results_dir, config, slo_overrides):
     """Plot graphs using benchmark results"""
     results_path = Path(results_dir)
     if not results_path.is_dir():
         raise click.BadParameter("The specified results directory is not a directory.")
+    slos = with_slo_overrides(load_config(Path(config)).get('slo', {}) if config else {}, slo_overrides)
     
     try:
-        plot_benchmark_results(results_path)
+        plot_benchmark_results(results_path, slo=slos or None)
         click.echo(f"Plots have been generated and saved in {results_path}")
     except Exception as e:
         click.echo(f"An error occurred while plotting results: {e}", err=True)
 
+@cli.command()
+@click.option('--results-dir', required=True, type=click.Path(exists=True, file_okay=False), help='Directory containing benchmark results')
+@click.option('--output', default=None, type=click.Path(dir_okay=False), help='Report file (default: report.html in the results directory)')
+def report(results_dir, output):
+    """Write a self-contained HTML report with per-request latency distributions"""
+    from echoswift.report import render_report
+
+    try:
+        report_file = render_report(Path(results_dir), output)
+    except (OSError, ValueError) as e:
+        click.echo(f"An error occurred while writing the report: {e}", err=True)
+        raise click.Abort()
+    click.echo(f"Report written to {report_file}")
+
+@cli.command()
+@click.argument('baseline_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('candidate_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--threshold', 'threshold_overrides', multiple=True,
+              help='Largest tolerated change as METRIC=PERCENT, e.g. ttft=5 (repeatable; default ttft, throughput and latency at 5)')
+@click.option('--statistic', type=click.Choice(['mean', 'p50', 'p90', 'p95', 'p99']), default='mean', show_default=True,
+              help='Per-cell statistic to compare')
+@click.option('--confidence', default=0.95, show_default=True, type=float, help='Confidence level of the bootstrap intervals')
+@click.option('--resamples', default=2000, show_default=True, type=int, help='Bootstrap resamples per cell and metric')
+@click.option('--seed', default=0, show_default=True, type=int, help='Seed for the bootstrap')
+@click.option('--output', default=None, type=click.Path(dir_okay=False), help='Also write the comparison to this CSV file')
+def compare(baseline_dir, candidate_dir, threshold_overrides, statistic, confidence, resamples, seed, output):
+    """Compare two runs cell by cell; exits with 3 if the candidate regressed"""
+    from echoswift.compare import REGRESSION, REGRESSION_EXIT_CODE, compare_runs
+
+    thresholds = None
+    if threshold_overrides:
+        thresholds = {}
+        for override in threshold_overrides:
+            name, sep, value = override.partition('=')
+            if not sep:
+                raise click.BadParameter(f"Expected METRIC=PERCENT, got '{override}'", param_hint='--threshold')
+            thresholds[name] = float(value)
+
+    try:
+        comparison = compare_runs(baseline_dir, candidate_dir, thresholds, statistic, confidence, resamples, seed)
+    except (OSError, ValueError) as e:
+        click.echo(f"An error occurred while comparing runs: {e}", err=True)
+        raise click.Abort()
+
+    if output:
+        comparison.to_csv(output, index=False, float_format='%.3f')
+    click.echo(tabulate(comparison.round(3), headers='keys', tablefmt='pretty', showindex=False))
+    regressions = comparison[comparison['status'] == REGRESSION]
+    if not regressions.empty:
+        click.echo(f"{len(regressions)} significant regression(s) in {len(comparison)} comparisons.", err=True)
+        raise SystemExit(REGRESSION_EXIT_CODE)
+    click.echo(f"No significant regressions in {len(comparison)} comparisons.")
+
+@cli.command('mock-server')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Interface to listen on')
+@click.option('--port', default=8000, show_default=True, type=int, help='Port to listen on')
+@click.option('--ttft-ms', default=50.0, show_default=True, type=float, help='Time to first token in milliseconds')
+@click.option('--tokens-per-second', default=50.0, show_default=True, type=float, help='Per-request token rate after the first token')
+@click.option('--jitter-ms', default=0.0, show_default=True, type=float, help='Standard deviation of Gaussian jitter added to every delay')
+@click.option('--max-concurrency', default=0, show_default=True, type=int, help='Requests served at once; further requests queue (0 = unlimited)')
+@click.option('--seed', default=None, type=int, help='Seed for the jitter and injected faults')
+@click.option('--error-rate', default=0.0, show_default=True, type=float, help='Share of requests rejected with HTTP 503')
+@click.option('--stall-rate', default=0.0, show_default=True, type=float, help='Share of streams that stall halfway')
+@click.option('--stall-ms', default=0.0, show_default=True, type=float, help='How long a stalled stream pauses, in milliseconds')
+def mock_server(host, port, ttft_ms, tokens_per_second, jitter_ms, max_concurrency, seed, error_rate, stall_rate,
+                stall_ms):
+    """Serve mock streaming endpoints for every supported inference server"""
+    from echoswift.mock_server import run_mock_server
+    click.echo(f"Mock inference server: TTFT {ttft_ms} ms, {tokens_per_second} tokens/s, jitter {jitter_ms} ms, "
+               f"max concurrency {max_concurrency or 'unlimited'}")
+    run_mock_server(host, port, ttft_ms=ttft_ms, tokens_per_second=tokens_per_second, jitter_ms=jitter_ms,
+                    max_concurrency=max_concurrency, seed=seed, error_rate=error_rate, stall_rate=stall_rate,
+                    stall_ms=stall_ms)
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+Regression check between two benchmark runs.
+
+Cells (target, users, input tokens, output tokens, request rate) are matched
+between a baseline and a candidate results directory. For every matched cell
+and metric, the relative change of a statistic (the mean by default) is
+estimated from the per-request rows, with a percentile bootstrap confidence
+interval: both runs' requests are resampled independently and the change is
+recomputed for every resample.
+
+A change is a regression when the whole interval lies on the worse side of
+zero (it is statistically significant) and the point estimate is worse than
+the metric's threshold, in percent. Improvements are flagged the same way.
+Everything else is reported as no change, however large the estimate, so
+noisy cells with few requests never fail the check on their own.
+"""
+import logging
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from echoswift.store import FACETS, load_run, with_cell_labels
+from echoswift.utils.avg_locust_results import METRIC_ALIASES, failed_requests
+
+COMPARE_ALIASES = {**METRIC_ALIASES, "throughput": "throughput(tokens/second)"}
+HIGHER_IS_BETTER = {"throughput(tokens/second)"}
+DEFAULT_THRESHOLDS = {"ttft": 5.0, "throughput": 5.0, "latency": 5.0}
+STATISTICS = ("mean", "p50", "p90", "p95", "p99")
+REGRESSION, IMPROVEMENT, NO_CHANGE = "regression", "improvement", "no change"
+# Exit status of the compare command when the candidate regressed; 1 is an error, 2 a usage error
+REGRESSION_EXIT_CODE = 3
+
+# Resampled values held in memory at once, per bootstrap chunk
+_CHUNK_VALUES = 5_000_000
+
+
+def _statistic(samples: np.ndarray, statistic: str) -> np.ndarray:
+    """The statistic of every row of samples."""
+    if statistic == "mean":
+        return samples.mean(axis=-1)
+    return np.quantile(samples, int(statistic[1:]) / 100, axis=-1)
+
+
+def bootstrap(values: np.ndarray, statistic: str, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """The statistic of `resamples` bootstrap resamples of values."""
+    n = len(values)
+    chunk = max(1, _CHUNK_VALUES // n)
+    results = []
+    for start in range(0, resamples, chunk):
+        size = min(chunk, resamples - start)
+        results.append(_statistic(values[rng.integers(0, n, (size, n))], statistic))
+    return np.concatenate(results)
+
+
+def relative_change(baseline: np.ndarray, candidate: np.ndarray, statistic: str = "mean",
+                    confidence: float = 0.95, resamples: int = 2000, rng: np.random.Generator = None):
+    """Relative change of the statistic from baseline to candidate, in percent, with its bootstrap interval."""
+    rng = rng or np.random.default_rng()
+    base = _statistic(baseline, statistic)
+    estimate = (_statistic(candidate, statistic) / base - 1) * 100
+    changes = (bootstrap(candidate, statistic, resamples, rng) /
+               bootstrap(baseline, statistic, resamples, rng) - 1) * 100
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(changes, [alpha, 1 - alpha])
+    return float(estimate), float(low), float(high)
+
+
+def parse_thresholds(thresholds: Dict[str, float]) -> Dict[str, float]:
+    """Map metric names or aliases (ttft, tpot, latency, throughput) to result columns."""
+    columns = {}
+    for name, percent in thresholds.items():
+        column = COMPARE_ALIASES.get(name.lower(), name)
+        if column not in COMPARE_ALIASES.values():
+            raise ValueError(f"Unknown metric '{name}'. Expected one of: "
+                             f"{', '.join(list(COMPARE_ALIASES) + list(COMPARE_ALIASES.values()))}")
+        if percent < 0:
+            raise ValueError(f"Threshold for '{name}' must not be negative, got {percent}")
+        columns[column] = float(percent)
+    return columns
+
+
+def _cells(requests: pd.DataFrame) -> pd.DataFrame:
+    # Only successful requests have the compared metrics
+    requests = with_cell_labels(requests[~failed_requests(requests)])
+    requests['request_rate'] = requests['request_rate'].fillna(-1) if 'request_rate' in requests else -1
+    if 'target' not in requests.columns:
+        requests['target'] = ""
+    return requests
+
+
+def compare_runs(baseline_dir, candidate_dir, thresholds: Dict[str, float] = None, statistic: str = "mean",
+                 confidence: float = 0.95, resamples: int = 2000, seed: int = 0) -> pd.DataFrame:
+    """One row per matched cell and metric, with the change, its interval and a status."""
+    if statistic not in STATISTICS:
+        raise ValueError(f"Unknown statistic '{statistic}'. Expected one of: {', '.join(STATISTICS)}")
+    if not 0 < confidence < 1:
+        raise ValueError(f"Confidence must be between 0 and 1, got {confidence}")
+    thresholds = parse_thresholds(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+    rng = np.random.default_rng(seed)
+
+    keys = ['target', 'users'] + FACETS + ['request_rate']
+    baseline = {cell: rows for cell, rows in _cells(load_run(baseline_dir)).groupby(keys, sort=True)}
+    candidate = {cell: rows for cell, rows in _cells(load_run(candidate_dir)).groupby(keys, sort=True)}
+    matched = [cell for cell in baseline if cell in candidate]
+    unmatched = len(set(baseline) ^ set(candidate))
+    if unmatched:
+        logging.warning(f"{unmatched} cells are only in one of the runs and are not compared")
+    if not matched:
+        raise ValueError(f"No cells in common between {baseline_dir} and {candidate_dir}")
+
+    rows: List[dict] = []
+    for cell in matched:
+        for column, threshold in thresholds.items():
+            if column not in baseline[cell].columns or column not in candidate[cell].columns:
+                continue
+            a = baseline[cell][column].dropna().to_numpy(dtype=float)
+            b = candidate[cell][column].dropna().to_numpy(dtype=float)
+            if not len(a) or not len(b):
+                continue
+            estimate, low, high = relative_change(a, b, statistic, confidence, resamples, rng)
+            # Express every change so that positive is worse
+            sign = -1 if column in HIGHER_IS_BETTER else 1
+            worse_low, worse_high = sorted((sign * low, sign * high))
+            if worse_low > 0 and sign * estimate > threshold:
+                status = REGRESSION
+            elif worse_high < 0 and -sign * estimate > threshold:
+                status = IMPROVEMENT
+            else:
+                status = NO_CHANGE
+            rows.append({**dict(zip(keys, cell)), 'metric': column, 'baseline requests': len(a),
+                         'candidate requests': len(b), f'baseline {statistic}': _statistic(a, statistic),
+                         f'candidate {statistic}': _statistic(b, statistic), 'change(%)': estimate,
+                         'ci low(%)': low, 'ci high(%)': high, 'threshold(%)': threshold, 'status': status})
+
+    if not rows:
+        raise ValueError(f"No common cells between {baseline_dir} and {candidate_dir} have values for "
+                         f"{', '.join(thresholds)} in both runs")
+    comparison = pd.DataFrame(rows)
+    comparison['request_rate'] = comparison['request_rate'].where(comparison['request_rate'] != -1)
+    comparison = comparison.rename(columns={'request_rate': 'request rate'})
+    for column in ('target', 'request rate'):
+        if comparison[column].isna().all() or comparison[column].eq("").all():
+            comparison = comparison.drop(columns=[column])
+    return comparison
@@ -0,0 +1,137 @@
+"""
+Connection settings and per-request connection timing.
+
+TTFT alone lumps together connection set-up, the request upload, server
+queueing and prefill. Both engines therefore record the connection phases
+of every request (see ``CONNECTION_FIELDNAMES`` in ``result_sink``): whether
+it opened a new connection or reused a pooled one, how long it waited for a
+pooled connection, the connect time (DNS, TCP and TLS) and, where the client
+exposes it, the TLS handshake on its own, then the time to the response
+headers and to the first chunk of the stream, both from the request start
+like TTFT. A TTFT well above the time to headers is the model; a time to
+headers well above the connect time is the server queue and prefill.
+
+The async engine reads the phases from aiohttp's request tracing. For the
+Locust engine, whose requests/urllib3 client has no tracing, users mount a
+``TimedHTTPAdapter`` whose connections time their own set-up.
+
+Neither client speaks HTTP/2, so every request goes over HTTP/1.x; the
+negotiated version is recorded per request.
+"""
+import time
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+NEW, REUSED = "new", "reused"
+
+# keep_alive: reuse connections between requests; pool_size: connections per user, None for the client default
+DEFAULT_CONNECTIONS = {"keep_alive": True, "pool_size": None, "http2": False}
+
+
+def connection_settings(connections: dict = None) -> dict:
+    """Keep-alive and pool size, with DEFAULT_CONNECTIONS for the ones not given."""
+    connections = connections or {}
+    unknown = set(connections) - set(DEFAULT_CONNECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown connection settings {', '.join(sorted(unknown))}. "
+                         f"Expected: {', '.join(DEFAULT_CONNECTIONS)}")
+    settings = {**DEFAULT_CONNECTIONS, **connections}
+    if settings["http2"]:
+        raise ValueError("HTTP/2 is not supported by either engine's HTTP client (requests for locust, "
+                         "aiohttp for async); remove \"http2\"")
+    pool_size = settings["pool_size"]
+    if pool_size is not None and (int(pool_size) != pool_size or pool_size < 1):
+        raise ValueError(f"The connection pool size must be a positive integer or null, got {pool_size}")
+    return {"keep_alive": bool(settings["keep_alive"]),
+            "pool_size": int(pool_size) if pool_size is not None else None,
+            "http2": False}
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return f"{seconds * 1000:.3f}" if seconds is not None else ''
+
+
+def phase_fields(connection: str = '', queue: float = None, connect: float = None, tls: float = None,
+                 headers: float = None, first_chunk: float = None, http_version: str = '') -> dict:
+    """Connection columns of a result row, from durations and offsets in seconds (None if unknown)."""
+    return {
+        'connection': connection,
+        'queue(ms)': _ms(queue),
+        'connect(ms)': _ms(connect),
+        'tls(ms)': _ms(tls),
+        'headers(ms)': _ms(headers),
+        'first_chunk(ms)': _ms(first_chunk),
+        'http_version': http_version,
+    }
+
+
+class _TimedConnection:
+    """Remembers when the connection was opened and how long the TCP connect and the whole set-up took."""
+
+    connected_at = None
+    connect_seconds = None
+    tls_seconds = None
+
+    def connect(self):
+        self.connected_at = time.perf_counter()
+        self._socket_seconds = None
+        super().connect()
+        self.connect_seconds = time.perf_counter() - self.connected_at
+        if isinstance(self, HTTPSConnection) and self._socket_seconds is not None:
+            self.tls_seconds = self.connect_seconds - self._socket_seconds
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        self._socket_seconds = time.perf_counter() - self.connected_at
+        return sock
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """requests adapter whose pooled connections time their own set-up, see connection_phases."""
+
+    def __init__(self, pool_size: int = None, **kwargs):
+        if pool_size:
+            kwargs.update(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool,
+                                                   "https": _TimedHTTPSConnectionPool}
+
+
+def connection_phases(response, start_time: float) -> dict:
+    """
+    phase_fields arguments of a streamed requests response, read as soon as
+    its headers arrive (the connection is released once the body is read):
+    whether the request opened its connection or reused one, the connect and
+    TLS times of a new one, the time to headers and the HTTP version.
+    """
+    headers = time.perf_counter() - start_time
+    connection = getattr(response.raw, "_connection", None)
+    version = getattr(response.raw, "version", None)
+    phases = {"headers": headers, "http_version": f"{version // 10}.{version % 10}" if version else ''}
+    if getattr(connection, "connected_at", None) is None:
+        return phases
+    if connection.connected_at >= start_time:
+        return {**phases, "connection": NEW, "connect": connection.connect_seconds, "tls": connection.tls_seconds}
+    return {**phases, "connection": REUSED}
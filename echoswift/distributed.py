@@ -0,0 +1,226 @@
+"""
+Distributed load generation.
+
+A ``WorkerPool`` starts one ``echoswift.worker`` process per worker, either
+locally or on a remote host over SSH, and keeps them alive for the whole
+benchmark so each worker loads its tokenizer once. For every cell the users
+(and, in open-loop mode, the request rate) are split across the workers;
+their per-request rows stream back over stdout and are merged into the
+usual result file, tagged with the host and worker index that sent them.
+"""
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from echoswift.result_sink import RESULT_FIELDNAMES, ResultSink
+
+LOCAL_HOST = "localhost"
+
+
+def split_users(users: int, workers: int) -> List[int]:
+    """Share of users per worker; the first workers take the remainder."""
+    base, extra = divmod(users, workers)
+    return [base + (1 if i < extra else 0) for i in range(workers)]
+
+
+def worker_hosts(workers) -> List[str]:
+    """
+    Expand the ``workers`` config value into one host per worker process.
+
+    Accepts a number of local processes, "auto" for one local process per
+    CPU core, or a mapping ``{"local": N, "hosts": ["user@host", ...]}``.
+    A host listed twice runs two workers.
+    """
+    if workers == "auto":
+        return [LOCAL_HOST] * (os.cpu_count() or 1)
+    if isinstance(workers, int) and not isinstance(workers, bool):
+        local, hosts = workers, []
+    elif isinstance(workers, dict):
+        local, hosts = workers.get("local", 0), list(workers.get("hosts", []))
+    else:
+        raise ValueError(f"Invalid workers setting: {workers!r}. Expected a number, \"auto\" or "
+                         f"{{\"local\": N, \"hosts\": [...]}}")
+    if local < 0:
+        raise ValueError(f"Number of local workers must not be negative, got {local}")
+    hosts = [LOCAL_HOST] * local + hosts
+    if not hosts:
+        raise ValueError("The workers setting does not start any worker")
+    return hosts
+
+
+class _Worker:
+    def __init__(self, index: int, host: str, command: List[str], log_file):
+        self.index = index
+        self.host = host
+        self.alive = True
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=log_file or None, universal_newlines=True, bufsize=1)
+
+    def send(self, message: dict):
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+
+class WorkerPool:
+    """Drop-in replacement for ``AsyncLoadEngine`` that fans each cell out to worker processes."""
+
+    def __init__(self, hosts: List[str], api_url: str, inference_server: str, model_name: str = None,
+                 max_requests: int = 5, tokenizer_name: str = None, tokenizer_revision: str = None,
+                 result_format: str = "csv", logs_dir: Path = None, python: str = "python3",
+                 ssh_options: List[str] = None, timeouts: dict = None,
+                 connections: dict = None):
+        self.result_format = result_format
+        self._messages = queue.Queue()
+        self._log_files = []
+        self._workers = []
+        self._warned_itl = False
+
+        engine_config = {
+            "api_url": api_url,
+            "inference_server": inference_server,
+            "model_name": model_name,
+            "max_requests": max_requests,
+            "result_format": result_format,
+            "timeouts": timeouts,
+            "connections": connections,
+        }
+        if tokenizer_name:
+            engine_config["tokenizer_name"] = tokenizer_name
+        if tokenizer_revision:
+            engine_config["tokenizer_revision"] = tokenizer_revision
+
+        for index, host in enumerate(hosts):
+            if host == LOCAL_HOST:
+                command = [sys.executable, "-m", "echoswift.worker"]
+            else:
+                command = ["ssh", "-o", "BatchMode=yes", *(ssh_options or []), host, python, "-m", "echoswift.worker"]
+            log_file = None
+            if logs_dir:
+                log_file = open(Path(logs_dir) / f"worker_{index}_{host.replace('@', '_')}.log", 'w')
+                self._log_files.append(log_file)
+            worker = _Worker(index, host, command, log_file)
+            worker.send({"engine": engine_config})
+            threading.Thread(target=self._read, args=(worker,), name=f"Worker({index})", daemon=True).start()
+            self._workers.append(worker)
+        logging.info(f"Started {len(self._workers)} load workers on {len(set(hosts))} host(s)")
+
+    def _read(self, worker: _Worker):
+        for line in worker.process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logging.debug(f"Worker {worker.index} ({worker.host}): {line.rstrip()}")
+                continue
+            self._messages.put((worker, message))
+        self._messages.put((worker, None))
+
+    def run_cell(self, users: int, input_tokens: int, max_new_tokens: int, dataset_file: Path,
+                 output_file: Optional[Path], on_result: Callable[[dict], None] = None, itl_dump_file: Path = None,
+                 request_rate: float = None, arrival: str = "poisson", seed=None,
+                 on_error: Callable[[dict], None] = None, sessions: dict = None, lengths=None) -> int:
+        """
+        Split one cell across the live workers and merge their rows into output_file.
+        Each worker sends share * max_requests requests, so the cell's request
+        budget matches a single-process run. When on_result returns True every
+        worker is told to stop: their requests in flight finish and are still
+        merged, but no new ones are sent. Returns the number of successful requests.
+        """
+        if sessions:
+            raise ValueError("Session workloads are not supported on distributed workers")
+        if lengths is not None:
+            raise ValueError("Length distributions are not supported on distributed workers")
+        if itl_dump_file and not self._warned_itl:
+            logging.warning("The ITL gap dump is not collected from distributed workers; "
+                            "per-request ITL percentiles are still reported")
+            self._warned_itl = True
+
+        workers = [w for w in self._workers if w.alive]
+        if not workers:
+            raise RuntimeError("All load workers have exited; check the worker logs")
+
+        pending = set()
+        for worker, share in zip(workers, split_users(users, len(workers))):
+            if share == 0:
+                continue
+            cell = {
+                "users": share,
+                "input_tokens": input_tokens,
+                "max_new_tokens": max_new_tokens,
+                # Workers start in another directory (the SSH login directory for remote hosts)
+                "dataset_file": str(Path(dataset_file).resolve()),
+                "arrival": arrival,
+                "seed": f"{seed}:{worker.index}" if seed is not None else None,
+                # Each worker offers the share of the rate that matches its share of users
+                "request_rate": request_rate * share / users if request_rate is not None else None,
+            }
+            try:
+                worker.send({"cell": cell})
+            except (BrokenPipeError, OSError):
+                logging.error(f"Worker {worker.index} ({worker.host}) is not accepting work")
+                worker.alive = False
+                continue
+            pending.add(worker)
+
+        results = ResultSink(output_file, RESULT_FIELDNAMES, self.result_format) if output_file else None
+        completed = 0
+        stopping = False
+        try:
+            while pending:
+                worker, message = self._messages.get()
+                if message is None:
+                    logging.error(f"Worker {worker.index} ({worker.host}) exited with return code "
+                                  f"{worker.process.wait()}")
+                    worker.alive = False
+                    pending.discard(worker)
+                elif "row" in message:
+                    row = message["row"]
+                    # Workers report their own share; label rows with the cell as a whole
+                    row.update(users=users, request_rate=request_rate if request_rate is not None else '',
+                               host=worker.host, worker=worker.index)
+                    if results:
+                        results.write(row)
+                    if row.get('error'):
+                        if on_error:
+                            on_error(row)
+                        continue
+                    completed += 1
+                    if on_result and on_result(row) and not stopping:
+                        stopping = True
+                        # Keep reading until every worker is done, so no rows of this cell leak into the next
+                        self._stop(pending)
+                elif "done" in message:
+                    pending.discard(worker)
+        finally:
+            if results:
+                results.close()
+        return completed
+
+    @staticmethod
+    def _stop(workers):
+        for worker in workers:
+            try:
+                worker.send({"stop": True})
+            except (BrokenPipeError, OSError):
+                # Its exit is picked up by the reader thread
+                pass
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.process.stdin.close()
+            except OSError:
+                pass
+        for worker in self._workers:
+            try:
+                worker.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                logging.warning(f"Worker {worker.index} ({worker.host}) didn't exit gracefully. Forcing termination.")
+                worker.process.kill()
+        for log_file in self._log_files:
+            log_file.close()
@@ -0,0 +1,132 @@
+"""
+Per-request length distributions.
+
+Instead of the input_tokens x output_tokens grid, where every request of a
+cell has the same shape, a ``lengths`` config draws each request's prompt
+length and output length from a distribution. One cell per user count then
+measures the server under a realistic mix of shapes, the way continuous
+batching sees production traffic.
+
+A distribution is either a fixed number or a mapping with a ``type``:
+
+* ``empirical``: one of ``values`` at random. For input lengths without
+  ``values``, a random dataset prompt, so the mix follows the dataset.
+* ``uniform``: ``min`` to ``max``.
+* ``normal``: ``mean`` and ``std``.
+* ``lognormal``: ``mean`` and ``std`` of the lengths themselves, for the
+  long right tail of real prompt and reply lengths.
+* ``mix``: ``components``, each a distribution with a ``weight``.
+
+Every type also accepts ``min`` (default 1) and ``max`` to clip samples.
+Sampled input lengths get the dataset prompt closest in length, or with
+``"prompts": "synthetic"`` a generated prompt of exactly that length.
+"""
+import math
+import random
+from pathlib import Path
+from typing import Callable
+
+from echoswift.replay import PROMPT_SOURCES, DatasetPrompts
+
+DISTRIBUTION_TYPES = ("empirical", "uniform", "normal", "lognormal", "mix")
+MIXED = "mixed"
+
+
+def length_distribution(spec, name: str = "length") -> Callable[[random.Random], int]:
+    """A function that samples one length from the distribution described by spec."""
+    if isinstance(spec, int) and not isinstance(spec, bool):
+        if spec < 1:
+            raise ValueError(f"{name} must be at least 1, got {spec}")
+        return lambda rng: spec
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid {name} distribution: {spec!r}. Expected a number or a mapping with a \"type\"")
+
+    kind = spec.get("type")
+    low, high = int(spec.get("min", 1)), spec.get("max")
+    try:
+        if kind == "empirical":
+            values = [int(v) for v in spec["values"]]
+            if not values:
+                raise ValueError(f"Empirical {name} distribution has no values")
+            sample = lambda rng: rng.choice(values)
+        elif kind == "uniform":
+            low, high = int(spec["min"]), int(spec["max"])
+            sample = lambda rng: rng.randint(low, high)
+        elif kind == "normal":
+            mean, std = float(spec["mean"]), float(spec["std"])
+            sample = lambda rng: rng.gauss(mean, std)
+        elif kind == "lognormal":
+            mean, std = float(spec["mean"]), float(spec["std"])
+            sigma = math.sqrt(math.log(1 + (std / mean) ** 2))
+            mu = math.log(mean) - sigma ** 2 / 2
+            sample = lambda rng: rng.lognormvariate(mu, sigma)
+        elif kind == "mix":
+            components = spec["components"]
+            if not components:
+                raise ValueError(f"Mixed {name} distribution has no components")
+            samplers = [length_distribution(c, name) for c in components]
+            weights = [float(c.get("weight", 1)) for c in components]
+            sample = lambda rng: rng.choices(samplers, weights)[0](rng)
+        else:
+            raise ValueError(f"Unknown {name} distribution type {kind!r}. "
+                             f"Expected one of: {', '.join(DISTRIBUTION_TYPES)}")
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid {kind} {name} distribution {spec}: missing or invalid {e}") from None
+
+    def clipped(rng):
+        n = max(low, round(sample(rng)))
+        return min(n, int(high)) if high is not None else n
+    return clipped
+
+
+def _dataset_empirical(spec) -> bool:
+    return isinstance(spec, dict) and spec.get("type") == "empirical" and "values" not in spec
+
+
+def check_lengths(config: dict):
+    """Raise ValueError unless config is a valid lengths setting."""
+    if not isinstance(config, dict) or "output" not in config:
+        raise ValueError("lengths needs an \"output\" distribution (and optionally \"input\")")
+    if config.get("prompts", "dataset") not in PROMPT_SOURCES:
+        raise ValueError(f"Unknown prompt source '{config['prompts']}'. Expected one of: {', '.join(PROMPT_SOURCES)}")
+    input_spec = config.get("input", {"type": "empirical"})
+    if not _dataset_empirical(input_spec):
+        length_distribution(input_spec, "input length")
+    length_distribution(config["output"], "output length")
+    for edges in (config.get("buckets") or {}).values():
+        if list(edges) != sorted(set(edges)):
+            raise ValueError(f"Bucket edges must be increasing, got {edges}")
+
+
+class LengthMix:
+    """Draws the prompt and target lengths of every request of a mixed-length cell."""
+
+    def __init__(self, engine, config: dict, dataset_dir: Path, seed: int = 0):
+        check_lengths(config)
+        input_spec = config.get("input", {"type": "empirical"})
+        self.from_dataset = _dataset_empirical(input_spec)
+        self.input_length = None if self.from_dataset else length_distribution(input_spec, "input length")
+        self.output_length = length_distribution(config["output"], "output length")
+        self.tokenizer = engine.tokenizer
+        self.generator = None
+        self.dataset = None
+        if config.get("prompts", "dataset") == "synthetic" and not self.from_dataset:
+            from echoswift.synthetic import SyntheticPromptGenerator
+            self.generator = SyntheticPromptGenerator(engine.tokenizer, seed)
+        else:
+            self.dataset = DatasetPrompts(engine, dataset_dir, random.Random(seed))
+
+    def draw(self, rng: random.Random):
+        """A ScheduledRequest (sent whenever the caller decides) with its prompt and target lengths."""
+        from echoswift.async_engine import ScheduledRequest
+
+        if self.from_dataset:
+            prompt, prompt_tokens = self.dataset.sample(rng)
+            input_tokens = prompt_tokens
+        else:
+            input_tokens = self.input_length(rng)
+            if self.generator:
+                prompt, prompt_tokens = self.generator.prompt(input_tokens), input_tokens
+            else:
+                prompt, prompt_tokens = self.dataset.choose(input_tokens, rng)
+        return ScheduledRequest(0.0, prompt, prompt_tokens, input_tokens, self.output_length(rng))
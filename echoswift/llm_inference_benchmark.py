@@ -1,11 +1,32 @@
+import json
 import os
 import subprocess
 import logging
+from contextlib import nullcontext
 from pathlib import Path
 from typing import List
+import pandas as pd
 from tqdm import tqdm
 import signal
 import pkg_resources
+from echoswift.connections import connection_settings
+from echoswift.distributed import WorkerPool, worker_hosts
+from echoswift.lengths import MIXED, LengthMix, check_lengths
+from echoswift.manifest import COMPLETE, CellManifest, cell_key, file_fingerprint, merge_results, remove_results
+from echoswift.progress import ProgressTracker, register_tracker, start_metrics_server
+from echoswift.prompt_store import ensure_prompt_store
+from echoswift.result_sink import RESULT_FORMATS, RESULT_SUFFIXES
+from echoswift.server_metrics import MetricsPoller, join_server_metrics, server_metrics_file
+from echoswift.streaming import get_adapter, request_timeouts
+from echoswift.utils.avg_locust_results import (BUCKET_AVERAGES_PREFIX, TURN_AVERAGES_PREFIX, calculate_averages,
+                                                calculate_bucket_averages, calculate_mixed_averages,
+                                                calculate_turn_averages, failed_requests, itl_gap_frame,
+                                                load_results, request_slos)
+from echoswift.utils.itl import ITL_DUMP_SUFFIX
+from echoswift.token_index import DEFAULT_TOKENIZER, DEFAULT_REVISION, ensure_token_index, load_tokenizer
+
+ENGINES = ("locust", "async")
+LOAD_MODES = ("closed", "open")
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -13,7 +34,48 @@ class EchoSwift:
     def __init__(self, output_dir: str, api_url: str, inference_server: str, model_name: str = None,
                  max_requests: int = 5, user_counts: List[int] = [1],
                  input_tokens: List[int] = [32], output_tokens: List[int] = [256],
-                 dataset_dir: str = "Input_Dataset"):
+                 dataset_dir: str = "Input_Dataset", engine: str = "locust",
+                 tokenizer: str = DEFAULT_TOKENIZER, tokenizer_revision: str = DEFAULT_REVISION,
+                 dump_itl: bool = False, result_format: str = "csv",
+                 load_mode: str = "closed", request_rates: List[float] = None, arrival: str = "poisson",
+                 workers=None, seed: int = None, metrics_port: int = None, log_generated_text: bool = False,
+                 server_metrics: dict = None, sessions: dict = None, lengths: dict = None, slo: dict = None,
+                 timeouts: dict = None, connections: dict = None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'. Expected one of: {', '.join(ENGINES)}")
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"Unknown result format '{result_format}'. Expected one of: {', '.join(RESULT_FORMATS)}")
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode '{load_mode}'. Expected one of: {', '.join(LOAD_MODES)}")
+        if load_mode == "open":
+            if engine != "async":
+                raise ValueError("The open-loop load mode requires the async engine (\"engine\": \"async\")")
+            if not request_rates:
+                raise ValueError("The open-loop load mode requires a non-empty request_rates list")
+        if workers is not None:
+            if engine != "async":
+                raise ValueError("Distributed workers run the async engine; set \"engine\": \"async\"")
+            worker_hosts(workers)
+        if sessions:
+            if engine != "async" or workers is not None:
+                raise ValueError("Session workloads run on the local async engine; set \"engine\": \"async\" "
+                                 "and remove \"workers\"")
+            if load_mode != "closed":
+                raise ValueError("Session workloads are closed-loop; remove \"load_mode\": \"open\"")
+        if lengths:
+            if engine != "async" or workers is not None:
+                raise ValueError("Length distributions run on the local async engine; set \"engine\": \"async\" "
+                                 "and remove \"workers\"")
+            if sessions:
+                raise ValueError("Length distributions cannot be combined with session workloads")
+            check_lengths(lengths)
+        if slo:
+            request_slos(slo)
+        request_timeouts(timeouts)
+        connection_settings(connections)
+        if server_metrics is not None and not server_metrics.get("url"):
+            raise ValueError("server_metrics needs the \"url\" of the server's Prometheus metrics endpoint")
+        get_adapter(inference_server)
         self.output_dir = Path(output_dir)
         self.api_url = api_url
         self.inference_server = inference_server
@@ -23,42 +85,307 @@ class EchoSwift:
         self.input_tokens = input_tokens
         self.output_tokens = output_tokens
         self.dataset_dir = Path(dataset_dir)
+        self.engine = engine
+        self.tokenizer = tokenizer
+        self.tokenizer_revision = tokenizer_revision
+        self.dump_itl = dump_itl
+        self.result_format = result_format
+        self.load_mode = load_mode
+        self.request_rates = request_rates if load_mode == "open" else [None]
+        self.arrival = arrival
+        self.workers = workers
+        self.seed = seed
+        self.metrics_port = metrics_port
+        self.log_generated_text = log_generated_text
+        self.server_metrics = server_metrics
+        self.sessions = sessions
+        self.lengths = lengths
+        self.slo = slo
+        self.timeouts = timeouts
+        self.connections = connections
+        self.progress = ProgressTracker(api_url)
 
     def run_benchmark(self):
+        self.start()
+        try:
+            for users, input_token, cells in self.sweep():
+                for output_token, rate in cells:
+                    self.run_cell(users, input_token, output_token, rate)
+                self.finish_input_tokens(users, input_token)
+        finally:
+            self.close()
+
+    def sweep(self):
+        """
+        Yield (users, input_tokens, [(output_tokens, request_rate), ...]) in run order.
+        With length distributions there is one mixed cell per users and rate,
+        with MIXED in place of the token counts.
+        """
+        for u in self.user_counts:
+            if self.lengths:
+                yield u, MIXED, [(MIXED, rate) for rate in self.request_rates]
+                continue
+            for input_token in self.input_tokens:
+                yield u, input_token, [(o, rate) for o in self.output_tokens for rate in self.request_rates]
+
+    def start(self):
+        """Prepare the output directory, manifest and load engine for a sweep."""
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        locust_logs_dir = self.output_dir / "locust_logs"
-        locust_logs_dir.mkdir(exist_ok=True)
+        self._logs_dir = self.output_dir / "locust_logs"
+        self._logs_dir.mkdir(exist_ok=True)
         
-        total_requests = sum(self.user_counts) * self.max_requests * len(self.input_tokens) * len(self.output_tokens)
-        logging.info(f"Total requests to be sent: {total_requests}")
+        cells_per_user = 1 if self.lengths else len(self.input_tokens) * len(self.output_tokens)
+        total_requests = sum(self.user_counts) * self.max_requests * cells_per_user * len(self.request_rates)
+        logging.info(f"Total requests to be sent to {self.api_url}: {total_requests}")
 
-        for u in self.user_counts:
-            user_dir = self.output_dir / f"{u}_User"
-            user_dir.mkdir(exist_ok=True)
+        register_tracker(self.progress)
+        if self.metrics_port:
+            start_metrics_server(self.metrics_port)
 
-            for input_token in self.input_tokens:
-                user_file = user_dir / f"{input_token}_input_tokens.csv"
-                user_file.touch()
+        self._manifest = CellManifest(self.output_dir)
+        self._cell_files = {}
+        self._length_mix = None
+        if self.engine == "async":
+            self._async_engine = self.create_async_engine(self._logs_dir)
+            if self.lengths:
+                self._length_mix = LengthMix(self._async_engine, self.lengths, self.dataset_dir, self.seed or 0)
+        else:
+            self._async_engine = None
+            self._prepare_datasets()
+
+    def run_cell(self, u: int, input_token: int, output_token: int, rate: float = None):
+        """Run one cell, unless the manifest already has it complete (with its ITL dump, when one is requested)."""
+        suffix = RESULT_SUFFIXES[self.result_format]
+        cells_dir = self.output_dir / f"{u}_User" / "cells"
+        cells_dir.mkdir(parents=True, exist_ok=True)
+
+        params = self._cell_params(u, input_token, output_token, rate)
+        key = cell_key(params)
+        rate_tag = f"_{rate:g}rps" if rate is not None else ""
+        shape = MIXED if input_token == MIXED else f"{input_token}in_{output_token}out"
+        cell_file = cells_dir / f"{shape}{rate_tag}-{key}{suffix}"
+        self._cell_files.setdefault((u, input_token), []).append(cell_file)
+        rate_info = f", request_rate={rate}" if rate is not None else ""
+
+        itl_dump_file = self._itl_dump_file(cell_file)
+        if self._manifest.is_complete(key):
+            # Distributed workers write no ITL dump, so a missing one only counts when this run can write it
+            if itl_dump_file is None or itl_dump_file.exists() or self.workers is not None:
+                logging.info(f"Skipping completed cell users={u}, input_tokens={input_token}, output_tokens={output_token}{rate_info}")
+                return
+            logging.warning(f"Re-running completed cell users={u}, input_tokens={input_token}, "
+                            f"output_tokens={output_token}{rate_info}: it has no ITL dump")
+
+        # Never mix rows of an interrupted attempt with the rerun
+        remove_results(cell_file)
+        if itl_dump_file and itl_dump_file.exists():
+            itl_dump_file.unlink()
+        self._manifest.start(key, params, cell_file, u * self.max_requests)
+
+        seed = self._cell_seed(u, input_token, output_token, rate)
+        poller = self._metrics_poller()
+        with poller or nullcontext():
+            if self._async_engine:
+                logging.info(f"Running async engine with users={u}, input_tokens={input_token}, and output_tokens={output_token}{rate_info}")
+                completed = self._run_async(self._async_engine, u, input_token, output_token, cell_file, rate, seed)
+            else:
+                logging.info(f"Running Locust with users={u}, input_tokens={input_token}, and output_tokens={output_token}")
+                completed = self._run_locust(u, input_token, output_token, cell_file, self._logs_dir, seed)
+        if poller:
+            cell = {'users': u, 'request_rate': rate}
+            if input_token != MIXED:
+                # Mixed cells have per-request target lengths; samples are matched by users and rate only
+                cell.update(target_input_tokens=input_token, target_output_tokens=output_token)
+            poller.write(server_metrics_file(cell_file), cell)
+
+        status = self._manifest.finish(key, completed)
+        if status != COMPLETE:
+            logging.warning(f"Cell users={u}, input_tokens={input_token}, output_tokens={output_token}{rate_info} "
+                            f"is {status}; it will be re-run next time")
+
+    def finish_input_tokens(self, u: int, input_token: int):
+        """Rebuild {input_tokens}_input_tokens (or mixed_lengths) from its cell files and average it."""
+        user_dir = self.output_dir / f"{u}_User"
+        name = self.result_name(input_token)
+        user_file = user_dir / f"{name}{RESULT_SUFFIXES[self.result_format]}"
+        cell_files = self._cell_files.get((u, input_token), [])
+        merge_results(cell_files, user_file, self.result_format)
+        itl_gaps = itl_gap_frame(cell_files, [self._itl_dump_file(f) for f in cell_files]) if self.dump_itl else None
+        self._calculate_average(user_dir, input_token, itl_gaps)
+        if self.sessions:
+            calculate_turn_averages(user_file, user_dir / f"{TURN_AVERAGES_PREFIX}{name}.csv", self.slo)
+        if self.lengths:
+            buckets = self.lengths.get("buckets") or {}
+            calculate_bucket_averages(user_file, user_dir / f"{BUCKET_AVERAGES_PREFIX}{name}.csv",
+                                      buckets.get("input"), buckets.get("output"), self.slo)
+        if self.server_metrics:
+            self._join_server_metrics(user_file, user_dir / f"{name}_server_metrics.csv",
+                                      self._cell_files.get((u, input_token), []))
+
+    @staticmethod
+    def result_name(input_token) -> str:
+        """Stem of the per-user result files of an input token count, or of the mixed-length cells."""
+        return "mixed_lengths" if input_token == MIXED else f"{input_token}_input_tokens"
+
+    def close(self):
+        if getattr(self, "_async_engine", None):
+            self._async_engine.close()
+            self._async_engine = None
+
+    def _metrics_poller(self):
+        if not self.server_metrics:
+            return None
+        return MetricsPoller(self.server_metrics["url"], self.server_metrics.get("interval", 1.0),
+                             self.server_metrics.get("metrics"))
+
+    def _join_server_metrics(self, results_file: Path, output_file: Path, cell_files: List[Path]):
+        """Write every request of results_file with the server metrics sampled just before it was sent."""
+        sample_files = [server_metrics_file(f) for f in cell_files if server_metrics_file(f).exists()]
+        frames = [pd.read_csv(f) for f in sample_files if f.stat().st_size]
+        frames = [df for df in frames if 'timestamp' in df.columns]
+        if not frames:
+            logging.warning(f"No server metrics were collected from {self.server_metrics['url']}")
+            return
+        try:
+            results = load_results(results_file)
+        except (OSError, ValueError):
+            return
+        joined = join_server_metrics(results, pd.concat(frames, ignore_index=True))
+        joined.to_csv(output_file, index=False)
 
-                for output_token in self.output_tokens:
-                    logging.info(f"Running Locust with users={u}, input_tokens={input_token}, and output_tokens={output_token}")
-                    self._run_locust(u, input_token, output_token, user_file, locust_logs_dir)
+    def _cell_seed(self, users: int, input_tokens: int, output_tokens: int, request_rate: float = None):
+        """Per-cell prompt seed, so runs with the same seed send identical prompt sequences."""
+        if self.seed is None:
+            return None
+        return f"{self.seed}:{users}:{input_tokens}:{output_tokens}:{request_rate}"
 
-                self._calculate_average(user_dir, input_token)
+    def _cell_params(self, users: int, input_tokens: int, output_tokens: int, request_rate: float = None) -> dict:
+        """Everything that determines a cell's results; hashed into its cache key."""
+        if input_tokens == MIXED:
+            dataset = {f.name: file_fingerprint(f) for f in sorted(self.dataset_dir.glob("Dataset_*.csv"))}
+        else:
+            dataset_file = self.dataset_dir / f"Dataset_{input_tokens}.csv"
+            dataset = file_fingerprint(dataset_file) if dataset_file.exists() else str(dataset_file)
+        params = {
+            "api_url": self.api_url,
+            "inference_server": self.inference_server,
+            "model_name": self.model_name,
+            "engine": self.engine,
+            "users": users,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "max_requests": self.max_requests,
+            "request_rate": request_rate,
+            "arrival": self.arrival if request_rate is not None else None,
+            "dataset": dataset,
+            "tokenizer": self.tokenizer,
+            "tokenizer_revision": self.tokenizer_revision,
+            "result_format": self.result_format,
+        }
+        if self.seed is not None:
+            params["seed"] = self.seed
+        if self.sessions:
+            params["sessions"] = self.sessions
+        if self.lengths:
+            params["lengths"] = self.lengths
+        if self.timeouts:
+            params["timeouts"] = request_timeouts(self.timeouts)
+        if self.connections:
+            params["connections"] = connection_settings(self.connections)
+        return params
 
-    def _run_locust(self, users: int, input_tokens: int, output_tokens: int, output_file: Path, logs_dir: Path):
+    def create_async_engine(self, logs_dir: Path):
+        """
+        An async engine with this benchmark's target, tokenizer, result format,
+        timeouts and connection settings: a WorkerPool when workers are set,
+        otherwise an AsyncLoadEngine in this process. The caller closes it.
+        """
+        if self.workers is not None:
+            settings = self.workers if isinstance(self.workers, dict) else {}
+            return WorkerPool(worker_hosts(self.workers), self.api_url, self.inference_server, self.model_name,
+                              self.max_requests, tokenizer_name=self.tokenizer,
+                              tokenizer_revision=self.tokenizer_revision, result_format=self.result_format,
+                              logs_dir=logs_dir, python=settings.get("python", "python3"),
+                              ssh_options=settings.get("ssh_options"), timeouts=self.timeouts,
+                              connections=self.connections)
+
+        # Imported lazily so the Locust path never pays for aiohttp/asyncio setup
+        from echoswift.async_engine import AsyncLoadEngine
+        return AsyncLoadEngine(self.api_url, self.inference_server, self.model_name, self.max_requests,
+                               tokenizer_name=self.tokenizer, tokenizer_revision=self.tokenizer_revision,
+                               result_format=self.result_format, timeouts=self.timeouts,
+                               connections=self.connections)
+
+    def _prepare_datasets(self):
+        """Build or refresh the prompt stores and token-count indexes that Locust workers memory-map."""
+        tokenizer = load_tokenizer(self.tokenizer, self.tokenizer_revision)
+        for input_token in self.input_tokens:
+            dataset_file = self.dataset_dir / f"Dataset_{input_token}.csv"
+            ensure_prompt_store(dataset_file)
+            ensure_token_index(dataset_file, self.tokenizer, self.tokenizer_revision, tokenizer=tokenizer)
+
+    def _run_async(self, engine, users: int, input_tokens: int, output_tokens: int, output_file: Path,
+                   request_rate: float = None, seed=None):
+        total_requests = users * self.max_requests
+        self.progress.start_cell(users, input_tokens, output_tokens, request_rate)
+        rate_info = f", rate={request_rate}" if request_rate is not None else ""
+        with tqdm(total=total_requests, desc=f"Requests (u={users}, in={input_tokens}, out={output_tokens}{rate_info})", leave=True) as pbar:
+            def on_result(row):
+                self.progress.record(float(row['TTFT(ms)']), float(row['throughput(tokens/second)']))
+                pbar.update(1)
+                pbar.set_postfix(self.progress.postfix(), refresh=False)
+
+            def on_error(row):
+                self.progress.record_failure()
+                pbar.update(1)
+                pbar.set_postfix(self.progress.postfix(), refresh=False)
+
+            completed = engine.run_cell(users, input_tokens, output_tokens,
+                                        self.dataset_dir / f"Dataset_{input_tokens}.csv", output_file,
+                                        on_result=on_result,
+                                        itl_dump_file=self._itl_dump_file(output_file),
+                                        request_rate=request_rate, arrival=self.arrival, seed=seed,
+                                        on_error=on_error, sessions=self.sessions,
+                                        lengths=self._length_mix)
+
+        if completed < total_requests:
+            logging.warning(f"{total_requests - completed} of {total_requests} requests failed for users={users}, "
+                            f"input_tokens={input_tokens}, output_tokens={output_tokens}")
+        return completed
+
+    def _itl_dump_file(self, output_file: Path):
+        return output_file.with_name(output_file.stem + ITL_DUMP_SUFFIX) if self.dump_itl else None
+
+    def _run_locust(self, users: int, input_tokens: int, output_tokens: int, output_file: Path, logs_dir: Path,
+                    seed=None) -> int:
         env = os.environ.copy()
         env.update({
             "MAX_REQUESTS": str(self.max_requests),
             "NUM_USERS": str(users),
             "MAX_NEW_TOKENS": str(output_tokens),
+            "INPUT_TOKENS": str(input_tokens),
             "API_URL": self.api_url,
             "INFERENCE_SERVER": self.inference_server,
             "INPUT_DATASET": str(self.dataset_dir / f"Dataset_{input_tokens}.csv"),
-            "OUTPUT_FILE": str(output_file)
+            "OUTPUT_FILE": str(output_file),
+            "RESULT_FORMAT": self.result_format,
+            "TOKENIZER": self.tokenizer,
+            "TOKENIZER_REVISION": self.tokenizer_revision,
+            "REQUEST_TIMEOUTS": json.dumps(request_timeouts(self.timeouts)),
+            "CONNECTIONS": json.dumps(connection_settings(self.connections))
         })
 
-        if self.inference_server in ["Ollama", "vLLM", "NIMS"]:
+        itl_dump_file = self._itl_dump_file(output_file)
+        if itl_dump_file:
+            env["ITL_DUMP_FILE"] = str(itl_dump_file)
+
+        if seed is not None:
+            env["PROMPT_SEED"] = seed
+
+        if self.log_generated_text:
+            env["LOG_GENERATED_TEXT"] = "1"
+
+        if get_adapter(self.inference_server).requires_model:
             env["MODEL_NAME"] = self.model_name
 
         locust_file = pkg_resources.resource_filename('echoswift', 'llm_inference_master.py')
@@ -74,54 +401,63 @@ class EchoSwift:
         log_file_path = logs_dir / f"locust_log_u{users}_in{input_tokens}_out{output_tokens}.log"
         
         total_requests = users * self.max_requests
+        self.progress.start_cell(users, input_tokens, output_tokens)
+        # Locust reports each finished request as a JSON line on its own pipe; its output only goes to the log
+        progress_read, progress_write = os.pipe()
+        env["PROGRESS_FD"] = str(progress_write)
         with tqdm(total=total_requests, desc=f"Requests (u={users}, in={input_tokens}, out={output_tokens})", leave=True) as pbar, \
              open(log_file_path, 'w') as log_file:
-            process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
-            
-            generated_text_count = 0
-            for line in iter(process.stdout.readline, ''):
-                log_file.write(line)
-                log_file.flush()
-                
-                if "Generated Text:" in line:
-                    generated_text_count += 1
-                    if generated_text_count % users == 0:
-                        update_amount = users
-                        pbar.update(update_amount)
-
-                if pbar.n >= total_requests:
-                    process.terminate()
-                    break
-
-            remaining = generated_text_count - pbar.n
-            if remaining > 0:
-                pbar.update(remaining)
+            try:
+                process = subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+                                           pass_fds=(progress_write,))
+            finally:
+                os.close(progress_write)
+
+            with os.fdopen(progress_read) as progress:
+                for line in progress:
+                    try:
+                        self.progress.record_message(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue
+                    # Failed requests are recorded too, so every message is one request
+                    pbar.update(1)
+                    pbar.set_postfix(self.progress.postfix(), refresh=False)
+
+                    if pbar.n >= total_requests:
+                        break
 
+            # Users quit on their own after max_requests; a SIGTERM that lands during
+            # Locust's own shutdown can hang it, so only stop it if it lingers
             try:
-                process.wait(timeout=30)
+                process.wait(timeout=10)
             except subprocess.TimeoutExpired:
-                logging.warning("Locust didn't terminate gracefully. Forcing termination.")
-                process.kill()
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    logging.warning("Locust didn't terminate gracefully. Forcing termination.")
+                    process.kill()
+                    process.wait()
 
         if process.returncode != 0 and process.returncode != -signal.SIGTERM.value:
             logging.error(f"Locust command failed with return code {process.returncode}. Check the log file: {log_file_path}")
 
-    def _calculate_average(self, user_dir: Path, input_token: int):
-        input_file = user_dir / f"{input_token}_input_tokens.csv"
-        output_file = user_dir / f"avg_{input_token}_input_tokens.csv"
-        
-        avg_script = pkg_resources.resource_filename('echoswift', 'utils/avg_locust_results.py')
-        command = [
-            "python3",
-            avg_script,
-            "--input_csv_filename", str(input_file),
-            "--output_csv_filename", str(output_file),
-            "--tokens"
-        ] + [str(t) for t in self.output_tokens]
+        try:
+            return int((~failed_requests(load_results(output_file))).sum())
+        except (OSError, ValueError):
+            return 0
+
+    def _calculate_average(self, user_dir: Path, input_token: int, itl_gaps: pd.DataFrame = None):
+        name = self.result_name(input_token)
+        input_file = user_dir / f"{name}{RESULT_SUFFIXES[self.result_format]}"
+        output_file = user_dir / f"avg_{name}.csv"
 
         try:
-            subprocess.run(command, check=True)
-        except subprocess.CalledProcessError as e:
+            if input_token == MIXED:
+                calculate_mixed_averages(input_file, output_file, self.slo, itl_gaps)
+            else:
+                calculate_averages(input_file, output_file, self.output_tokens, self.slo, itl_gaps)
+        except (OSError, ValueError) as e:
             logging.error(f"Error calculating average: {e}")
             raise
 
@@ -1,24 +1,74 @@
 import os
-import csv
+import json
 import time
 import random
+import itertools
 import logging
 from datetime import datetime
-from locust import HttpUser, task
+from locust import HttpUser, events, task
+from requests.exceptions import Timeout
 from transformers import AutoTokenizer
+from urllib3.exceptions import ReadTimeoutError
 from threading import Barrier, BrokenBarrierError
-import json
+from echoswift.connections import TimedHTTPAdapter, connection_phases, connection_settings, phase_fields
+from echoswift.progress import progress_writer
+from echoswift.prompt_store import shared_prompt_store
+from echoswift.result_sink import RESULT_FIELDNAMES, close_all_sinks, get_result_sink
+from echoswift.streaming import EMPTY_STREAM, StreamCollector, get_adapter, request_timeouts
+from echoswift.token_counter import TokenCounter
+from echoswift.token_index import DEFAULT_TOKENIZER, DEFAULT_REVISION, load_token_index
+from echoswift.utils.itl import encode_itl_record, inter_token_gaps, itl_summary
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
 # Initialize the tokenizer for encoding/decoding text
-tokenizer = AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer")
+tokenizer_name = os.environ.get("TOKENIZER", DEFAULT_TOKENIZER)
+tokenizer_revision = os.environ.get("TOKENIZER_REVISION", DEFAULT_REVISION)
+tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, revision=tokenizer_revision)
+# Re-tokenizes generated text in batches, for servers that report no usage
+token_counter = TokenCounter(tokenizer)
+
+# Prompt token counts, loaded once per dataset file and shared by all users
+token_indexes = {}
 
 # Global barrier to synchronize users
 num_users = int(os.environ.get("NUM_USERS", 10))
 barrier = Barrier(num_users)
 
+# Structured per-request progress for the orchestrator; the generated text is only logged on request
+report_progress = progress_writer()
+log_generated_text = os.environ.get("LOG_GENERATED_TEXT", "").lower() in ("1", "true", "yes")
+
+# Connect and read timeouts go to requests; the total timeout is checked as the stream is read
+timeouts = request_timeouts(json.loads(os.environ.get("REQUEST_TIMEOUTS", "null")))
+
+# Keep-alive and the connection pool size of every user's session
+connections = connection_settings(json.loads(os.environ.get("CONNECTIONS", "null")))
+
+# With a seed, user n draws the same prompt sequence in every run
+prompt_seed = os.environ.get("PROMPT_SEED")
+user_numbers = itertools.count()
+
+def is_timeout(error: Exception) -> bool:
+    """Whether a request failed on a timeout; requests reports read timeouts mid-stream as connection errors."""
+    return isinstance(error, (Timeout, TimeoutError)) or any(isinstance(arg, ReadTimeoutError) for arg in error.args)
+
+def record_counted(record, counted):
+    """Call record with the token count of a finished count, logging a count that failed."""
+    try:
+        output_tokens = counted.result()
+    except Exception as e:
+        logging.error(f"Could not count output tokens: {type(e).__name__} {e}")
+        return
+    record(output_tokens)
+
+@events.quitting.add_listener
+def close_result_sinks(environment, **kwargs):
+    """Write out any buffered results before the process exits, after the rows still waiting for a token count."""
+    token_counter.close()
+    close_all_sinks()
+
 class APITestUser(HttpUser):
     """
     Represents a Locust user for load testing an API.
@@ -32,21 +82,46 @@ class APITestUser(HttpUser):
         self.request_count = 0
         self.max_requests = int(os.environ.get("MAX_REQUESTS", 10))
         self.max_new_tokens = int(os.environ.get('MAX_NEW_TOKENS', 128))
+        self.target_input_tokens = os.environ.get('INPUT_TOKENS', '')
         self.api_url = os.environ.get('API_URL', '')
         self.dataset_file = os.environ.get('INPUT_DATASET', '')
         self.questions = self.load_dataset(self.dataset_file)
+        self.prompt_token_counts = self.load_token_counts(self.dataset_file)
         self.output_file_path = os.environ.get('OUTPUT_FILE', 'output.csv')
+        self.results = get_result_sink(self.output_file_path, RESULT_FIELDNAMES, os.environ.get('RESULT_FORMAT', 'csv'))
         self.inference_server = os.environ.get('INFERENCE_SERVER', " ")
+        self.adapter = get_adapter(self.inference_server)
         self.model_name = os.environ.get('MODEL_NAME', " ")
+        itl_dump_file = os.environ.get('ITL_DUMP_FILE')
+        self.itl_dump = get_result_sink(itl_dump_file, fmt='binary') if itl_dump_file else None
+        self.rng = random.Random(f"{prompt_seed}:{next(user_numbers)}") if prompt_seed else random.Random()
+        # Timed connections record every request's connection phases
+        for prefix in ("http://", "https://"):
+            self.client.mount(prefix, TimedHTTPAdapter(connections["pool_size"]))
+        if not connections["keep_alive"]:
+            self.client.headers["Connection"] = "close"
 
     @staticmethod
     def load_dataset(csv_file):
         """
-        Read questions from a CSV file.
+        The prompts of csv_file, memory-mapped once per process and shared by all users,
+        so spawning a user neither parses the CSV nor copies the prompts.
+        """
+        return shared_prompt_store(csv_file)
+
+    @staticmethod
+    def load_token_counts(csv_file):
+        """
+        Memory-map the precomputed prompt token counts for csv_file.
+        Returns None when no up-to-date index exists.
         """
-        with open(csv_file, 'r') as file:
-            reader = csv.DictReader(file)
-            return [row['Input_Prompt'] for row in reader]
+        if csv_file not in token_indexes:
+            index = load_token_index(csv_file, tokenizer_name, tokenizer_revision)
+            if index is None:
+                logging.warning(f"No token index found for {csv_file}, prompts will be tokenized per request")
+            token_indexes[csv_file] = index
+        index = token_indexes[csv_file]
+        return index.counts if index is not None else None
 
     def on_start(self):
         try:
@@ -58,192 +133,35 @@ class APITestUser(HttpUser):
         """
         Format the prompt for the API request.
         """
-        prompt = random.choice(self.questions)
-
-        if self.inference_server == "TGI":
-            data = {'inputs': prompt, 'parameters': {'max_new_tokens': self.max_new_tokens}}
-        elif self.inference_server == "Ollama":
-            data = {
-                "model": self.model_name, 
-                "prompt": prompt, 
-                "stream": True, 
-                "options": {"num_predict": self.max_new_tokens}
-            }
-        elif self.inference_server == "Llamacpp":
-            data = {"prompt": prompt, "n_predict": self.max_new_tokens, "stream": True}
-
-        elif self.inference_server == "vLLM":
-            data = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "max_tokens": self.max_new_tokens,
-                "min_tokens": self.max_new_tokens,
-                "stream": True
-            }
-
-        elif self.inference_server == "NIMS":
-            data={
-                "messages": [
-                    {
-                        "content": prompt,
-                        "role": "user"
-                    }
-                ],
-                "model": self.model_name,
-                "max_tokens": self.max_new_tokens,
-                "stream": True
-            }
-
-        input_tokens = len(tokenizer.encode(prompt))
+        prompt_index = self.rng.randrange(len(self.questions))
+        prompt = self.questions[prompt_index]
+        data = self.adapter.build_payload(prompt, self.max_new_tokens, self.model_name)
+
+        if self.prompt_token_counts is not None:
+            input_tokens = int(self.prompt_token_counts[prompt_index])
+        else:
+            input_tokens = len(tokenizer.encode(prompt))
         return data, input_tokens
 
-    def process_response(self, response):
-        """
-        Process the response from the API.
-        """
-        generated_text = ""
-        ttft = None
-        inference_server_handlers = {
-            "TGI": self._process_tgi_response,
-            "Ollama": self._process_ollama_response,
-            "Llamacpp": self._process_llamacpp_response,
-            "vLLM":self._process_vLLM_response,
-            "NIMS":self._process_NIMS_response,
-        }
-
-        handler = inference_server_handlers.get(self.inference_server, None)
-        if handler:
-            generated_text, ttft = handler(response)
-
-        output_tokens = len(tokenizer.encode(generated_text))
-        return generated_text, output_tokens, ttft
-
-    def _process_tgi_response(self, response):
-        """
-        Process the response for TGI inference_server.
-        """
-        generated_text = ""
-        ttft = None
-
-        for i, chunk in enumerate(response.iter_lines()):
-            if chunk and i == 0 and ttft is None:
-                ttft = (time.perf_counter() - start_time)
-                logging.info(f"TTFT: {ttft*1000:.3f} ms")
-
-            decoded_chunk = chunk.decode("utf-8")
-            if "data:" in decoded_chunk:
-                try:
-                    json_data = decoded_chunk.split("data:")[1]
-                    json_data = json.loads(json_data)
-                    token = json_data["token"]["text"]
-                    generated_text += token
-                except (json.JSONDecodeError, KeyError):
-                    print("Failed to extract decoded text from JSON")
-
-        return generated_text, ttft
-
-    def _process_ollama_response(self, response):
-        """
-        Process the response for Ollama inference_server.
-        """
-        generated_text = ""
-        ttft = None
-
-        for i, chunk in enumerate(response.iter_lines()):
-            if chunk and i == 0 and ttft is None:
-                ttft = (time.perf_counter() - start_time)
-                logging.info(f"TTFT: {ttft*1000:.3f} ms")
-
-            decoded_chunk = chunk.decode('utf-8')
-            if decoded_chunk:
-                try:
-                    json_data = json.loads(decoded_chunk)
-                    token = json_data["response"]
-                    generated_text += token
-                except (json.JSONDecodeError, KeyError):
-                    print("Failed to extract decoded text from JSON")
-
-        return generated_text, ttft
-
-    def _process_llamacpp_response(self, response):
-        """
-        Process the response for Llamacpp inference_server.
-        """
-        generated_text = ""
-        ttft = None
-        for i, chunk in enumerate(response.iter_lines()):
-            if chunk and i == 0 and ttft is None:
-                ttft = (time.perf_counter() - start_time)
-                logging.info(f"TTFT: {ttft*1000:.3f} ms")
-
-            decoded_chunk = chunk.decode("utf-8")
-            if "data:" in decoded_chunk:
-                try:
-                    json_data = decoded_chunk.split("data:")[1]
-                    json_data = json.loads(json_data)
-                    token = json_data["content"]
-                    generated_text += token
-                except (json.JSONDecodeError, KeyError):
-                    print("Failed to extract decoded text from JSON")
-
-        return generated_text, ttft
-
-    def _process_vLLM_response(self, response):
+    def process_response(self, response, collector):
         """
-        Process the response for vLLM inference_server
+        Read the streamed response from the API into the collector,
+        raising TimeoutError once the total timeout has passed.
         """
-        generated_text = ""
-        ttft = None
-        for i, chunk in enumerate(response.iter_lines()):
-            if chunk and i==0 and ttft is None:
-                ttft = (time.perf_counter() - start_time)
-                logging.info(f"TTFT: {ttft*1000:.3f} ms")
-            
-            decoded_chunk = chunk.decode("utf-8")
-            if decoded_chunk == "data: [DONE]":
-                    break
-            if "data:" in decoded_chunk:
-                try:
-                    json_data = decoded_chunk.split("data:")[1]
-                    json_data = json.loads(json_data)
-                    token = json_data["choices"][0]["text"]
-                    generated_text += token
-                except (json.JSONDecodeError, KeyError) as e:
-                    print("Failed to extract decoded text from JSON")
-                    
-        return generated_text, ttft
-    
-    def _process_NIMS_response(self, response):
-        """
-        Process the response for NIMS inference_server.
-        """
-        generated_text = ""
-        ttft = None
-
-        for i, chunk in enumerate(response.iter_lines()):
-            if chunk and i == 0 and ttft is None:
-                ttft = (time.perf_counter() - start_time)
-                logging.info(f"TTFT: {ttft*1000:.3f} ms")
-
-            decoded_chunk = chunk.decode("utf-8")
-            if decoded_chunk == "data: [DONE]":
-                    break
-            
-            if "data:" in decoded_chunk and i!=0:
-                try:
-                    json_data = decoded_chunk.split("data:")[1]
-                    json_data = json.loads(json_data)
-                    token = json_data["choices"][0]["delta"]["content"]
-                    generated_text += token
-                except (json.JSONDecodeError, KeyError):
-                    print("Failed to extract decoded text from JSON")
-
-        return generated_text, ttft
+        for line in response.iter_lines():
+            if collector.feed(line):
+                # Read the end of the body too, so the connection goes back to the pool for reuse
+                response.raw.drain_conn()
+                break
+            if timeouts["total"] and time.perf_counter() - collector.start_time > timeouts["total"]:
+                response.close()
+                raise TimeoutError(f"No complete response within the total timeout of {timeouts['total']}s")
 
     @task
     def generate_text(self):
         """
         Task to generate text using the API and log the results.
+        Failed requests are logged too, with their error.
         """
         if self.request_count > self.max_requests:
             self.environment.runner.quit()
@@ -251,75 +169,120 @@ class APITestUser(HttpUser):
 
         input_data, input_tokens = self.format_prompt()
 
-        # Record the start time of the API request
-        global start_time
+        # Record the start time of the API request; the wall clock aligns it with server-side metrics
+        start_epoch = time.time()
         start_time = time.perf_counter()
+        collector = StreamCollector(self.adapter, start_time)
+        status, error, timed_out = '', '', False
+        phases = {}
         try:
-            response = self.client.post(self.api_url, json=input_data, stream=True)
+            response = self.client.post(self.api_url, json=input_data, stream=True,
+                                        timeout=(timeouts["connect"], timeouts["read"]))
+            phases = connection_phases(response, start_time)
+            status = response.status_code or ''
             response.raise_for_status()
+            self.process_response(response, collector)
         except Exception as e:
-            logging.error(f"Error making request: {e}")
-            return
-        
-        generated_text, output_tokens, ttft = self.process_response(response)
-
-        logging.info(f"Generated Text: {generated_text}")
+            logging.error(f"Error making request: {type(e).__name__} {e}")
+            error, timed_out = type(e).__name__, is_timeout(e)
+        collector.log_parse_errors()
 
         # Record the end time of the API request
         end_time = time.perf_counter()
+        ttft = collector.ttft
+        if ttft is None and not error:
+            logging.error("Stream ended without returning any generated text")
+            error = EMPTY_STREAM
 
-        # End-to-end time for getting the response
-        latency = (end_time - start_time)
+        output_tokens, source = collector.output_tokens() if ttft is not None else (0, '')
+
+        if log_generated_text and not error:
+            logging.info(f"Generated Text: {collector.text}")
 
-        throughput = (output_tokens - 1) / (latency - ttft) if output_tokens > 1 else 0
-        latency_per_token = (latency - ttft) * 1000 / (output_tokens - 1) if output_tokens > 1 else ttft * 1000
+        # End-to-end time for getting the response, or until it failed
+        latency = (end_time - start_time)
+        itl_gaps = inter_token_gaps(collector.token_times)
 
         # Convert start and stop times to datetime objects
-        start_time_str = datetime.fromtimestamp(start_time).strftime('%H:%M:%S.%f')
-        end_time_str = datetime.fromtimestamp(end_time).strftime('%H:%M:%S.%f')
+        start_time_str = datetime.fromtimestamp(start_epoch).strftime('%H:%M:%S.%f')
+        end_time_str = datetime.fromtimestamp(start_epoch + latency).strftime('%H:%M:%S.%f')
 
-        # Log the results to the output CSV file
+        # Every attempt counts towards max_requests, so a failing server cannot keep a user looping
         self.request_count += 1
+        request_number = self.request_count
         if self.request_count > self.max_requests:
             self.environment.runner.quit()
 
-        self.log_results(start_time_str, end_time_str, input_tokens, output_tokens, latency, throughput, latency_per_token, ttft)
+        def record(output_tokens):
+            row = self.log_results(request_number, start_time_str, end_time_str, start_epoch, input_tokens,
+                                   output_tokens, source, latency, ttft, itl_gaps, status, error, timed_out,
+                                   phase_fields(**phases, first_chunk=collector.first_chunk))
+            if report_progress:
+                if error:
+                    report_progress(failed=1)
+                else:
+                    report_progress(ttft_ms=float(row['TTFT(ms)']), throughput=float(row['throughput(tokens/second)']))
+            if self.itl_dump and not error:
+                self.itl_dump.write(encode_itl_record(request_number, self.max_new_tokens, itl_gaps))
+
+        if output_tokens is None:
+            # The text is re-tokenized in the counter's batches; the row is written once it is counted,
+            # so this user goes on to the barrier instead of waiting for the count
+            token_counter.submit(collector.text).add_done_callback(lambda counted: record_counted(record, counted))
+        else:
+            record(output_tokens)
         try:
             barrier.wait()
         except BrokenBarrierError:
             pass
 
-    def log_results(self, start_time, end_time, input_tokens, output_tokens, latency, throughput, latency_per_token, ttft):
+    def log_results(self, request_number, start_time, end_time, start_epoch, input_tokens, output_tokens,
+                    output_tokens_source, latency, ttft, itl_gaps, status, error, timed_out, phases):
         """
-        Log the results to the output CSV file.
+        Queue the results for the background result writer; returns the row.
+        Failed requests keep their partial TTFT and output tokens, without throughput.
+        phases are the connection columns, see echoswift.connections.
         """
-        with open(self.output_file_path, 'a', newline='') as csvfile:
-            fieldnames = [
-                'request', 'start_time', 'end_time', 'input_tokens',
-                'output_tokens', 'latency(ms)', 'throughput(tokens/second)',
-                'latency_per_token(ms/token)', 'TTFT(ms)'
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            if csvfile.tell() == 0:
-                writer.writeheader()
-
-            writer.writerow({
-                'request': self.request_count,
-                'start_time': start_time,
-                'end_time': end_time,
-                'input_tokens': input_tokens,
-                'output_tokens': output_tokens,
-                'latency(ms)': f"{latency * 1000:.3f}",
+        row = {
+            'request': request_number,
+            'start_time': start_time,
+            'end_time': end_time,
+            'start_epoch': f"{start_epoch:.6f}",
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'latency(ms)': f"{latency * 1000:.3f}",
+            'throughput(tokens/second)': '',
+            'latency_per_token(ms/token)': '',
+            'TTFT(ms)': f"{ttft * 1000:.3f}" if ttft is not None else '',
+            **itl_summary(itl_gaps),
+            'users': num_users,
+            'target_input_tokens': self.target_input_tokens,
+            'target_output_tokens': self.max_new_tokens,
+            'output_tokens_source': output_tokens_source,
+            'stopped_short': '',
+            'http_status': status,
+            'error': error,
+            'timed_out': int(timed_out),
+            **phases
+        }
+        if not error:
+            throughput = (output_tokens - 1) / (latency - ttft) if output_tokens > 1 else 0
+            latency_per_token = (latency - ttft) * 1000 / (output_tokens - 1) if output_tokens > 1 else ttft * 1000
+            row.update({
                 'throughput(tokens/second)': f"{throughput:.3f}",
                 'latency_per_token(ms/token)': f"{latency_per_token:.3f}",
-                'TTFT(ms)': f"{ttft * 1000:.3f}"
+                'stopped_short': int(output_tokens < self.max_new_tokens)
             })
+        self.results.write(row)
+        return row
 
     def on_stop(self):
         """
         Perform actions on stopping the test.
         """
+        self.results.flush()
+        if self.itl_dump:
+            self.itl_dump.flush()
         try: 
             barrier.wait()
         except BrokenBarrierError:
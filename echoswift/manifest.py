@@ -0,0 +1,124 @@
+"""
+Content-addressed benchmark cells and the sweep manifest.
+
+Every (users, input tokens, output tokens, request rate) cell writes its rows
+to its own file, named after a hash of everything that determines its
+results: endpoint, server, model, load shape, dataset content and tokenizer.
+``out_dir/manifest.json`` records the status of every cell, so an interrupted
+sweep can be rerun with the same config and only the missing, failed or
+partial cells are sent again. The per-input-token result files are rebuilt
+from the cell files after each run.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from echoswift.utils.avg_locust_results import load_results
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+COMPLETE = "complete"
+PARTIAL = "partial"
+FAILED = "failed"
+RUNNING = "running"
+
+_fingerprints: Dict[str, str] = {}
+
+
+def file_fingerprint(path) -> str:
+    """sha256 of a file's content, computed once per process."""
+    key = str(Path(path).resolve())
+    if key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+def cell_key(params: dict) -> str:
+    """Short, stable hash of a cell's parameters."""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def remove_results(path: Path):
+    """Delete a CSV result file or a Parquet result directory."""
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def merge_results(cell_files: List[Path], output_file: Path, fmt: str = "csv") -> int:
+    """Rewrite output_file from the given cell files; returns the number of rows."""
+    frames = [load_results(f) for f in cell_files if f.exists()]
+    frames = [df for df in frames if not df.empty]
+    remove_results(output_file)
+    if not frames:
+        return 0
+    merged = pd.concat(frames, ignore_index=True)
+    if fmt == "parquet":
+        output_file.mkdir(parents=True)
+        merged.to_parquet(output_file / "part-merged.parquet", index=False)
+    else:
+        merged.to_csv(output_file, index=False)
+    return len(merged)
+
+
+class CellManifest:
+    """Status of every cell run into an output directory, persisted after each change."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_FILE
+        self.cells = {}
+        if self.path.exists():
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    self.cells = data.get("cells", {})
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+
+    def is_complete(self, key: str) -> bool:
+        entry = self.cells.get(key)
+        return bool(entry) and entry["status"] == COMPLETE and (self.output_dir / entry["file"]).exists()
+
+    def start(self, key: str, params: dict, cell_file: Path, expected: int):
+        self.cells[key] = {
+            "params": params,
+            "file": str(Path(cell_file).relative_to(self.output_dir)),
+            "status": RUNNING,
+            "expected": expected,
+            "requests": 0,
+            "started_at": datetime.now().isoformat(timespec='seconds'),
+        }
+        self._save()
+
+    def finish(self, key: str, completed: int):
+        entry = self.cells[key]
+        entry["requests"] = completed
+        if completed >= entry["expected"]:
+            entry["status"] = COMPLETE
+        else:
+            entry["status"] = PARTIAL if completed else FAILED
+        entry["finished_at"] = datetime.now().isoformat(timespec='seconds')
+        self._save()
+        return entry["status"]
+
+    def _save(self):
+        tmp = self.path.with_suffix(".json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump({"version": MANIFEST_VERSION, "cells": self.cells}, f, indent=2)
+        os.replace(tmp, self.path)
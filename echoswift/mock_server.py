@@ -0,0 +1,193 @@
+"""
+Mock streaming inference server.
+
+Emulates the streaming endpoints of every supported inference server with
+configurable timing, so the harness can be calibrated and exercised end to
+end without a GPU. Every request waits for a free slot (when the concurrency
+is capped), then for the time to first token, and then emits tokens at a
+fixed rate. Gaussian jitter can be added to every delay. The configured
+delays are the ground truth that measured TTFT and ITL should reproduce.
+Faults can be injected too: a share of requests is rejected with HTTP 503,
+and a share of streams stalls halfway for stall_ms, to exercise the
+client's failure accounting and timeouts.
+
+Routes:
+    TGI        POST /generate_stream
+    Ollama     POST /api/generate
+    Llamacpp   POST /completion
+    vLLM       POST /v1/completions
+    NIMS       POST /v1/chat/completions
+    metrics    GET  /metrics (Prometheus text format)
+"""
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+# Common words that are a single token for most tokenizers, so output token counts match what was sent
+_WORDS = ("the", "of", "and", "to", "in", "is", "that", "it", "for", "as", "with", "was", "on", "be", "at", "by")
+
+
+class MockInferenceServer:
+    def __init__(self, ttft_ms: float = 50.0, tokens_per_second: float = 50.0, jitter_ms: float = 0.0,
+                 max_concurrency: int = 0, seed: int = None, error_rate: float = 0.0, stall_rate: float = 0.0,
+                 stall_ms: float = 0.0):
+        if tokens_per_second <= 0:
+            raise ValueError(f"tokens_per_second must be positive, got {tokens_per_second}")
+        for name, rate in (("error_rate", error_rate), ("stall_rate", stall_rate)):
+            if not 0 <= rate <= 1:
+                raise ValueError(f"{name} must be between 0 and 1, got {rate}")
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.jitter_ms = jitter_ms
+        self.max_concurrency = max_concurrency
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.rng = random.Random(seed)
+        self._slots = None
+        self.requests_total = 0
+        self.requests_running = 0
+        self.requests_waiting = 0
+        self.tokens_total = 0
+        self.queue_seconds_total = 0.0
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/generate_stream', self._tgi)
+        app.router.add_post('/api/generate', self._ollama)
+        app.router.add_post('/completion', self._llamacpp)
+        app.router.add_post('/v1/completions', self._vllm)
+        app.router.add_post('/v1/chat/completions', self._chat)
+        app.router.add_get('/metrics', self._metrics)
+        return app
+
+    def _delay(self, base_ms: float) -> float:
+        jitter = self.rng.gauss(0.0, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, base_ms + jitter) / 1000
+
+    async def _stream(self, request: web.Request, max_tokens: int, content_type: str, encode_token, trailer=b""):
+        """Queue for a slot, then stream max_tokens tokens encoded by encode_token(index, word, last)."""
+        if self._slots is None and self.max_concurrency > 0:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        self.requests_total += 1
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return web.Response(status=503, text="Injected failure")
+        stall_at = max_tokens // 2 if self.stall_rate and self.rng.random() < self.stall_rate else None
+        queued_at = time.perf_counter()
+        try:
+            self.requests_waiting += 1
+            if self._slots:
+                await self._slots.acquire()
+        finally:
+            # Also when the client disconnects while queued
+            self.requests_waiting -= 1
+            self.queue_seconds_total += time.perf_counter() - queued_at
+        self.requests_running += 1
+        try:
+            response = web.StreamResponse(headers={'Content-Type': content_type})
+            await response.prepare(request)
+            await asyncio.sleep(self._delay(self.ttft_ms))
+            for i in range(max_tokens):
+                if i:
+                    await asyncio.sleep(self._delay(1000 / self.tokens_per_second))
+                if i == stall_at:
+                    await asyncio.sleep(self.stall_ms / 1000)
+                await response.write(encode_token(i, " " + _WORDS[i % len(_WORDS)], i == max_tokens - 1))
+                self.tokens_total += 1
+            if trailer:
+                await response.write(trailer)
+            await response.write_eof()
+            return response
+        except ConnectionResetError:
+            # The client gave up on the request, e.g. on a timeout during a stall
+            return response
+        finally:
+            self.requests_running -= 1
+            if self._slots:
+                self._slots.release()
+
+    @staticmethod
+    def _sse(event: dict) -> bytes:
+        return f"data: {json.dumps(event)}\n\n".encode()
+
+    def _openai_trailer(self, body: dict, obj: str, model: str, max_tokens: int) -> bytes:
+        """[DONE], preceded by a usage-only chunk when the client asked for usage."""
+        trailer = b""
+        if (body.get('stream_options') or {}).get('include_usage'):
+            trailer = self._sse({"object": obj, "model": model, "choices": [],
+                                 "usage": {"completion_tokens": max_tokens}})
+        return trailer + b"data: [DONE]\n\n"
+
+    async def _tgi(self, request):
+        body = await request.json()
+        max_tokens = int(body.get('parameters', {}).get('max_new_tokens', 20))
+        return await self._stream(request, max_tokens, 'text/event-stream', lambda i, word, last: self._sse(
+            {"token": {"id": i, "text": word, "special": False},
+             "details": {"finish_reason": "length", "generated_tokens": max_tokens} if last else None}))
+
+    async def _ollama(self, request):
+        body = await request.json()
+        max_tokens = int(body.get('options', {}).get('num_predict', 128))
+        model = body.get('model')
+
+        def encode(i, word, last):
+            chunk = json.dumps({"model": model, "response": word, "done": False}) + "\n"
+            if last:
+                chunk += json.dumps({"model": model, "response": "", "done": True, "eval_count": max_tokens}) + "\n"
+            return chunk.encode()
+
+        return await self._stream(request, max_tokens, 'application/x-ndjson', encode)
+
+    async def _llamacpp(self, request):
+        body = await request.json()
+        max_tokens = int(body.get('n_predict', 128))
+        return await self._stream(request, max_tokens, 'text/event-stream', lambda i, word, last: self._sse(
+            {"content": word, "stop": last, **({"tokens_predicted": max_tokens} if last else {})}))
+
+    async def _vllm(self, request):
+        body = await request.json()
+        max_tokens = int(body.get('max_tokens', 16))
+        model = body.get('model')
+        return await self._stream(request, max_tokens, 'text/event-stream', lambda i, word, last: self._sse(
+            {"object": "text_completion", "model": model,
+             "choices": [{"index": 0, "text": word, "finish_reason": "length" if last else None}]}),
+            trailer=self._openai_trailer(body, "text_completion", model, max_tokens))
+
+    async def _chat(self, request):
+        body = await request.json()
+        max_tokens = int(body.get('max_tokens', 16))
+        model = body.get('model')
+
+        def encode(i, word, last):
+            chunk = b""
+            if i == 0:
+                # OpenAI-compatible servers announce the role in a first, content-free chunk
+                chunk = self._sse({"object": "chat.completion.chunk", "model": model,
+                                   "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]})
+            return chunk + self._sse({"object": "chat.completion.chunk", "model": model,
+                                      "choices": [{"index": 0, "delta": {"content": word},
+                                                   "finish_reason": "length" if last else None}]})
+
+        return await self._stream(request, max_tokens, 'text/event-stream', encode,
+                                  trailer=self._openai_trailer(body, "chat.completion.chunk", model, max_tokens))
+
+    async def _metrics(self, request):
+        lines = [
+            f"mock_requests_total {self.requests_total}",
+            f"mock_requests_running {self.requests_running}",
+            f"mock_requests_waiting {self.requests_waiting}",
+            f"mock_generated_tokens_total {self.tokens_total}",
+            f"mock_queue_seconds_total {self.queue_seconds_total:.6f}",
+            f"mock_ttft_ms {self.ttft_ms}",
+            f"mock_tokens_per_second {self.tokens_per_second}",
+        ]
+        return web.Response(text="\n".join(lines) + "\n", content_type='text/plain')
+
+
+def run_mock_server(host: str = "127.0.0.1", port: int = 8000, **settings):
+    server = MockInferenceServer(**settings)
+    web.run_app(server.build_app(), host=host, port=port)
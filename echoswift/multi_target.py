@@ -0,0 +1,111 @@
+"""
+Side-by-side benchmarking of several endpoints.
+
+Every target gets its own ``EchoSwift`` benchmark (and so its own load engine
+and user pool) writing to ``out_dir/<target name>``. Cells are run in
+lockstep: each cell is started on all targets at once and the next cell
+begins when every target has finished, so all endpoints see the same
+conditions. Targets share the prompt seed, so they receive identical
+prompt sequences. The averaged results are combined into
+``out_dir/comparison.csv``.
+"""
+import logging
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from echoswift.llm_inference_benchmark import EchoSwift
+
+COMPARISON_FILE = "comparison.csv"
+TARGET_KEYS = ("name", "base_url", "inference_server", "model", "metrics_url")
+CELL_COLUMNS = ["users", "input tokens", "output tokens", "request rate"]
+
+
+def target_name(target: dict) -> str:
+    """Directory-safe target name; defaults to the server and host of its URL."""
+    name = target.get("name") or f"{target['inference_server']}_{target['base_url'].split('//')[-1].split('/')[0]}"
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+
+
+class MultiTargetBenchmark:
+    def __init__(self, output_dir, benchmarks: Dict[str, EchoSwift]):
+        if not benchmarks:
+            raise ValueError("At least one target is required")
+        self.output_dir = Path(output_dir)
+        self.benchmarks = benchmarks
+        seeds = {b.seed for b in benchmarks.values()}
+        if len(seeds) != 1 or None in seeds:
+            raise ValueError("All targets must share a prompt seed to receive identical prompts")
+
+    @classmethod
+    def from_targets(cls, output_dir, targets: List[dict], seed: int = None, **settings) -> "MultiTargetBenchmark":
+        """
+        Build one benchmark per target dict (name, base_url, inference_server, model, metrics_url).
+        settings are the shared EchoSwift keyword arguments; a target's metrics_url
+        overrides the server_metrics URL.
+        """
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+            logging.info(f"Using prompt seed {seed} for all targets")
+        benchmarks = {}
+        for target in targets:
+            unknown = set(target) - set(TARGET_KEYS)
+            if unknown:
+                raise ValueError(f"Unknown target keys {sorted(unknown)}. Expected: {', '.join(TARGET_KEYS)}")
+            name = target_name(target)
+            if name in benchmarks:
+                raise ValueError(f"Duplicate target name '{name}'")
+            target_settings = dict(settings)
+            if target.get("metrics_url"):
+                target_settings["server_metrics"] = {**(settings.get("server_metrics") or {}),
+                                                     "url": target["metrics_url"]}
+            benchmarks[name] = EchoSwift(Path(output_dir) / name, target["base_url"], target["inference_server"],
+                                         target.get("model"), seed=seed, **target_settings)
+        return cls(output_dir, benchmarks)
+
+    def run_benchmark(self) -> pd.DataFrame:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        benchmarks = list(self.benchmarks.values())
+        started = []
+        try:
+            for benchmark in benchmarks:
+                benchmark.start()
+                started.append(benchmark)
+
+            with ThreadPoolExecutor(max_workers=len(benchmarks), thread_name_prefix="target") as pool:
+                for users, input_token, cells in benchmarks[0].sweep():
+                    for output_token, rate in cells:
+                        logging.info(f"Running users={users}, input_tokens={input_token}, output_tokens={output_token} "
+                                     f"on {len(benchmarks)} targets")
+                        # list() re-raises the first failure once every target has finished the cell
+                        list(pool.map(lambda b: b.run_cell(users, input_token, output_token, rate), benchmarks))
+                    for benchmark in benchmarks:
+                        benchmark.finish_input_tokens(users, input_token)
+        finally:
+            for benchmark in started:
+                benchmark.close()
+
+        return self.write_comparison()
+
+    def write_comparison(self) -> pd.DataFrame:
+        """Combine every target's averaged results into one table, one row per cell and target."""
+        frames = []
+        for name, benchmark in self.benchmarks.items():
+            for users, input_token, _ in benchmark.sweep():
+                avg_file = benchmark.output_dir / f"{users}_User" / f"avg_{benchmark.result_name(input_token)}.csv"
+                if avg_file.exists():
+                    frames.append(pd.read_csv(avg_file).assign(target=name))
+        if not frames:
+            logging.warning("No averaged results to compare")
+            return pd.DataFrame()
+
+        comparison = pd.concat(frames, ignore_index=True)
+        cell = [c for c in CELL_COLUMNS if c in comparison.columns]
+        comparison = comparison[cell + ['target'] + [c for c in comparison.columns if c not in cell + ['target']]]
+        comparison = comparison.sort_values(cell + ['target'], kind='stable')
+        comparison.to_csv(self.output_dir / COMPARISON_FILE, index=False, float_format='%.3f')
+        return comparison
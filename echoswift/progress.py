@@ -0,0 +1,158 @@
+"""
+Live benchmark progress.
+
+Load generators report every finished request to a ``ProgressTracker``:
+the async engine calls it directly, Locust processes write one small JSON
+line per request to a dedicated pipe (``PROGRESS_FD``) instead of the
+orchestrator scraping their log output. Trackers keep completed/failed
+counts and a rolling window of TTFT and throughput, which drive the tqdm
+bar and, when enabled, a Prometheus-style ``/metrics`` endpoint.
+"""
+import json
+import logging
+import os
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from echoswift.utils.itl import percentile
+
+_trackers: Dict[str, "ProgressTracker"] = {}
+_trackers_lock = threading.Lock()
+_metrics_server = None
+
+
+class ProgressTracker:
+    def __init__(self, target: str, window: int = 200):
+        self.target = target
+        self._lock = threading.Lock()
+        self._ttft = deque(maxlen=window)
+        self._throughput = deque(maxlen=window)
+        self.completed = 0
+        self.failed = 0
+        self.cell = {}
+
+    def start_cell(self, users: int, input_tokens: int, output_tokens: int, request_rate: float = None):
+        with self._lock:
+            self.cell = {"users": users, "input_tokens": input_tokens, "output_tokens": output_tokens,
+                         "request_rate": "" if request_rate is None else request_rate}
+            self._ttft.clear()
+            self._throughput.clear()
+
+    def record(self, ttft_ms: float, throughput: float):
+        with self._lock:
+            self.completed += 1
+            self._ttft.append(ttft_ms)
+            self._throughput.append(throughput)
+
+    def record_failure(self, count: int = 1):
+        with self._lock:
+            self.failed += count
+
+    def record_message(self, message: dict) -> bool:
+        """Apply one progress message from a Locust process; returns True for a completed request."""
+        if message.get("failed"):
+            self.record_failure(message["failed"])
+            return False
+        self.record(message["ttft_ms"], message["throughput"])
+        return True
+
+    def rolling(self) -> dict:
+        with self._lock:
+            ttft = sorted(self._ttft)
+            throughput = list(self._throughput)
+        if not ttft:
+            return {}
+        return {
+            "ttft_p50": percentile(ttft, 50),
+            "ttft_p90": percentile(ttft, 90),
+            "ttft_p99": percentile(ttft, 99),
+            "throughput": sum(throughput) / len(throughput),
+        }
+
+    def postfix(self) -> dict:
+        """Short summary for the tqdm bar."""
+        stats = self.rolling()
+        postfix = {"failed": self.failed}
+        if stats:
+            postfix.update(ttft=f"{stats['ttft_p50']:.0f}ms", tok_s=f"{stats['throughput']:.1f}")
+        return postfix
+
+    def metrics_lines(self) -> List[str]:
+        labels = f'target="{self.target}"'
+        lines = [
+            f"echoswift_requests_completed_total{{{labels}}} {self.completed}",
+            f"echoswift_requests_failed_total{{{labels}}} {self.failed}",
+        ]
+        if self.cell:
+            cell_labels = ",".join(f'{k}="{v}"' for k, v in self.cell.items())
+            lines.append(f"echoswift_cell_info{{{labels},{cell_labels}}} 1")
+        stats = self.rolling()
+        if stats:
+            for q in ("50", "90", "99"):
+                lines.append(f'echoswift_ttft_ms{{{labels},quantile="0.{q}"}} {stats["ttft_p" + q]:.3f}')
+            lines.append(f"echoswift_throughput_tokens_per_second{{{labels}}} {stats['throughput']:.3f}")
+        return lines
+
+
+def register_tracker(tracker: ProgressTracker):
+    with _trackers_lock:
+        _trackers[tracker.target] = tracker
+
+
+def render_metrics() -> str:
+    with _trackers_lock:
+        trackers = list(_trackers.values())
+    lines = [
+        "# TYPE echoswift_requests_completed_total counter",
+        "# TYPE echoswift_requests_failed_total counter",
+        "# TYPE echoswift_ttft_ms summary",
+        "# TYPE echoswift_throughput_tokens_per_second gauge",
+    ]
+    for tracker in trackers:
+        lines.extend(tracker.metrics_lines())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serve /metrics for every registered tracker; started once per process."""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, name="MetricsServer", daemon=True).start()
+        logging.info(f"Serving live benchmark metrics on http://{host}:{port}/metrics")
+    return _metrics_server
+
+
+def progress_writer():
+    """Return a function writing progress messages to the PROGRESS_FD pipe, or None when not set."""
+    fd = os.environ.get("PROGRESS_FD")
+    if not fd:
+        return None
+    fd = int(fd)
+
+    def write(**message):
+        try:
+            # Lines are far below PIPE_BUF, so each write is atomic
+            os.write(fd, (json.dumps(message) + "\n").encode())
+        except OSError:
+            pass
+
+    return write
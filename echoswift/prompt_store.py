@@ -0,0 +1,136 @@
+"""
+Shared, load-once prompt store for the prompt datasets.
+
+For every ``Dataset_{N}.csv`` the store keeps all prompts as one UTF-8 byte
+buffer plus the offset of each prompt in it, as ``.npy`` arrays under
+``<dataset dir>/.prompt_store/``. Load workers memory-map the arrays instead
+of parsing the CSV, so the operating system keeps a single copy of the
+prompts in its page cache for every process on the host, and a process
+maps each dataset once (see ``shared_prompt_store``) however many users it
+spawns. A prompt is decoded only when it is sent.
+"""
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from echoswift.token_index import read_prompts, write_atomically
+
+STORE_DIR_NAME = ".prompt_store"
+STORE_VERSION = 1
+
+_stores: Dict[str, "PromptStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class PromptStore(Sequence):
+    """The prompts of one dataset file: prompt i is buffer[offsets[i]:offsets[i + 1]], decoded on access."""
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, meta: dict = None):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Prompt {i} out of range for {len(self)} prompts")
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """UTF-8 length in bytes of every prompt."""
+        return np.diff(self.offsets)
+
+
+def _paths(dataset_file: Path) -> dict:
+    directory = Path(dataset_file).parent / STORE_DIR_NAME
+    stem = Path(dataset_file).stem
+    return {
+        "meta": directory / f"{stem}.meta.json",
+        "buffer": directory / f"{stem}.prompts.npy",
+        "offsets": directory / f"{stem}.offsets.npy",
+    }
+
+
+def _dataset_stat(dataset_file: Path) -> dict:
+    stat = Path(dataset_file).stat()
+    return {"dataset_size": stat.st_size, "dataset_mtime_ns": stat.st_mtime_ns}
+
+
+def build_prompt_store(dataset_file) -> PromptStore:
+    """Parse dataset_file once and write its prompt store."""
+    dataset_file = Path(dataset_file)
+    paths = _paths(dataset_file)
+    paths["meta"].parent.mkdir(parents=True, exist_ok=True)
+
+    encoded = [prompt.encode("utf-8") for prompt in read_prompts(dataset_file)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(prompt) for prompt in encoded], out=offsets[1:])
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    # Replaced atomically, the metadata last, so concurrent builders never expose a half-written store
+    write_atomically(paths["buffer"], lambda f: np.save(f, buffer))
+    write_atomically(paths["offsets"], lambda f: np.save(f, offsets))
+
+    meta = {"version": STORE_VERSION, "num_prompts": len(encoded), "num_bytes": int(offsets[-1]),
+            **_dataset_stat(dataset_file)}
+    write_atomically(paths["meta"], lambda f: f.write(json.dumps(meta, indent=2).encode()))
+
+    logging.info(f"Built prompt store for {dataset_file.name} ({len(encoded)} prompts, {offsets[-1]} bytes)")
+    return PromptStore(buffer, offsets, meta)
+
+
+def load_prompt_store(dataset_file, mmap: bool = True) -> Optional[PromptStore]:
+    """
+    Memory-map the prompt store for dataset_file. Returns None when it is
+    missing or stale (the dataset changed since it was built).
+    """
+    paths = _paths(Path(dataset_file))
+    try:
+        with open(paths["meta"], 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if meta.get("version") != STORE_VERSION:
+        return None
+    if any(meta.get(k) != v for k, v in _dataset_stat(dataset_file).items()):
+        return None
+
+    # An empty array cannot be memory-mapped
+    mmap_mode = 'r' if mmap and meta.get("num_bytes") else None
+    try:
+        buffer = np.load(paths["buffer"], mmap_mode=mmap_mode)
+        offsets = np.load(paths["offsets"], mmap_mode='r' if mmap else None)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if len(offsets) != meta.get("num_prompts") + 1 or len(buffer) != offsets[-1]:
+        return None
+    return PromptStore(buffer, offsets, meta)
+
+
+def ensure_prompt_store(dataset_file) -> PromptStore:
+    """Load the prompt store for dataset_file, (re)building it if it is missing or stale."""
+    store = load_prompt_store(dataset_file)
+    if store is None:
+        store = build_prompt_store(dataset_file)
+    return store
+
+
+def shared_prompt_store(dataset_file) -> PromptStore:
+    """The process-wide prompt store of dataset_file, loaded (or built) on first use."""
+    key = str(dataset_file)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ensure_prompt_store(dataset_file)
+        return _stores[key]
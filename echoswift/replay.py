@@ -0,0 +1,179 @@
+"""
+Replay of recorded request traces.
+
+A trace is a JSONL file with one request per line: ``timestamp`` (Unix
+seconds, or an ISO 8601 string), ``input_tokens`` and ``output_tokens``, and
+optionally the original ``prompt``. Requests are re-issued open-loop at their
+recorded times relative to the first one, optionally sped up or slowed down,
+so the server sees the production burstiness instead of barrier waves.
+Requests without a prompt get the dataset prompt closest in length, or a
+synthetic prompt of exactly the recorded length.
+
+Results use the per-request schema of a benchmark cell, with each request's
+recorded lengths as target_input_tokens/target_output_tokens and its
+scheduled-vs-actual ``send_lag(ms)``. They are written to
+``out_dir/replay_<trace name>/``.
+"""
+import json
+import logging
+import random
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from echoswift.manifest import remove_results
+from echoswift.result_sink import RESULT_SUFFIXES
+from echoswift.utils.avg_locust_results import aggregate_results, load_results
+
+PROMPT_SOURCES = ("dataset", "synthetic")
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def load_trace(path) -> List[dict]:
+    """Trace requests sorted by time, each with an offset in seconds from the first request."""
+    requests = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                requests.append({
+                    "timestamp": _timestamp(entry["timestamp"]),
+                    "input_tokens": int(entry["input_tokens"]),
+                    "output_tokens": int(entry["output_tokens"]),
+                    "prompt": entry.get("prompt"),
+                })
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}:{line_number}: invalid trace entry ({e}). Expected timestamp, "
+                                 f"input_tokens and output_tokens") from None
+    if not requests:
+        raise ValueError(f"Trace {path} has no requests")
+    requests.sort(key=lambda r: r["timestamp"])
+    start = requests[0]["timestamp"]
+    for request in requests:
+        request["offset"] = request["timestamp"] - start
+    return requests
+
+
+class DatasetPrompts:
+    """Dataset prompts indexed by token count, for picking the one closest to a requested length."""
+
+    def __init__(self, engine, dataset_dir: Path, rng: random.Random):
+        self.rng = rng
+        prompts, counts = [], []
+        for dataset_file in sorted(Path(dataset_dir).glob("Dataset_*.csv")):
+            file_prompts, file_counts = engine._load_dataset(dataset_file)
+            prompts.extend(file_prompts)
+            counts.extend(int(c) for c in file_counts)
+        if not prompts:
+            raise ValueError(f"No Dataset_*.csv files in {dataset_dir}")
+        order = np.argsort(counts, kind='stable')
+        self.prompts = [prompts[i] for i in order]
+        self.counts = np.asarray(counts)[order]
+
+    def choose(self, input_tokens: int, rng: random.Random = None):
+        """(prompt, token count) closest to input_tokens; ties are broken at random."""
+        rng = rng or self.rng
+        i = int(np.searchsorted(self.counts, input_tokens))
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.counts)]
+        best = min(abs(int(self.counts[j]) - input_tokens) for j in candidates)
+        count = next(int(self.counts[j]) for j in candidates if abs(int(self.counts[j]) - input_tokens) == best)
+        lo, hi = np.searchsorted(self.counts, count, side='left'), np.searchsorted(self.counts, count, side='right')
+        j = rng.randrange(int(lo), int(hi))
+        return self.prompts[j], count
+
+    def sample(self, rng: random.Random = None):
+        """A (prompt, token count) drawn uniformly from all dataset prompts."""
+        j = (rng or self.rng).randrange(len(self.prompts))
+        return self.prompts[j], int(self.counts[j])
+
+
+class TraceReplay:
+    def __init__(self, benchmark, trace_file, speed: float = 1.0, prompts: str = "dataset",
+                 max_in_flight: int = 0, seed: int = 0):
+        if speed <= 0:
+            raise ValueError(f"Replay speed must be positive, got {speed}")
+        if prompts not in PROMPT_SOURCES:
+            raise ValueError(f"Unknown prompt source '{prompts}'. Expected one of: {', '.join(PROMPT_SOURCES)}")
+        if benchmark.workers is not None:
+            raise ValueError("Trace replay runs on a single async engine; remove \"workers\" from the config")
+        self.benchmark = benchmark
+        self.trace_file = Path(trace_file)
+        self.speed = speed
+        self.prompts = prompts
+        self.max_in_flight = max_in_flight
+        self.seed = seed
+        self.output_dir = benchmark.output_dir / f"replay_{self.trace_file.stem}"
+
+    def schedule(self, engine) -> list:
+        """ScheduledRequests for the trace, with prompts chosen or synthesized."""
+        from echoswift.async_engine import ScheduledRequest
+
+        rng = random.Random(self.seed)
+        trace = load_trace(self.trace_file)
+        needs_prompts = any(r["prompt"] is None for r in trace)
+        if needs_prompts and self.prompts == "synthetic":
+            from echoswift.synthetic import SyntheticPromptGenerator
+            generator = SyntheticPromptGenerator(engine.tokenizer, self.seed)
+        elif needs_prompts:
+            dataset = DatasetPrompts(engine, self.benchmark.dataset_dir, rng)
+
+        requests, mismatched = [], 0
+        for r in trace:
+            if r["prompt"] is not None:
+                prompt, prompt_tokens = r["prompt"], len(engine.tokenizer.encode(r["prompt"]))
+            elif self.prompts == "synthetic":
+                prompt, prompt_tokens = generator.prompt(r["input_tokens"]), r["input_tokens"]
+            else:
+                prompt, prompt_tokens = dataset.choose(r["input_tokens"])
+            if prompt_tokens != r["input_tokens"]:
+                mismatched += 1
+            requests.append(ScheduledRequest(r["offset"] / self.speed, prompt, prompt_tokens,
+                                             r["input_tokens"], r["output_tokens"]))
+        if mismatched:
+            logging.warning(f"{mismatched} of {len(requests)} prompts differ in length from the trace; "
+                            f"the actual length is in the input_tokens column")
+        return requests
+
+    def run(self) -> pd.DataFrame:
+        """Replay the trace; returns the summary, also written to summary.csv."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        output_file = self.output_dir / f"requests{RESULT_SUFFIXES[self.benchmark.result_format]}"
+        if output_file.exists():
+            logging.info(f"Replacing earlier replay results in {self.output_dir}")
+            remove_results(output_file)
+
+        engine = self.benchmark.create_async_engine(self.benchmark.output_dir / "locust_logs")
+        try:
+            requests = self.schedule(engine)
+            duration = requests[-1].offset
+            logging.info(f"Replaying {len(requests)} requests over {duration:.1f}s "
+                         f"({self.speed:g}x the recorded speed) against {self.benchmark.api_url}")
+            with tqdm(total=len(requests), desc="Replay") as pbar:
+                def on_result(row):
+                    pbar.update(1)
+
+                completed = engine.run_schedule(requests, output_file, on_result=on_result,
+                                                on_error=on_result, max_in_flight=self.max_in_flight)
+        finally:
+            engine.close()
+
+        if completed < len(requests):
+            logging.warning(f"{len(requests) - completed} of {len(requests)} replayed requests failed")
+        if not completed:
+            return pd.DataFrame()
+        # One summary for the whole replay rather than one per recorded length
+        results = load_results(output_file).drop(columns=['target_input_tokens', 'target_output_tokens'])
+        summary = aggregate_results(results).assign(**{'trace requests': len(requests), 'speed': self.speed})
+        summary.to_csv(self.output_dir / "summary.csv", index=False, float_format='%.3f')
+        return summary
@@ -0,0 +1,186 @@
+"""
+Self-contained HTML report of a benchmark run.
+
+Everything is computed from the run store (see ``echoswift.store``) with
+vectorized group-bys: a summary table per cell, per-request latency CDFs
+and metrics against the number of users, faceted by input x output tokens
+with one line per users (and target, and request rate). Figures are
+embedded as PNG data URIs, so the report is a single file to share. CDFs
+are drawn from a fixed number of quantiles per cell, so the figures cost
+the same for a thousand requests as for millions. Failed requests only
+count in the summary's error and timeout rates, not in the figures.
+"""
+import base64
+import html
+import io
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from echoswift.store import FACETS, load_run, with_cell_labels
+from echoswift.utils.avg_locust_results import aggregate_results, failed_requests
+
+REPORT_FILE = "report.html"
+CDF_METRICS = ["TTFT(ms)", "latency(ms)", "latency_per_token(ms/token)"]
+CDF_POINTS = 101
+SUMMARY_COLUMNS = ["requests", "throughput(tokens/second)", "TTFT(ms)", "TTFT(ms)_p50", "TTFT(ms)_p99",
+                   "latency(ms)_p50", "latency(ms)_p99", "latency_per_token(ms/token)", "ITL_p99_mean(ms)",
+                   "achieved rate(requests/second)", "stopped short", "error rate", "timeout rate",
+                   "new connection rate", "connect(ms)", "headers(ms)"]
+
+
+def _label_order(labels) -> List[str]:
+    return sorted(pd.unique(labels), key=lambda s: (not s.isdigit(), int(s) if s.isdigit() else 0, s))
+
+
+def _series_keys(requests: pd.DataFrame) -> List[str]:
+    """Columns that tell the lines of a facet apart."""
+    keys = [c for c in ('target', 'request_rate') if c in requests.columns and requests[c].notna().any()]
+    return keys + ['users']
+
+
+def _series_label(keys, values):
+    parts = dict(zip(keys, values))
+    words = []
+    if parts.get('target'):
+        words.append(str(parts['target']))
+    if 'users' in parts:
+        words.append(f"{int(parts['users'])} users")
+    rate = parts.get('request_rate')
+    if rate is not None and pd.notna(rate) and rate != -1:
+        words.append(f"{rate:g} req/s")
+    return ", ".join(words) or None
+
+
+def latency_cdfs(requests: pd.DataFrame, metric: str, by: List[str], points: int = CDF_POINTS) -> pd.DataFrame:
+    """Per-group CDF of metric as `points` quantiles: the by columns, `fraction` and the metric value."""
+    levels = np.linspace(0, 1, points)
+    keys = requests[by].fillna({'request_rate': -1})  # Closed-loop cells have no request rate
+    values = requests[metric].groupby([keys[c] for c in by], sort=True).quantile(levels)
+    cdfs = values.rename(metric).reset_index()
+    cdfs = cdfs.rename(columns={cdfs.columns[len(by)]: 'fraction'})
+    if 'request_rate' in by:
+        cdfs['request_rate'] = cdfs['request_rate'].where(cdfs['request_rate'] != -1)
+    return cdfs
+
+
+def _facet_grid(requests: pd.DataFrame, title: str):
+    rows, cols = _label_order(requests['input tokens']), _label_order(requests['output tokens'])
+    fig, axes = plt.subplots(len(rows), len(cols), figsize=(4 * len(cols) + 1, 3 * len(rows) + 0.6), squeeze=False)
+    fig.suptitle(title)
+    cells = {}
+    for i, input_label in enumerate(rows):
+        for j, output_label in enumerate(cols):
+            axes[i][j].set_title(f"in={input_label}, out={output_label}", fontsize=9)
+            cells[(input_label, output_label)] = axes[i][j]
+    return fig, cells
+
+
+def _figure_html(fig) -> str:
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format='png', dpi=90)
+    plt.close(fig)
+    data = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'<img src="data:image/png;base64,{data}">'
+
+
+def cdf_figure(requests: pd.DataFrame, metric: str) -> str:
+    keys = _series_keys(requests)
+    cdfs = latency_cdfs(requests, metric, FACETS + keys)
+    fig, cells = _facet_grid(requests, f"CDF of {metric} per request")
+    for (input_label, output_label, *series), curve in cdfs.groupby(FACETS + keys, sort=True, dropna=False):
+        ax = cells[(input_label, output_label)]
+        ax.plot(curve[metric], curve['fraction'], label=_series_label(keys, series))
+    for ax in cells.values():
+        ax.set_xlabel(metric, fontsize=8)
+        ax.set_ylabel("fraction of requests", fontsize=8)
+        ax.grid(alpha=0.3)
+        if ax.lines:
+            ax.legend(fontsize=7)
+    return _figure_html(fig)
+
+
+def scaling_figure(requests: pd.DataFrame) -> str:
+    """Mean throughput and p99 TTFT against users, per facet and series."""
+    keys = [k for k in _series_keys(requests) if k != 'users']
+    by = FACETS + keys + ['users']
+    grouped = requests.fillna({'request_rate': -1}).groupby(by, sort=True)
+    scaling = pd.DataFrame({'throughput': grouped['throughput(tokens/second)'].mean(),
+                            'ttft_p99': grouped['TTFT(ms)'].quantile(0.99)}).reset_index()
+
+    html_parts = []
+    for column, title in (('throughput', "Mean throughput (tokens/second) per request"), ('ttft_p99', "p99 TTFT (ms)")):
+        fig, cells = _facet_grid(requests, f"{title} vs users")
+        for (input_label, output_label, *series), line in scaling.groupby(FACETS + keys, sort=True):
+            cells[(input_label, output_label)].plot(line['users'], line[column], marker='o',
+                                                    label=_series_label(keys, series))
+        for ax in cells.values():
+            ax.set_xlabel("users", fontsize=8)
+            ax.grid(alpha=0.3)
+            if keys and ax.lines:
+                ax.legend(fontsize=7)
+        html_parts.append(_figure_html(fig))
+    return "\n".join(html_parts)
+
+
+def summary_table(requests: pd.DataFrame) -> pd.DataFrame:
+    by = ['target'] if 'target' in requests.columns else []
+    summary = aggregate_results(requests, by=by)
+    leading = [c for c in ('target', 'users', 'input tokens', 'output tokens', 'request rate') if c in summary.columns]
+    summary = summary.sort_values(leading, kind='stable')
+    for label in FACETS:
+        summary[label] = summary[label].map(lambda v: "mixed" if pd.isna(v) else int(v))
+    return summary[leading + [c for c in SUMMARY_COLUMNS if c in summary.columns]]
+
+
+def render_report(results_dir, output_file=None) -> Path:
+    """Write the HTML report of a results directory; returns its path."""
+    results_dir = Path(results_dir)
+    output_file = Path(output_file) if output_file else results_dir / REPORT_FILE
+    requests = with_cell_labels(load_run(results_dir))
+    summary = summary_table(requests.drop(columns=FACETS))
+    failed = failed_requests(requests)
+    total, requests = len(requests), requests[~failed]
+
+    sections = [f"<h2>Summary</h2>{summary.to_html(index=False, float_format=lambda v: f'{v:.3f}', na_rep='')}"]
+    sections.append("<h2>Latency distributions</h2>")
+    sections.extend(cdf_figure(requests, metric) for metric in CDF_METRICS if requests[metric].notna().any())
+    sections.append("<h2>Scaling with users</h2>")
+    sections.append(scaling_figure(requests))
+
+    span = ""
+    started = requests['start_epoch'] if 'start_epoch' in requests.columns else pd.Series(dtype=float)
+    if started.notna().any():
+        span = (f", {datetime.fromtimestamp(started.min()):%Y-%m-%d %H:%M:%S} to "
+                f"{datetime.fromtimestamp(started.max()):%Y-%m-%d %H:%M:%S}")
+    title = f"EchoSwift report: {html.escape(results_dir.resolve().name)}"
+    document = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; font-size: 0.85em; }}
+th, td {{ border: 1px solid #ccc; padding: 0.25em 0.6em; text-align: right; }}
+img {{ max-width: 100%; margin: 1em 0; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{total} requests{f" ({failed.sum()} failed)" if failed.any() else ""} in {len(summary)} cells{span}.</p>
+{"".join(sections)}
+</body>
+</html>
+"""
+    output_file.write_text(document, encoding='utf-8')
+    logging.info(f"Report written to {output_file}")
+    return output_file
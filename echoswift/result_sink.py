@@ -0,0 +1,233 @@
+"""
+Buffered, per-process sink for per-request benchmark results.
+
+Load workers hand finished rows to a ``ResultSink``; a background writer
+thread drains the queue and writes rows in batches, so file I/O never sits
+on the request path and concurrent users cannot interleave partial rows.
+Rows can be written as CSV (the default), as Parquet part files, or as raw
+binary records (used for the ITL gap dump).
+"""
+import csv
+import logging
+import os
+import queue
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+from echoswift.utils.itl import ITL_FIELDNAMES
+
+# Identify the benchmark cell a request belongs to, so results can be grouped explicitly.
+# request_rate is empty for closed-loop (barrier) cells.
+CELL_FIELDNAMES = ['users', 'target_input_tokens', 'target_output_tokens', 'request_rate']
+
+# Open-loop scheduling: send time relative to the cell start, and how late it was sent
+SCHEDULE_FIELDNAMES = ['start_offset(s)', 'send_lag(ms)']
+
+# Where output_tokens came from (server, stream_events or tokenizer), and whether the
+# server stopped before target_output_tokens, which skews throughput
+TOKEN_COUNT_FIELDNAMES = ['output_tokens_source', 'stopped_short']
+
+# Chat session workloads: conversation number within the cell and turn index (1-based)
+SESSION_FIELDNAMES = ['session', 'turn']
+
+# Load generator that sent the request; empty unless the run is distributed across workers
+WORKER_FIELDNAMES = ['host', 'worker']
+
+# Every attempt is recorded: http_status of the response (empty if none arrived), and for failed
+# requests the error class and whether it timed out. Failed rows keep the partial TTFT and output
+# tokens of a stream that was cut off, and have no throughput or latency per token.
+ERROR_FIELDNAMES = ['http_status', 'error', 'timed_out']
+
+# Connection phases (see echoswift.connections): a new or reused connection, the wait for a pooled
+# one, connect and TLS set-up times, and the time to response headers and to the first stream chunk
+CONNECTION_FIELDNAMES = ['connection', 'queue(ms)', 'connect(ms)', 'tls(ms)', 'headers(ms)', 'first_chunk(ms)',
+                         'http_version']
+
+# start_epoch is the wall-clock send time (Unix seconds), for aligning with server-side metrics
+RESULT_FIELDNAMES = [
+    'request', 'start_time', 'end_time', 'start_epoch', 'input_tokens',
+    'output_tokens', 'latency(ms)', 'throughput(tokens/second)',
+    'latency_per_token(ms/token)', 'TTFT(ms)'
+] + ITL_FIELDNAMES + CELL_FIELDNAMES + SCHEDULE_FIELDNAMES + TOKEN_COUNT_FIELDNAMES + SESSION_FIELDNAMES + WORKER_FIELDNAMES + ERROR_FIELDNAMES + CONNECTION_FIELDNAMES
+
+RESULT_FORMATS = ("csv", "parquet")
+RESULT_SUFFIXES = {"csv": ".csv", "parquet": ".parquet"}
+
+_sinks: Dict[str, "ResultSink"] = {}
+_sinks_lock = threading.Lock()
+
+
+class _CSVBackend:
+    def __init__(self, path: Path, fieldnames: List[str]):
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _BinaryBackend:
+    def __init__(self, path: Path, fieldnames=None):
+        self.file = open(path, 'ab')
+
+    def write(self, records):
+        self.file.write(b"".join(records))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Written as text to Parquet; other columns are numeric unless a value is not a number
+TEXT_FIELDNAMES = {'start_time', 'end_time', 'output_tokens_source', 'host', 'error', 'connection', 'http_version'}
+
+
+def _column_values(rows, name):
+    """(values, type alias) of one column; typed explicitly so all-empty batches keep the file's schema."""
+    values = [row.get(name) for row in rows]
+    values = [None if v == '' else v for v in values]
+    if name not in TEXT_FIELDNAMES:
+        try:
+            return [None if v is None else float(v) for v in values], "double"
+        except (TypeError, ValueError):
+            pass
+    return [None if v is None else str(v) for v in values], "string"
+
+
+class _ParquetBackend:
+    """
+    Writes one part file per process into the ``path`` directory, so several
+    processes (one per cell, or distributed workers) can add rows to the same
+    logical result set. pandas.read_parquet(path) reads all parts back.
+    """
+
+    def __init__(self, path: Path, fieldnames: List[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow. Install it with 'pip install echoswift[parquet]'.") from e
+        self.pa = pa
+        self.pq = pq
+        self.fieldnames = fieldnames
+        path.mkdir(parents=True, exist_ok=True)
+        self.part_file = path / f"part-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+        self.writer = None
+
+    def write(self, rows):
+        columns = {}
+        for name in self.fieldnames:
+            values, kind = _column_values(rows, name)
+            columns[name] = self.pa.array(values, type=self.pa.type_for_alias(kind))
+        table = self.pa.table(columns)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.part_file, table.schema)
+        elif table.schema != self.writer.schema:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+_BACKENDS = {"csv": _CSVBackend, "parquet": _ParquetBackend, "binary": _BinaryBackend}
+
+
+class ResultSink:
+    """Queue-backed result writer with an explicit flush and close."""
+
+    def __init__(self, path, fieldnames: List[str] = None, fmt: str = "csv",
+                 batch_size: int = 512, flush_interval: float = 0.5):
+        if fmt not in _BACKENDS:
+            raise ValueError(f"Unknown result format '{fmt}'. Expected one of: {', '.join(_BACKENDS)}")
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._backend = _BACKENDS[fmt](self.path, fieldnames or RESULT_FIELDNAMES)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"ResultSink({self.path.name})", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        """Queue one row (a dict, or bytes for the binary format)."""
+        if self._closed:
+            raise RuntimeError(f"Result sink for {self.path} is closed")
+        self._queue.put(row)
+
+    def flush(self):
+        """Block until every queued row has been written to disk."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._backend.close()
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+
+            if isinstance(item, (dict, bytes)):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            elif item is None:
+                return
+
+            try:
+                if batch:
+                    self._backend.write(batch)
+                    batch = []
+                if isinstance(item, threading.Event):
+                    self._backend.flush()
+            except Exception as e:
+                logging.error(f"Failed to write results to {self.path}: {e}")
+                batch = []
+            finally:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+def get_result_sink(path, fieldnames: List[str] = None, fmt: str = "csv") -> ResultSink:
+    """Return the process-wide sink for path, creating it on first use."""
+    key = str(path)
+    with _sinks_lock:
+        sink = _sinks.get(key)
+        if sink is None or sink._closed:
+            sink = _sinks[key] = ResultSink(path, fieldnames, fmt)
+        return sink
+
+
+def close_all_sinks():
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
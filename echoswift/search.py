@@ -0,0 +1,186 @@
+"""
+SLO-driven saturation search.
+
+Instead of sweeping a fixed ``user_counts`` grid, probe one (input tokens,
+output tokens) pair at increasing load: double the load until a probe breaks
+the SLOs, then bisect between the last passing and the first failing load.
+The load is the number of users in closed-loop mode, or the request rate in
+open-loop mode. Probes run on the async engine, and a probe is cut short as
+soon as enough requests have violated an SLO that its percentile can no
+longer pass.
+
+SLOs are upper bounds keyed ``<metric>_<stat>``. Metric can be ``ttft``,
+``tpot`` or ``latency``, or a result column name. Stat is a percentile
+(p50/p90/p95/p99), ``max`` or ``mean``. For example
+``{"ttft_p99": 500, "tpot_p95": 50}``.
+"""
+import logging
+import math
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from echoswift.result_sink import RESULT_SUFFIXES
+from echoswift.utils.avg_locust_results import (METRIC_ALIASES, PERCENTILES, SLO_METRICS, aggregate_results,
+                                                load_results)
+
+
+class SLO:
+    """One upper bound on a per-request latency statistic."""
+
+    def __init__(self, name: str, threshold: float):
+        metric, _, stat = name.rpartition("_")
+        metric = METRIC_ALIASES.get(metric.lower(), metric)
+        if metric not in SLO_METRICS:
+            raise ValueError(f"Unknown SLO metric in '{name}'. Expected one of: "
+                             f"{', '.join(list(METRIC_ALIASES) + list(SLO_METRICS))}")
+        if stat not in PERCENTILES and stat not in ("max", "mean"):
+            raise ValueError(f"Unknown SLO statistic in '{name}'. Expected one of: "
+                             f"{', '.join(list(PERCENTILES) + ['max', 'mean'])}")
+        self.name = name
+        self.metric = metric
+        self.stat = stat
+        self.threshold = float(threshold)
+        self.column = metric if stat == "mean" else f"{metric}_{stat}"
+
+    def violation_budget(self, total: int) -> Optional[int]:
+        """
+        Most requests out of total that may exceed the threshold before the
+        statistic is certain to fail, or None when it cannot be decided early.
+        """
+        if self.stat == "mean":
+            return None
+        if self.stat == "max":
+            return 0
+        # Once every value from the lower interpolation point upwards is too high, so is the percentile
+        return total - math.floor((total - 1) * PERCENTILES[self.stat]) - 1
+
+    def value(self, summary: pd.Series) -> float:
+        return float(summary[self.column])
+
+
+def parse_slos(slos: Dict[str, float]) -> List[SLO]:
+    if not slos:
+        raise ValueError("The search needs at least one SLO, e.g. {\"ttft_p99\": 500}")
+    return [SLO(name, threshold) for name, threshold in slos.items()]
+
+
+class SaturationSearch:
+    """Find the highest load of one token pair that still meets every SLO."""
+
+    def __init__(self, benchmark, slos: Dict[str, float], input_tokens: int, output_tokens: int,
+                 start: float = 1, max_load: float = 1024, rate_tolerance: float = 0.1, early_abort: bool = True,
+                 max_error_rate: float = 0.01):
+        self.benchmark = benchmark
+        self.slos = parse_slos(slos)
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.open_loop = benchmark.load_mode == "open"
+        # Users are whole numbers; rates are bisected until within rate_tolerance of each other
+        self.start = start if self.open_loop else max(1, int(start))
+        self.max_load = max_load
+        self.rate_tolerance = rate_tolerance
+        self.early_abort = early_abort
+        # Latency SLOs only see the requests that succeeded, so shedding load must fail a probe too
+        self.max_error_rate = max_error_rate
+        self.concurrency = max(benchmark.user_counts)
+        self.output_dir = benchmark.output_dir / f"search_{input_tokens}in_{output_tokens}out"
+        self.probes = []
+
+    def run(self) -> Optional[float]:
+        """Run the search; returns the highest passing load, or None if even the start load fails."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        logs_dir = self.benchmark.output_dir / "locust_logs"
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        engine = self.benchmark.create_async_engine(logs_dir)
+        try:
+            passed, failed = None, None
+            load = self.start
+            while load <= self.max_load:
+                if self._probe(engine, load):
+                    passed = load
+                    load *= 2
+                else:
+                    failed = load
+                    break
+
+            while passed is not None and failed is not None and self._needs_refining(passed, failed):
+                load = math.sqrt(passed * failed) if self.open_loop else (passed + failed) // 2
+                if self._probe(engine, load):
+                    passed = load
+                else:
+                    failed = load
+        finally:
+            engine.close()
+
+        self._write_summary()
+        dimension = "request rate" if self.open_loop else "users"
+        if passed is None:
+            logging.warning(f"No probed load met the SLOs; the lowest {dimension} tried was {self.start}")
+        elif failed is None:
+            logging.info(f"All SLOs met up to the search limit: {dimension}={passed}")
+        else:
+            logging.info(f"Highest load meeting the SLOs: {dimension}={passed} (fails at {failed})")
+        return passed
+
+    def _needs_refining(self, passed, failed) -> bool:
+        if self.open_loop:
+            return failed / passed > 1 + self.rate_tolerance
+        return failed - passed > 1
+
+    def _probe(self, engine, load) -> bool:
+        users = self.concurrency if self.open_loop else load
+        request_rate = load if self.open_loop else None
+        total = users * self.benchmark.max_requests
+        label = f"rate_{load:g}" if self.open_loop else f"users_{load}"
+        output_file = self.output_dir / f"probe_{label}{RESULT_SUFFIXES[self.benchmark.result_format]}"
+
+        # Start every probe from an empty result file
+        if output_file.is_dir():
+            shutil.rmtree(output_file)
+        elif output_file.exists():
+            output_file.unlink()
+
+        budgets = {slo.name: slo.violation_budget(total) for slo in self.slos}
+        violations = {slo.name: 0 for slo in self.slos}
+
+        def on_result(row):
+            if not self.early_abort:
+                return False
+            for slo in self.slos:
+                if budgets[slo.name] is not None and float(row[slo.metric]) > slo.threshold:
+                    violations[slo.name] += 1
+                    if violations[slo.name] > budgets[slo.name]:
+                        return True
+            return False
+
+        logging.info(f"Probing {label.replace('_', '=')} (input_tokens={self.input_tokens}, "
+                     f"output_tokens={self.output_tokens})")
+        completed = engine.run_cell(users, self.input_tokens, self.output_tokens,
+                                    self.benchmark.dataset_dir / f"Dataset_{self.input_tokens}.csv", output_file,
+                                    on_result=on_result, request_rate=request_rate, arrival=self.benchmark.arrival)
+
+        probe = {"load": load, "users": users, "requests": completed}
+        aborted = any(violations[name] > budget for name, budget in budgets.items() if budget is not None)
+        if completed == 0:
+            passed = False
+        else:
+            summary = aggregate_results(load_results(output_file)).iloc[0]
+            for slo in self.slos:
+                probe[slo.name] = slo.value(summary)
+            probe["error rate"] = summary.get("error rate", 0.0)
+            passed = (not aborted and probe["error rate"] <= self.max_error_rate and
+                      all(probe[slo.name] <= slo.threshold for slo in self.slos))
+        probe.update(aborted=aborted, passed=passed)
+        self.probes.append(probe)
+
+        outcome = "aborted" if aborted else ("passed" if passed else "failed")
+        logging.info(f"Probe {label.replace('_', '=')} {outcome} after {completed} of {total} requests")
+        return passed
+
+    def _write_summary(self) -> Path:
+        path = self.output_dir / "search_summary.csv"
+        pd.DataFrame(self.probes).to_csv(path, index=False, float_format='%.3f')
+        return path
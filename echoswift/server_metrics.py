@@ -0,0 +1,146 @@
+"""
+Server-side metrics sampled alongside client-side timings.
+
+While a cell runs, a ``MetricsPoller`` thread scrapes the server's Prometheus
+``/metrics`` endpoint at a fixed interval and keeps the selected gauges as
+a time series. Series with the same name but different labels (e.g. one
+per model) are summed. The samples are written next to the cell's results,
+and ``join_server_metrics`` attaches the latest sample taken before each
+request was sent, so client timings such as TTFT can be read against queue
+depth, running batch size or KV-cache usage.
+"""
+import logging
+import re
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+# Gauges that explain queueing and batching, for the servers that expose them
+DEFAULT_SERVER_METRICS = [
+    # vLLM
+    "vllm:num_requests_running",
+    "vllm:num_requests_waiting",
+    "vllm:gpu_cache_usage_perc",
+    "vllm:kv_cache_usage_perc",
+    "vllm:num_preemptions_total",
+    # TGI
+    "tgi_queue_size",
+    "tgi_batch_current_size",
+    "tgi_batch_current_max_tokens",
+    # echoswift mock-server
+    "mock_requests_running",
+    "mock_requests_waiting",
+]
+SERVER_METRICS_SUFFIX = ".server_metrics.csv"
+
+_SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{[^}]*\})?\s+(\S+)')
+
+
+def parse_prometheus(text: str, names: List[str] = None) -> Dict[str, float]:
+    """Values of the named metrics in a Prometheus text exposition, summed over labels."""
+    wanted = set(names) if names else None
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_LINE.match(line)
+        if not match:
+            continue
+        name, value = match.groups()
+        if wanted is not None and name not in wanted:
+            continue
+        try:
+            values[name] = values.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return values
+
+
+class MetricsPoller:
+    """Background scraper for one metrics URL; use as a context manager around a cell."""
+
+    def __init__(self, url: str, interval: float = 1.0, metrics: List[str] = None, timeout: float = None):
+        if interval <= 0:
+            raise ValueError(f"Server metrics interval must be positive, got {interval}")
+        self.url = url
+        self.interval = interval
+        self.metrics = metrics or DEFAULT_SERVER_METRICS
+        self.timeout = timeout or max(interval, 1.0)
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._errors = 0
+
+    def __enter__(self):
+        self.samples = []
+        self._errors = 0
+        self._stop.clear()
+        # A baseline sample before the cell sends anything, so every request has one to join with
+        self._scrape()
+        self._thread = threading.Thread(target=self._run, name="MetricsPoller", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        # One last sample so the tail of the cell is covered
+        self._scrape()
+        if self._errors:
+            logging.warning(f"{self._errors} scrapes of {self.url} failed")
+        return False
+
+    def _run(self):
+        next_scrape = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_scrape - time.monotonic())):
+            self._scrape()
+            next_scrape += self.interval
+
+    def _scrape(self):
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+                text = response.read().decode('utf-8', errors='replace')
+        except (OSError, ValueError) as e:
+            self._errors += 1
+            logging.debug(f"Failed to scrape {self.url}: {e}")
+            return
+        self.samples.append({'timestamp': time.time(), **parse_prometheus(text, self.metrics)})
+
+    def write(self, path: Path, cell: dict = None) -> pd.DataFrame:
+        """Write the samples (tagged with the cell columns) as CSV."""
+        samples = pd.DataFrame(self.samples)
+        if cell:
+            samples = samples.assign(**cell)
+        samples.to_csv(path, index=False, float_format='%.6f')
+        return samples
+
+
+def server_metrics_file(cell_file: Path) -> Path:
+    return cell_file.with_name(cell_file.stem + SERVER_METRICS_SUFFIX)
+
+
+def join_server_metrics(results: pd.DataFrame, samples: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attach to every request the latest server sample taken at or before it
+    was sent (start_epoch), matching samples of the same cell only.
+    """
+    keys = [c for c in ('users', 'target_input_tokens', 'target_output_tokens', 'request_rate')
+            if c in results.columns and c in samples.columns]
+    results = results.copy()
+    samples = samples.copy()
+    for frame in (results, samples):
+        for key in keys:
+            frame[key] = pd.to_numeric(frame[key], errors='coerce').fillna(-1)
+    results['start_epoch'] = pd.to_numeric(results['start_epoch'], errors='coerce')
+    results = results.dropna(subset=['start_epoch']).sort_values('start_epoch')
+    samples = samples.rename(columns={'timestamp': 'server_timestamp'}).sort_values('server_timestamp')
+
+    joined = pd.merge_asof(results, samples, left_on='start_epoch', right_on='server_timestamp',
+                           by=keys or None, direction='backward')
+    for key in keys:
+        joined[key] = joined[key].where(joined[key] != -1)
+    return joined
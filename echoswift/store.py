@@ -0,0 +1,127 @@
+"""
+Consolidated per-request store of a benchmark run.
+
+Every per-request result file of a results directory (one per users and
+input tokens, or mixed lengths, per target) is gathered into a single
+``requests.parquet`` at the top of the directory, with numeric metric
+columns, a ``target`` column for multi-target runs and the ``source`` file
+each row came from. Reports and plots read this one columnar file instead of
+re-parsing CSVs, and compute everything with vectorized group-bys, so they
+stay fast with millions of requests.
+"""
+import logging
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+import pandas as pd
+
+from echoswift.result_sink import CELL_FIELDNAMES, SCHEDULE_FIELDNAMES, SESSION_FIELDNAMES
+from echoswift.utils.avg_locust_results import MEAN_COLUMNS, PHASE_COLUMNS, load_results
+from echoswift.utils.itl import ITL_FIELDNAMES
+
+RUN_STORE = "requests.parquet"
+MIXED_SOURCE = "mixed_lengths"
+FACETS = ["input tokens", "output tokens"]
+NUMERIC_COLUMNS = (CELL_FIELDNAMES + MEAN_COLUMNS + ITL_FIELDNAMES + SCHEDULE_FIELDNAMES + SESSION_FIELDNAMES + PHASE_COLUMNS +
+                   ['start_epoch', 'input_tokens', 'output_tokens', 'stopped_short', 'request', 'worker',
+                    'http_status', 'timed_out'])
+
+_RESULT_FILE = re.compile(r"^(\d+_input_tokens|mixed_lengths)\.(csv|parquet)$")
+
+
+def result_files(results_dir) -> List[Tuple[str, Path]]:
+    """(target, path) of every per-request result file; target is '' for single-target runs."""
+    results_dir = Path(results_dir)
+    files = []
+    for user_dir in sorted(results_dir.rglob("*_User")):
+        if not user_dir.is_dir() or "cells" in user_dir.relative_to(results_dir).parts:
+            continue
+        target = user_dir.parent.relative_to(results_dir).as_posix()
+        for path in sorted(user_dir.iterdir()):
+            if _RESULT_FILE.match(path.name):
+                files.append(("" if target == "." else target, path))
+    return files
+
+
+def collect_results(results_dir) -> pd.DataFrame:
+    """All per-request rows of a results directory in one frame."""
+    results_dir = Path(results_dir)
+    frames = []
+    for target, path in result_files(results_dir):
+        try:
+            df = load_results(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Skipping unreadable results {path}: {e}")
+            continue
+        if df.empty:
+            continue
+        frames.append(df.assign(target=target, source=path.relative_to(results_dir).as_posix()))
+    if not frames:
+        raise ValueError(f"No per-request results found in {results_dir}")
+
+    requests = pd.concat(frames, ignore_index=True)
+    for column in NUMERIC_COLUMNS:
+        if column in requests.columns:
+            requests[column] = pd.to_numeric(requests[column], errors='coerce')
+    if not requests['target'].astype(bool).any():
+        requests = requests.drop(columns=['target'])
+    return requests
+
+
+def _latest_change(results_dir: Path) -> float:
+    latest = 0.0
+    for _, path in result_files(results_dir):
+        latest = max(latest, path.stat().st_mtime)
+        if path.is_dir():
+            latest = max([latest] + [part.stat().st_mtime for part in path.iterdir()])
+    return latest
+
+
+def build_store(results_dir) -> Path:
+    """Write (or rewrite) the run's requests.parquet; requires pyarrow."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The run store requires pyarrow. Install it with 'pip install echoswift[parquet]'.") from e
+    results_dir = Path(results_dir)
+    requests = collect_results(results_dir)
+    store = results_dir / RUN_STORE
+    # Mixed str/NaN columns (e.g. host) become nullable strings rather than failing the conversion
+    for column in requests.columns[requests.dtypes == object]:
+        requests[column] = requests[column].astype("string")
+    requests.to_parquet(store, index=False)
+    logging.info(f"Wrote {len(requests)} requests to {store}")
+    return store
+
+
+def with_cell_labels(requests: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add "input tokens"/"output tokens" facet labels, with "mixed" for the
+    rows of mixed-length cells, whose target columns are per request and
+    are blanked so that each mixed cell groups as one.
+    """
+    requests = requests.copy()
+    mixed = (requests['source'].str.contains(MIXED_SOURCE, regex=False).fillna(False).astype(bool)
+             if 'source' in requests.columns else pd.Series(False, index=requests.index))
+    for column, label in (('target_input_tokens', 'input tokens'), ('target_output_tokens', 'output tokens')):
+        requests[label] = requests[column].astype('Int64').astype(str).where(~mixed, "mixed")
+        requests[column] = requests[column].where(~mixed)
+    return requests
+
+
+def load_run(results_dir) -> pd.DataFrame:
+    """
+    Per-request rows of a run, from requests.parquet. The store is built
+    first if it is missing or older than any result file; without pyarrow
+    the rows are collected in memory instead.
+    """
+    results_dir = Path(results_dir)
+    store = results_dir / RUN_STORE
+    if not store.exists() or store.stat().st_mtime < _latest_change(results_dir):
+        try:
+            build_store(results_dir)
+        except ImportError as e:
+            logging.warning(f"{e} Reading the result files directly.")
+            return collect_results(results_dir)
+    return pd.read_parquet(store)
@@ -0,0 +1,290 @@
+"""
+Streaming response parsing shared by the Locust and async engines.
+
+Each inference server is described by a registered ``ServerAdapter`` that
+knows how to build the request body and where the generated text lives in
+a decoded stream event, and where the server reports how many tokens it
+generated. ``StreamCollector`` holds the per-request state: it decodes SSE
+or NDJSON framing once per line, timestamps token events and assembles the
+output with a list join (or only counts tokens).
+
+Output token counts come from the server's usage report when there is one,
+otherwise from the number of streamed token events for servers that send
+one event per token; only the rest need the text re-tokenized.
+
+Both engines apply the same connect, read and total request timeouts, see
+``request_timeouts``.
+"""
+import json
+import logging
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple, Type
+
+SSE = "sse"
+NDJSON = "ndjson"
+
+_SSE_DATA = b"data:"
+_SSE_DONE = b"[DONE]"
+
+# Where a row's output token count came from
+SERVER_USAGE = "server"
+STREAM_EVENTS = "stream_events"
+TOKENIZER = "tokenizer"
+
+# Error class recorded for a response that ended without any generated text
+EMPTY_STREAM = "EmptyStream"
+
+# Seconds; None is no limit. read bounds the wait for each chunk, so a stalled stream fails
+DEFAULT_TIMEOUTS = {"connect": 30.0, "read": 300.0, "total": None}
+
+ADAPTERS: Dict[str, "ServerAdapter"] = {}
+
+
+def register_adapter(cls: Type["ServerAdapter"]) -> Type["ServerAdapter"]:
+    """Class decorator registering an adapter under its ``name``."""
+    ADAPTERS[cls.name] = cls()
+    return cls
+
+
+def get_adapter(inference_server: str) -> "ServerAdapter":
+    try:
+        return ADAPTERS[inference_server]
+    except KeyError:
+        raise ValueError(f"Unsupported inference server: {inference_server}. "
+                         f"Expected one of: {', '.join(ADAPTERS)}") from None
+
+
+def request_timeouts(timeouts: dict = None) -> Dict[str, Optional[float]]:
+    """Connect, read and total timeouts in seconds, with DEFAULT_TIMEOUTS for the ones not given."""
+    timeouts = timeouts or {}
+    unknown = set(timeouts) - set(DEFAULT_TIMEOUTS)
+    if unknown:
+        raise ValueError(f"Unknown timeouts {', '.join(sorted(unknown))}. Expected: {', '.join(DEFAULT_TIMEOUTS)}")
+    resolved = {}
+    for kind, seconds in {**DEFAULT_TIMEOUTS, **timeouts}.items():
+        if seconds is not None and float(seconds) <= 0:
+            raise ValueError(f"The {kind} timeout must be a positive number of seconds or null, got {seconds}")
+        resolved[kind] = float(seconds) if seconds is not None else None
+    return resolved
+
+
+def render_transcript(messages: List[dict]) -> str:
+    """Plain-text transcript of a conversation, ending with the assistant's turn."""
+    lines = [f"{m['role'].capitalize()}: {m['content']}" for m in messages]
+    return "\n".join(lines + ["Assistant:"])
+
+
+class ServerAdapter:
+    """Request format and stream event layout of one inference server."""
+
+    name: str = None
+    framing: str = SSE
+    requires_model: bool = False
+    # Every event carrying text is exactly one generated token
+    events_are_tokens: bool = False
+
+    def build_payload(self, prompt: str, max_new_tokens: int, model_name: str = None) -> dict:
+        raise NotImplementedError
+
+    def build_chat_payload(self, messages: List[dict], max_new_tokens: int, model_name: str = None) -> dict:
+        """Request body for a conversation; completion APIs get the history rendered as a transcript."""
+        return self.build_payload(render_transcript(messages), max_new_tokens, model_name)
+
+    def extract_token(self, event: dict) -> Optional[str]:
+        """Generated text carried by one decoded event, or None."""
+        raise NotImplementedError
+
+    def extract_usage(self, event: dict) -> Optional[int]:
+        """Number of generated tokens reported by the server in this event, or None."""
+        return None
+
+
+@register_adapter
+class TGIAdapter(ServerAdapter):
+    name = "TGI"
+    events_are_tokens = True
+
+    def build_payload(self, prompt, max_new_tokens, model_name=None):
+        return {'inputs': prompt, 'parameters': {'max_new_tokens': max_new_tokens, 'details': True}}
+
+    def extract_token(self, event):
+        return event["token"]["text"]
+
+    def extract_usage(self, event):
+        return (event.get("details") or {}).get("generated_tokens")
+
+
+@register_adapter
+class OllamaAdapter(ServerAdapter):
+    name = "Ollama"
+    framing = NDJSON
+    requires_model = True
+    events_are_tokens = True
+
+    def build_payload(self, prompt, max_new_tokens, model_name=None):
+        return {
+            "model": model_name,
+            "prompt": prompt,
+            "stream": True,
+            "options": {"num_predict": max_new_tokens}
+        }
+
+    def extract_token(self, event):
+        return event["response"]
+
+    def extract_usage(self, event):
+        return event.get("eval_count") if event.get("done") else None
+
+
+@register_adapter
+class LlamacppAdapter(ServerAdapter):
+    name = "Llamacpp"
+    events_are_tokens = True
+
+    def build_payload(self, prompt, max_new_tokens, model_name=None):
+        return {"prompt": prompt, "n_predict": max_new_tokens, "stream": True}
+
+    def extract_token(self, event):
+        return event["content"]
+
+    def extract_usage(self, event):
+        if not event.get("stop"):
+            return None
+        return event.get("tokens_predicted", (event.get("timings") or {}).get("predicted_n"))
+
+
+@register_adapter
+class VLLMAdapter(ServerAdapter):
+    name = "vLLM"
+    requires_model = True
+
+    def build_payload(self, prompt, max_new_tokens, model_name=None):
+        return {
+            "model": model_name,
+            "prompt": prompt,
+            "max_tokens": max_new_tokens,
+            "min_tokens": max_new_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+
+    def extract_token(self, event):
+        choices = event["choices"]
+        # The usage chunk at the end of the stream has no choices
+        return choices[0]["text"] if choices else None
+
+    def extract_usage(self, event):
+        return (event.get("usage") or {}).get("completion_tokens")
+
+
+@register_adapter
+class OpenAIChatAdapter(ServerAdapter):
+    name = "OpenAI"
+    requires_model = True
+
+    def build_payload(self, prompt, max_new_tokens, model_name=None):
+        return self.build_chat_payload([{"content": prompt, "role": "user"}], max_new_tokens, model_name)
+
+    def build_chat_payload(self, messages, max_new_tokens, model_name=None):
+        return {
+            "messages": messages,
+            "model": model_name,
+            "max_tokens": max_new_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+
+    def extract_token(self, event):
+        choices = event["choices"]
+        # The first chunk only announces the assistant role and usage-only chunks carry no choices
+        return choices[0]["delta"].get("content") if choices else None
+
+    def extract_usage(self, event):
+        return (event.get("usage") or {}).get("completion_tokens")
+
+
+@register_adapter
+class NIMSAdapter(OpenAIChatAdapter):
+    name = "NIMS"
+
+
+class StreamCollector:
+    """
+    Incremental parser for one streamed response.
+
+    Feed it raw lines as they arrive; ``feed`` returns True once the server
+    signals the end of the stream. TTFT is measured against this request's
+    own start time, at the first event that carries generated text;
+    first_chunk at the first non-empty line, whatever it carries.
+    """
+
+    __slots__ = ("adapter", "start_time", "keep_text", "ttft", "first_chunk", "token_times",
+                 "token_events", "usage_tokens", "parse_errors", "_pieces")
+
+    def __init__(self, adapter: ServerAdapter, start_time: float, keep_text: bool = True):
+        self.adapter = adapter
+        self.start_time = start_time
+        self.keep_text = keep_text
+        self.ttft = None
+        self.first_chunk = None
+        self.token_times = array('d')
+        self.token_events = 0
+        self.usage_tokens = None
+        self.parse_errors = 0
+        self._pieces = []
+
+    def feed(self, line: bytes, now: float = None) -> bool:
+        line = line.strip()
+        if not line:
+            return False
+        if self.first_chunk is None:
+            self.first_chunk = (time.perf_counter() if now is None else now) - self.start_time
+
+        if self.adapter.framing == SSE:
+            if not line.startswith(_SSE_DATA):
+                return False
+            payload = line[len(_SSE_DATA):].strip()
+            if payload == _SSE_DONE:
+                return True
+        else:
+            payload = line
+
+        try:
+            event = json.loads(payload)
+            usage = self.adapter.extract_usage(event)
+            if usage is not None:
+                self.usage_tokens = int(usage)
+            token = self.adapter.extract_token(event)
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            self.parse_errors += 1
+            return False
+
+        if token:
+            now = time.perf_counter() if now is None else now
+            if self.ttft is None:
+                self.ttft = now - self.start_time
+            self.token_times.append(now)
+            self.token_events += 1
+            if self.keep_text:
+                self._pieces.append(token)
+        return False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._pieces)
+
+    def output_tokens(self) -> Tuple[Optional[int], str]:
+        """
+        (count, source) of the generated tokens without re-tokenizing;
+        count is None when the text has to go through the tokenizer.
+        """
+        if self.usage_tokens is not None:
+            return self.usage_tokens, SERVER_USAGE
+        if self.adapter.events_are_tokens:
+            return self.token_events, STREAM_EVENTS
+        return None, TOKENIZER
+
+    def log_parse_errors(self):
+        if self.parse_errors:
+            logging.debug(f"{self.adapter.name}: skipped {self.parse_errors} stream events that could not be parsed")
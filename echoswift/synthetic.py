@@ -0,0 +1,140 @@
+"""
+Synthetic prompt datasets with exact token lengths and shared prefixes.
+
+Prompts are built from words that the benchmark tokenizer encodes as a
+single token, so a prompt can be grown or trimmed one token at a time until
+it encodes to exactly the requested length. The length counts special
+tokens the same way as the prompt token index. A configurable share of each
+prompt is a prefix drawn from a small pool. Prefixes end on a word
+boundary, so they tokenize identically in every prompt that uses them, the
+way a shared system prompt or RAG template does. Server-side prefix caching
+can then be measured against a run without shared prefixes.
+
+The output is a ``Dataset_{N}.csv`` per input-token bucket with the same
+``Input_Prompt`` column as the downloaded ShareGPT buckets.
+"""
+import csv
+import json
+import logging
+import random
+from pathlib import Path
+from typing import List
+
+LENGTH_DISTRIBUTIONS = ("fixed", "uniform", "normal")
+SYNTHETIC_META_FILE = "synthetic.json"
+
+# Used when the tokenizer vocabulary offers too few whole-word tokens
+_FALLBACK_WORDS = ("the", "of", "and", "to", "in", "is", "that", "it", "for", "as", "with", "was", "on", "be",
+                   "at", "by", "this", "from", "or", "an", "are", "not", "but", "have", "all", "can", "one", "time")
+_WORD_PREFIXES = ("▁", "Ġ")  # sentencepiece and byte-level BPE word-start markers
+
+
+class SyntheticPromptGenerator:
+    def __init__(self, tokenizer, seed: int = 0, max_words: int = 2000):
+        self.tokenizer = tokenizer
+        self.rng = random.Random(seed)
+        self.special_tokens = len(tokenizer.encode(""))
+        self.words = self._single_token_words(max_words)
+        if not self.words:
+            raise ValueError("The tokenizer has no words that encode to a single token")
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text))
+
+    def _single_token_words(self, max_words: int) -> List[str]:
+        candidates = set()
+        for token in self.tokenizer.get_vocab():
+            word = token[1:] if token.startswith(_WORD_PREFIXES) else token
+            if len(word) >= 2 and word.isascii() and word.isalpha() and word.islower():
+                candidates.add(word)
+        candidates = sorted(candidates)
+        self.rng.shuffle(candidates)
+        candidates = candidates[:max_words * 2] + list(_FALLBACK_WORDS)
+
+        words = []
+        for word in candidates:
+            # One token at the start of a prompt and one after a space
+            if self.count(f"{word} {word}") - self.special_tokens == 2 and word not in words:
+                words.append(word)
+                if len(words) >= max_words:
+                    break
+        return words
+
+    def random_words(self, n: int) -> List[str]:
+        return [self.rng.choice(self.words) for _ in range(n)]
+
+    def prompt(self, length: int, prefix: List[str] = ()) -> str:
+        """Prompt encoding to exactly length tokens (special tokens included) that starts with prefix."""
+        prefix = list(prefix)
+        body = length - self.special_tokens
+        if body <= len(prefix):
+            raise ValueError(f"Cannot build a {length}-token prompt around a {len(prefix)}-token prefix")
+        suffix = self.random_words(body - len(prefix))
+        for _ in range(body):
+            text = " ".join(prefix + suffix)
+            diff = self.count(text) - length
+            if diff == 0:
+                return text
+            if diff > 0:
+                if len(suffix) <= 1:
+                    break
+                # Words may merge across spaces; trim one at a time so the count never undershoots by much
+                suffix.pop()
+            else:
+                suffix.extend(self.random_words(-diff))
+        raise ValueError(f"Could not build a prompt of exactly {length} tokens with this tokenizer")
+
+    def sample_length(self, mean: int, distribution: str, spread: float, minimum: int) -> int:
+        if distribution == "fixed":
+            length = mean
+        elif distribution == "uniform":
+            length = self.rng.uniform(mean * (1 - spread), mean * (1 + spread))
+        elif distribution == "normal":
+            length = self.rng.gauss(mean, mean * spread)
+        else:
+            raise ValueError(f"Unknown length distribution '{distribution}'. "
+                             f"Expected one of: {', '.join(LENGTH_DISTRIBUTIONS)}")
+        return max(minimum, int(round(length)))
+
+
+def generate_synthetic_datasets(tokenizer, input_tokens: List[int], output_dir="Input_Dataset",
+                                num_prompts: int = 1000, prefix_ratio: float = 0.0, prefix_pool_size: int = 1,
+                                length_distribution: str = "fixed", length_spread: float = 0.1,
+                                seed: int = 0) -> List[Path]:
+    """
+    Write Dataset_{N}.csv for every N in input_tokens. Each prompt has a
+    length drawn around N (exactly N with the fixed distribution), and its first
+    prefix_ratio * N tokens are one of prefix_pool_size shared prefixes.
+    """
+    if not 0 <= prefix_ratio < 1:
+        raise ValueError(f"prefix_ratio must be in [0, 1), got {prefix_ratio}")
+    if prefix_pool_size < 1:
+        raise ValueError(f"prefix_pool_size must be at least 1, got {prefix_pool_size}")
+    if length_distribution not in LENGTH_DISTRIBUTIONS:
+        raise ValueError(f"Unknown length distribution '{length_distribution}'. "
+                         f"Expected one of: {', '.join(LENGTH_DISTRIBUTIONS)}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    generator = SyntheticPromptGenerator(tokenizer, seed)
+    written = []
+    for n in input_tokens:
+        prefix_length = int(n * prefix_ratio)
+        prefixes = [generator.random_words(prefix_length) for _ in range(prefix_pool_size)] if prefix_length else [[]]
+        minimum = generator.special_tokens + prefix_length + 1
+
+        path = output_dir / f"Dataset_{n}.csv"
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['Input_Prompt'])
+            writer.writeheader()
+            for _ in range(num_prompts):
+                length = generator.sample_length(n, length_distribution, length_spread, minimum)
+                writer.writerow({'Input_Prompt': generator.prompt(length, generator.rng.choice(prefixes))})
+        written.append(path)
+        logging.info(f"Wrote {num_prompts} synthetic prompts of {n} tokens to {path}")
+
+    with open(output_dir / SYNTHETIC_META_FILE, 'w') as f:
+        json.dump({"input_tokens": list(input_tokens), "num_prompts": num_prompts, "prefix_ratio": prefix_ratio,
+                   "prefix_pool_size": prefix_pool_size, "length_distribution": length_distribution,
+                   "length_spread": length_spread, "seed": seed}, f, indent=2)
+    return written
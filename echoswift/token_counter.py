@@ -0,0 +1,68 @@
+"""
+Batched output token counting, off the request path.
+
+Output token counts come from the server where it reports them. When it
+does not, the generated text has to be re-tokenized. ``TokenCounter``
+runs that in a background thread: requests submit their text and get a
+future, and the thread drains everything queued so far and encodes it as
+one batch, which fast tokenizers parallelise.
+
+The async engine awaits the future without blocking its event loop. Locust
+users never wait on it: they write the row from the future's callback and
+go on to the next request. Locust patches threading with gevent, so there
+the counter runs as a greenlet on the process's single OS thread. Batches
+still take CPU time from that loop, but no user stalls waiting for a count.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List
+
+
+class TokenCounter:
+    def __init__(self, tokenizer, max_batch: int = 64):
+        self.tokenizer = tokenizer
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="TokenCounter", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Future resolving to the number of tokens in text (special tokens excluded)."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def count(self, texts: List[str]) -> List[int]:
+        if callable(self.tokenizer):
+            # Hugging Face tokenizers encode a list in one call
+            return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+        return [len(self.tokenizer.encode(text)) for text in texts]
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    counts = self.count([text for text, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                else:
+                    for (_, future), n in zip(batch, counts):
+                        future.set_result(n)
+            if item is None:
+                return
@@ -0,0 +1,196 @@
+"""
+Sidecar token-count index for the prompt datasets.
+
+For every ``Dataset_{N}.csv`` the index stores the token count of each prompt
+(and optionally the token ids) as ``.npy`` arrays under
+``<dataset dir>/.token_index/<tokenizer>@<revision>/``, so load workers can
+memory-map the counts instead of tokenizing prompts on every request.
+Files are replaced atomically, the metadata last, so workers loading an
+index while another process (re)builds it never see a partial one.
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_TOKENIZER = "hf-internal-testing/llama-tokenizer"
+DEFAULT_REVISION = "main"
+INDEX_DIR_NAME = ".token_index"
+INDEX_VERSION = 1
+
+
+def load_tokenizer(tokenizer_name: str = DEFAULT_TOKENIZER, revision: str = DEFAULT_REVISION):
+    """Load a HuggingFace tokenizer at the given revision."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(tokenizer_name, revision=revision)
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of the tokenizer vocabulary, used to detect a changed tokenizer behind the same name."""
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False)
+    return hashlib.sha256(vocab.encode("utf-8")).hexdigest()
+
+
+def read_prompts(csv_file) -> List[str]:
+    with open(csv_file, 'r') as file:
+        reader = csv.DictReader(file)
+        return [row['Input_Prompt'] for row in reader]
+
+
+def write_atomically(path: Path, write):
+    """Call write(file) on a temporary file next to path, then rename it over path."""
+    partial = path.with_name(f"{path.name}.{os.getpid()}.partial")
+    with open(partial, 'wb') as f:
+        write(f)
+    os.replace(partial, path)
+
+
+def index_dir(dataset_file: Path, tokenizer_name: str, revision: str) -> Path:
+    slug = f"{tokenizer_name}@{revision}".replace("/", "--")
+    return Path(dataset_file).parent / INDEX_DIR_NAME / slug
+
+
+class TokenIndex:
+    """Token counts (and optionally token ids) for every prompt of one dataset file."""
+
+    def __init__(self, counts: np.ndarray, ids: np.ndarray = None, offsets: np.ndarray = None, meta: dict = None):
+        self.counts = counts
+        self.ids = ids
+        self.offsets = offsets
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def token_count(self, i: int) -> int:
+        return int(self.counts[i])
+
+    def token_ids(self, i: int) -> np.ndarray:
+        if self.ids is None:
+            raise ValueError("Token ids were not stored in this index. Rebuild it with store_ids=True.")
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+
+def _paths(dataset_file: Path, tokenizer_name: str, revision: str) -> dict:
+    directory = index_dir(dataset_file, tokenizer_name, revision)
+    stem = Path(dataset_file).stem
+    return {
+        "meta": directory / f"{stem}.meta.json",
+        "counts": directory / f"{stem}.counts.npy",
+        "ids": directory / f"{stem}.ids.npy",
+        "offsets": directory / f"{stem}.offsets.npy",
+    }
+
+
+def _dataset_stat(dataset_file: Path) -> dict:
+    stat = Path(dataset_file).stat()
+    return {"dataset_size": stat.st_size, "dataset_mtime_ns": stat.st_mtime_ns}
+
+
+def _is_current(meta: dict, dataset_file: Path, tokenizer_name: str, revision: str,
+                fingerprint: Optional[str], store_ids: bool) -> bool:
+    if meta.get("version") != INDEX_VERSION:
+        return False
+    if meta.get("tokenizer") != tokenizer_name or meta.get("revision") != revision:
+        return False
+    if fingerprint is not None and meta.get("tokenizer_fingerprint") != fingerprint:
+        return False
+    if store_ids and not meta.get("has_ids"):
+        return False
+    return all(meta.get(k) == v for k, v in _dataset_stat(dataset_file).items())
+
+
+def build_token_index(dataset_file, tokenizer, tokenizer_name: str, revision: str = DEFAULT_REVISION,
+                      store_ids: bool = False) -> TokenIndex:
+    """Tokenize every prompt of dataset_file once and write the sidecar index."""
+    dataset_file = Path(dataset_file)
+    paths = _paths(dataset_file, tokenizer_name, revision)
+    paths["meta"].parent.mkdir(parents=True, exist_ok=True)
+
+    prompts = read_prompts(dataset_file)
+    encoded = [tokenizer.encode(prompt) for prompt in prompts]
+    counts = np.fromiter((len(ids) for ids in encoded), dtype=np.int32, count=len(encoded))
+    write_atomically(paths["counts"], lambda f: np.save(f, counts))
+
+    ids = offsets = None
+    if store_ids:
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        ids = np.fromiter((t for seq in encoded for t in seq), dtype=np.int32, count=int(offsets[-1]))
+        write_atomically(paths["ids"], lambda f: np.save(f, ids))
+        write_atomically(paths["offsets"], lambda f: np.save(f, offsets))
+
+    meta = {
+        "version": INDEX_VERSION,
+        "tokenizer": tokenizer_name,
+        "revision": revision,
+        "tokenizer_fingerprint": tokenizer_fingerprint(tokenizer),
+        "num_prompts": len(prompts),
+        "has_ids": store_ids,
+        **_dataset_stat(dataset_file),
+    }
+    write_atomically(paths["meta"], lambda f: f.write(json.dumps(meta, indent=2).encode()))
+
+    logging.info(f"Built token index for {dataset_file.name} with {tokenizer_name}@{revision}")
+    return TokenIndex(counts, ids, offsets, meta)
+
+
+def load_token_index(dataset_file, tokenizer_name: str = DEFAULT_TOKENIZER, revision: str = DEFAULT_REVISION,
+                     fingerprint: str = None, store_ids: bool = False, mmap: bool = True) -> Optional[TokenIndex]:
+    """
+    Memory-map the index for dataset_file. Returns None when the index is
+    missing or stale (dataset or tokenizer changed since it was built).
+    """
+    paths = _paths(Path(dataset_file), tokenizer_name, revision)
+    try:
+        with open(paths["meta"], 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if not _is_current(meta, dataset_file, tokenizer_name, revision, fingerprint, store_ids):
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    try:
+        counts = np.load(paths["counts"], mmap_mode=mmap_mode)
+        ids = offsets = None
+        if meta.get("has_ids"):
+            ids = np.load(paths["ids"], mmap_mode=mmap_mode)
+            offsets = np.load(paths["offsets"], mmap_mode=mmap_mode)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    # Arrays from different builds do not line up; treat them as stale
+    if len(counts) != meta.get("num_prompts"):
+        return None
+    if ids is not None and (len(offsets) != len(counts) + 1 or len(ids) != offsets[-1]):
+        return None
+    return TokenIndex(counts, ids, offsets, meta)
+
+
+def ensure_token_index(dataset_file, tokenizer_name: str = DEFAULT_TOKENIZER, revision: str = DEFAULT_REVISION,
+                       tokenizer=None, store_ids: bool = False) -> TokenIndex:
+    """Load the index for dataset_file, (re)building it if it is missing or stale."""
+    if tokenizer is None:
+        tokenizer = load_tokenizer(tokenizer_name, revision)
+    index = load_token_index(dataset_file, tokenizer_name, revision,
+                             fingerprint=tokenizer_fingerprint(tokenizer), store_ids=store_ids)
+    if index is None:
+        index = build_token_index(dataset_file, tokenizer, tokenizer_name, revision, store_ids)
+    return index
+
+
+def build_dataset_token_indexes(dataset_dir, tokenizer_name: str = DEFAULT_TOKENIZER,
+                                revision: str = DEFAULT_REVISION, store_ids: bool = False) -> int:
+    """Ensure an up-to-date index exists for every Dataset_*.csv in dataset_dir."""
+    tokenizer = load_tokenizer(tokenizer_name, revision)
+    dataset_files = sorted(Path(dataset_dir).glob("Dataset_*.csv"))
+    for dataset_file in dataset_files:
+        ensure_token_index(dataset_file, tokenizer_name, revision, tokenizer=tokenizer, store_ids=store_ids)
+    return len(dataset_files)
@@ -1,81 +1,341 @@
 import argparse
-import csv
 import logging
+import math
 import sys
-from typing import List, Optional
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from echoswift.connections import NEW
+from echoswift.result_sink import CELL_FIELDNAMES, CONNECTION_FIELDNAMES, SCHEDULE_FIELDNAMES
+from echoswift.utils.itl import ITL_FIELDNAMES, ITL_PERCENTILES, read_itl_gaps
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def read_csv(filename: str) -> List[List[str]]:
-    try:
-        with open(filename, 'r', newline='') as file:
-            return list(csv.reader(file))
-    except FileNotFoundError:
-        logging.error(f"Input file not found: {filename}")
-        sys.exit(1)
-    except PermissionError:
-        logging.error(f"Permission denied when trying to read: {filename}")
-        sys.exit(1)
-    except Exception as e:
-        logging.error(f"Error reading input file {filename}: {str(e)}")
-        sys.exit(1)
+MEAN_COLUMNS = ["throughput(tokens/second)", "latency(ms)", "TTFT(ms)", "latency_per_token(ms/token)"]
+DISTRIBUTION_COLUMNS = ["TTFT(ms)", "latency(ms)", "throughput(tokens/second)", "latency_per_token(ms/token)"]
+PERCENTILES = {"p50": 0.50, "p90": 0.90, "p95": 0.95, "p99": 0.99}
+CELL_LABELS = {"users": "users", "target_input_tokens": "input tokens", "target_output_tokens": "output tokens",
+               "request_rate": "request rate"}
+METRIC_ALIASES = {
+    "ttft": "TTFT(ms)",
+    "tpot": "latency_per_token(ms/token)",
+    "latency": "latency(ms)",
+}
+SLO_METRICS = ("TTFT(ms)", "latency_per_token(ms/token)", "latency(ms)")
+GOODPUT_COLUMNS = ["slo attainment", "goodput(requests/second)", "goodput(tokens/second)"]
+FAILURE_COLUMNS = ["error rate", "timeout rate"]
+PHASE_COLUMNS = [c for c in CONNECTION_FIELDNAMES if c.endswith("(ms)")]
+# A cell's mean of the per-request ITL percentiles; ITL_p50(ms) etc. are reserved for percentiles of all its gaps
+ITL_MEAN_LABELS = {f"ITL_{name}(ms)": f"ITL_{name}_mean(ms)" for name in ITL_PERCENTILES}
+CONNECTION_COLUMNS = ["new connection rate"] + PHASE_COLUMNS
+TURN_AVERAGES_PREFIX = "avg_by_turn_"
+BUCKET_AVERAGES_PREFIX = "avg_by_bucket_"
 
-def calculate_average(rows: List[List[str]], column_indices: List[int], start: int, end: int) -> List[Optional[float]]:
-    try:
-        values = [[float(row[i]) for i in column_indices] for row in rows[start:end-1] if row]
-        return [sum(column) / len(column) if column else None for column in zip(*values)]
-    except ValueError as e:
-        logging.error(f"Error calculating average: {str(e)}. Check if all values are numeric.")
-        return [None] * len(column_indices)
-
-def calculate_averages(input_csv_filename: str, output_csv_filename: str, tokens: List[int]):
-    column_names = ["throughput(tokens/second)", "latency(ms)", "TTFT(ms)", "latency_per_token(ms/token)"]
-    rows = read_csv(input_csv_filename)
-
-    if not rows:
-        logging.error(f"Input file is empty: {input_csv_filename}")
-        sys.exit(1)
 
-    header = rows[0]
-    try:
-        column_indices = [header.index(column) for column in column_names]
-    except ValueError as e:
-        logging.error(f"Error finding column indices: {str(e)}. Check if all required columns are present.")
-        sys.exit(1)
+def load_results(path) -> pd.DataFrame:
+    """Read per-request results from a CSV file or a Parquet result directory."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
 
-    empty_line_indices = [i for i, row in enumerate(rows) if not any(row)]
-    if not empty_line_indices or empty_line_indices[-1] != len(rows) - 1:
-        rows.append([''] * len(rows[0]))
-    empty_line_indices = empty_line_indices + [len(rows)]
 
-    try:
-        with open(output_csv_filename, mode='w', newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["output tokens"] + column_names)
+def failed_requests(df: pd.DataFrame) -> pd.Series:
+    """Whether each row is a failed request; results from before failures were recorded have none."""
+    if 'error' not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df['error'].fillna('').astype(str).str.len().gt(0)
 
-            for i in range(len(empty_line_indices)):
-                start_index = 1 if i == 0 else empty_line_indices[i - 1] + 1
-                end_index = empty_line_indices[i]
-                average = calculate_average(rows, column_indices, start_index, end_index)
 
-                if len(average) > 1 and i // 2 < len(tokens):
-                    writer.writerow([tokens[i // 2]] + average)
+def request_slos(slo: Dict[str, float]) -> Dict[str, float]:
+    """
+    Map per-request SLOs, keyed ttft, tpot, latency or a result column name,
+    to their result columns and upper bounds (ms, or ms/token for tpot).
+    """
+    columns = {}
+    for name, threshold in slo.items():
+        column = METRIC_ALIASES.get(name.lower(), name)
+        if column not in SLO_METRICS:
+            raise ValueError(f"Unknown SLO metric '{name}'. Expected one of: "
+                             f"{', '.join(list(METRIC_ALIASES) + list(SLO_METRICS))}")
+        if float(threshold) <= 0:
+            raise ValueError(f"SLO '{name}' must be a positive number of milliseconds, got {threshold}")
+        columns[column] = float(threshold)
+    return columns
+
+
+def slo_columns(df: pd.DataFrame, slo: Dict[str, float]) -> pd.DataFrame:
+    """
+    Per-request inputs of slo_summary: whether the request met every SLO
+    (a failed request or a missing metric counts as a miss), its send and
+    completion times, and its output tokens if it met them.
+    """
+    met = ~failed_requests(df)
+    for column, threshold in request_slos(slo).items():
+        met &= pd.to_numeric(df[column], errors='coerce').le(threshold)
+    sent = (pd.to_numeric(df['start_epoch'], errors='coerce') if 'start_epoch' in df.columns
+            else pd.Series(np.nan, index=df.index))
+    tokens = (pd.to_numeric(df['output_tokens'], errors='coerce') if 'output_tokens' in df.columns
+              else pd.Series(np.nan, index=df.index))
+    return pd.DataFrame({'slo_met': met.astype(float), 'sent_epoch': sent,
+                         'done_epoch': sent + pd.to_numeric(df['latency(ms)'], errors='coerce') / 1000,
+                         'good_tokens': tokens.where(met, 0)}, index=df.index)
+
+
+def slo_summary(grouped) -> pd.DataFrame:
+    """
+    SLO attainment (share of requests meeting every SLO) and goodput per
+    group of slo_columns rows: SLO-compliant requests and output tokens per
+    second, over the span from the group's first send to its last completion.
+    """
+    span = grouped['done_epoch'].max() - grouped['sent_epoch'].min()
+    return pd.DataFrame({
+        'slo attainment': grouped['slo_met'].mean(),
+        'goodput(requests/second)': (grouped['slo_met'].sum() / span).where(span > 0),
+        'goodput(tokens/second)': (grouped['good_tokens'].sum(min_count=1) / span).where(span > 0),
+    })
+
+
+def aggregate_results(df: pd.DataFrame, by: List[str] = (), slo: Dict[str, float] = None,
+                      itl_gaps: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Summarise per-request rows per benchmark cell.
+
+    Cells are identified by the users/target_input_tokens/target_output_tokens
+    columns written with every request. Reports the mean of each metric,
+    and for TTFT, latency, throughput and latency per token also the standard deviation,
+    p50/p90/p95/p99, min and max. Open-loop cells also report the achieved
+    request rate and the client-side send lag. Requests where the server
+    stopped before the target output length are counted in ``stopped short``.
+    by adds grouping columns within each cell, such as the session turn. When
+    lengths vary within a group (extra keys, or no target length columns),
+    the mean prompt and output lengths are reported too. With per-request
+    SLOs (see request_slos), the SLO attainment and goodput are reported too.
+    Failed requests count in ``requests`` and in the error and timeout rates,
+    but not in the latency, throughput and length statistics. Results with
+    connection phases report the share of requests that opened a new
+    connection and the mean of each phase; connect and TLS times are means
+    over the new connections only.
+
+    Per-request ITL percentiles are averaged into ITL_p50_mean(ms) etc.,
+    which hide the tail of the gaps; ITL_max(ms) is the worst gap of the cell.
+    Given itl_gaps (see itl_gap_frame), the cells also report ITL_p50(ms),
+    ITL_p90(ms) and ITL_p99(ms) as percentiles of all their gaps.
+    """
+    cell_keys = [c for c in CELL_FIELDNAMES if c in df.columns]
+    keys = cell_keys + list(by)
+    columns = MEAN_COLUMNS + [c for c in ITL_FIELDNAMES + SCHEDULE_FIELDNAMES +
+                              ['stopped_short', 'input_tokens', 'output_tokens'] if c in df.columns]
+    # The by columns are labels (e.g. target names) and are grouped as they are
+    numeric = df[cell_keys + columns].apply(pd.to_numeric, errors='coerce').join(df[list(by)])
+    if 'error' in df.columns:
+        failed = failed_requests(df)
+        numeric.loc[failed, [c for c in columns if c not in ['input_tokens'] + SCHEDULE_FIELDNAMES]] = np.nan
+        timed_out = pd.to_numeric(df['timed_out'], errors='coerce') if 'timed_out' in df.columns else 0
+        numeric = numeric.assign(failed=failed.astype(float), timed_out=(timed_out == 1) & failed)
+    has_phases = 'connection' in df.columns and df['connection'].fillna('').astype(str).ne('').any()
+    if has_phases:
+        connection = df['connection'].fillna('').astype(str)
+        phases = df[[c for c in PHASE_COLUMNS if c in df.columns]].apply(pd.to_numeric, errors='coerce')
+        numeric = numeric.join(phases).assign(new_connection=connection.eq(NEW).astype(float).where(connection.ne('')))
+    if slo:
+        numeric = numeric.join(slo_columns(df, slo))
+    # Closed-loop cells have no request rate; keep them instead of dropping NaN keys
+    grouped = numeric.groupby(keys, sort=True, dropna=False)
+
+    summary = grouped[MEAN_COLUMNS].mean()
+    itl_columns = [c for c in ITL_FIELDNAMES if c in df.columns]
+    if itl_columns:
+        # Mean of the per-request ITL percentiles, and the worst gap seen in the cell
+        itl = grouped[itl_columns].mean()
+        if 'ITL_max(ms)' in itl_columns:
+            itl['ITL_max(ms)'] = grouped['ITL_max(ms)'].max()
+        summary = summary.join(itl.rename(columns=ITL_MEAN_LABELS))
+    if itl_gaps is not None and not by:
+        gaps = itl_gaps[keys + ['gap(ms)']].apply(pd.to_numeric, errors='coerce') \
+            .groupby(keys, sort=True, dropna=False)['gap(ms)']
+        summary = summary.join(pd.concat({f"ITL_{name}(ms)": gaps.quantile(q / 100)
+                                          for name, q in ITL_PERCENTILES.items()}, axis=1))
+
+    spread = grouped[DISTRIBUTION_COLUMNS].agg(['std', 'min', 'max'])
+    # One quantile at a time keeps the group index intact; unstacking a multi-quantile
+    # result does not round-trip NaN keys (closed-loop cells) and loses the values
+    quantiles = pd.concat({name: grouped[DISTRIBUTION_COLUMNS].quantile(q) for name, q in PERCENTILES.items()},
+                          axis=1).swaplevel(axis=1)
+    stats = pd.concat([spread, quantiles], axis=1)
+    stat_order = ['std'] + list(PERCENTILES) + ['min', 'max']
+    stats = stats[[(metric, stat) for metric in DISTRIBUTION_COLUMNS for stat in stat_order]]
+    stats.columns = [f"{metric}_{stat}" for metric, stat in stats.columns]
+
+    summary = summary.join(stats)
+
+    if 'start_offset(s)' in numeric.columns and numeric['start_offset(s)'].notna().any():
+        offsets = grouped['start_offset(s)']
+        span = offsets.max() - offsets.min()
+        summary['achieved rate(requests/second)'] = ((offsets.count() - 1) / span).where(span > 0)
+        lag = grouped['send_lag(ms)']
+        summary['send_lag(ms)'] = lag.mean()
+        summary['send_lag(ms)_p99'] = lag.quantile(0.99)
+        summary['send_lag(ms)_max'] = lag.max()
+
+    if slo:
+        summary = summary.join(slo_summary(grouped))
+    if 'failed' in numeric.columns:
+        summary['error rate'] = grouped['failed'].mean()
+        summary['timeout rate'] = grouped['timed_out'].mean()
+    if has_phases:
+        summary['new connection rate'] = grouped['new_connection'].mean()
+        summary = summary.join(grouped[[c for c in PHASE_COLUMNS if c in numeric.columns]].mean())
+
+    if 'stopped_short' in numeric.columns:
+        summary['stopped short'] = grouped['stopped_short'].sum()
+    if (by or 'target_input_tokens' not in keys) and 'input_tokens' in numeric.columns:
+        summary['prompt tokens'] = grouped['input_tokens'].mean()
+    if 'target_output_tokens' not in keys and 'output_tokens' in numeric.columns:
+        summary['generated tokens'] = grouped['output_tokens'].mean()
+
+    summary = summary.reset_index()
+    summary['requests'] = grouped.size().values
+    if 'request_rate' in summary.columns and summary['request_rate'].isna().all():
+        summary = summary.drop(columns=['request_rate'])
+    return summary.rename(columns=CELL_LABELS)
+
+
+def itl_gap_frame(cell_files: List[Path], dump_files: List[Path]) -> pd.DataFrame:
+    """
+    Every inter-token gap in the ITL dumps, as a gap(ms) column tagged with
+    the cell columns of its cell file. Cells without a dump are left out;
+    None when no cell has one.
+    """
+    frames = []
+    for cell_file, dump_file in zip(cell_files, dump_files):
+        if dump_file is None or not Path(dump_file).exists():
+            continue
+        rows = load_results(cell_file)
+        if rows.empty:
+            continue
+        cell = rows[[c for c in CELL_FIELDNAMES if c in rows.columns]].iloc[0]
+        frames.append(pd.DataFrame({'gap(ms)': read_itl_gaps(dump_file)}).assign(**cell))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def calculate_averages(input_csv_filename, output_csv_filename, tokens: List[int] = None,
+                       slo: Dict[str, float] = None, itl_gaps: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Aggregate one {input_tokens}_input_tokens result file into its avg_ file.
+    tokens labels results written before the cell columns existed.
+    """
+    df = load_results(input_csv_filename)
+    if df.empty:
+        raise ValueError(f"Input file is empty: {input_csv_filename}")
+
+    missing = [c for c in MEAN_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns {missing} in {input_csv_filename}")
+
+    if 'target_output_tokens' not in df.columns:
+        if not tokens:
+            raise ValueError(f"{input_csv_filename} has no target_output_tokens column; pass the output tokens explicitly")
+        if len(tokens) > 1:
+            logging.warning(f"{input_csv_filename} has no cell columns; averaging all rows as output_tokens={tokens[0]}")
+        df['target_output_tokens'] = tokens[0]
+
+    summary = aggregate_results(df, slo=slo, itl_gaps=itl_gaps)
+    if 'error rate' in summary.columns:
+        for _, cell in summary[summary['error rate'] > 0].iterrows():
+            logging.warning(f"{cell['error rate']:.1%} of {int(cell['requests'])} requests with output_tokens="
+                            f"{cell['output tokens']} failed ({cell['timeout rate']:.1%} timed out)")
+    if 'stopped short' in summary.columns:
+        for _, cell in summary[summary['stopped short'] > 0].iterrows():
+            logging.warning(f"{int(cell['stopped short'])} of {int(cell['requests'])} requests with output_tokens="
+                            f"{cell['output tokens']} stopped short of the target length; throughput is skewed")
+    leading = [label for label in ('output tokens', 'users', 'input tokens', 'request rate') if label in summary.columns]
+    summary = summary[leading + [c for c in summary.columns if c not in leading]]
+    summary.to_csv(output_csv_filename, index=False, float_format='%.3f')
+    return summary
+
+
+def calculate_turn_averages(input_csv_filename, output_csv_filename, slo: Dict[str, float] = None) -> pd.DataFrame:
+    """Aggregate a session workload's results per cell and turn index."""
+    df = load_results(input_csv_filename)
+    if 'turn' not in df.columns or df['turn'].isna().all():
+        raise ValueError(f"{input_csv_filename} has no session turns")
+    summary = aggregate_results(df[df['turn'].notna()], by=['turn'], slo=slo)
+    leading = [label for label in ('output tokens', 'users', 'input tokens', 'turn') if label in summary.columns]
+    summary = summary[leading + [c for c in summary.columns if c not in leading]]
+    summary.to_csv(output_csv_filename, index=False, float_format='%.3f')
+    return summary
+
+
+def length_buckets(lengths: pd.Series, edges: List[int] = None) -> pd.Series:
+    """
+    Label each length with its bucket. edges are the inclusive upper bounds,
+    e.g. [128, 512] gives 1-128, 129-512 and 513+; by default powers of two.
+    """
+    lengths = pd.to_numeric(lengths, errors='coerce')
+    if not edges:
+        top = max(int(lengths.max()) if lengths.notna().any() else 1, 1)
+        edges = [2 ** k for k in range(math.ceil(math.log2(top)) + 1)]
+    starts = [1] + [e + 1 for e in edges]
+    labels = [str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in zip(starts, edges)] + [f"{starts[-1]}+"]
+    positions = np.searchsorted(edges, lengths.fillna(0).to_numpy(), side='left')
+    return pd.Series(pd.Categorical.from_codes(positions, labels, ordered=True), index=lengths.index)
+
+
+def calculate_bucket_averages(input_csv_filename, output_csv_filename, input_edges: List[int] = None,
+                              output_edges: List[int] = None, slo: Dict[str, float] = None) -> pd.DataFrame:
+    """
+    Aggregate a mixed-length run per cell and (input, output) length bucket.
+    Input buckets use the prompt length sent, output buckets the requested length.
+    """
+    df = load_results(input_csv_filename)
+    if df.empty:
+        raise ValueError(f"Input file is empty: {input_csv_filename}")
+    input_bucket = length_buckets(df['input_tokens'], input_edges)
+    output_bucket = length_buckets(df['target_output_tokens'], output_edges)
+    # Bucket positions group and sort numerically; the labels are put back afterwards
+    df = df.drop(columns=['target_input_tokens', 'target_output_tokens']).assign(
+        **{'input bucket': input_bucket.cat.codes, 'output bucket': output_bucket.cat.codes})
+    summary = aggregate_results(df, by=['input bucket', 'output bucket'], slo=slo)
+    summary['input bucket'] = input_bucket.cat.categories[summary['input bucket'].astype(int).to_numpy()]
+    summary['output bucket'] = output_bucket.cat.categories[summary['output bucket'].astype(int).to_numpy()]
+    leading = [label for label in ('users', 'request rate', 'input bucket', 'output bucket') if label in summary.columns]
+    summary = summary[leading + [c for c in summary.columns if c not in leading]]
+    summary.to_csv(output_csv_filename, index=False, float_format='%.3f')
+    return summary
+
+
+def calculate_mixed_averages(input_csv_filename, output_csv_filename, slo: Dict[str, float] = None,
+                             itl_gaps: pd.DataFrame = None) -> pd.DataFrame:
+    """Aggregate a mixed-length run per cell, over all request shapes."""
+    df = load_results(input_csv_filename)
+    if df.empty:
+        raise ValueError(f"Input file is empty: {input_csv_filename}")
+    shapes = ['target_input_tokens', 'target_output_tokens']
+    if itl_gaps is not None:
+        itl_gaps = itl_gaps.drop(columns=shapes, errors='ignore')
+    summary = aggregate_results(df.drop(columns=shapes), slo=slo, itl_gaps=itl_gaps)
+    leading = [label for label in ('users', 'request rate') if label in summary.columns]
+    summary = summary[leading + [c for c in summary.columns if c not in leading]]
+    summary.to_csv(output_csv_filename, index=False, float_format='%.3f')
+    return summary
 
-    except PermissionError:
-        logging.error(f"Permission denied when trying to write to: {output_csv_filename}")
-        sys.exit(1)
-    except Exception as e:
-        logging.error(f"Error writing to output file {output_csv_filename}: {str(e)}")
-        sys.exit(1)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Calculate averages from Locust results")
     parser.add_argument('--input_csv_filename', required=True, help='Input CSV file path')
     parser.add_argument('--output_csv_filename', required=True, help='Output CSV file path')
-    parser.add_argument('--tokens', nargs='+', type=int, required=True, help='List of different output_tokens')
+    parser.add_argument('--tokens', nargs='+', type=int, help='Output tokens, for results written without cell columns')
     args = parser.parse_args()
 
-    calculate_averages(args.input_csv_filename, args.output_csv_filename, args.tokens)
+    try:
+        calculate_averages(args.input_csv_filename, args.output_csv_filename, args.tokens)
+    except (OSError, ValueError) as e:
+        logging.error(f"Error calculating averages: {e}")
+        sys.exit(1)
 
 # Example command to run this file:
-# python3 avg_locust_results.py --input_csv_filename "Results_vLLM_Llama3_8b_32in_256out/100_User/32_input_tokens.csv" --output_csv_filename "Results_vLLM_Llama3_8b_32in_256out/100_User/avg_32_input_tokens.csv" --tokens 256
\ No newline at end of file
+# python3 avg_locust_results.py --input_csv_filename "Results_vLLM_Llama3_8b_32in_256out/100_User/32_input_tokens.csv" --output_csv_filename "Results_vLLM_Llama3_8b_32in_256out/100_User/avg_32_input_tokens.csv"
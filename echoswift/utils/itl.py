@@ -0,0 +1,74 @@
+"""
+Inter-token latency (ITL) helpers.
+
+Stream handlers record a perf_counter timestamp for every received token
+chunk in an ``array('d')``. The gaps between consecutive chunks are
+summarised per request, and can optionally be appended to a binary
+sidecar file for offline analysis.
+
+Sidecar record layout (little-endian): ``uint32 request``,
+``uint32 max_new_tokens``, ``uint32 n`` followed by ``n`` float32 gaps in ms.
+"""
+import math
+import struct
+from array import array
+from typing import Iterator, Sequence, Tuple
+
+import numpy as np
+
+ITL_PERCENTILES = {"p50": 50, "p90": 90, "p99": 99}
+ITL_FIELDNAMES = [f"ITL_{name}(ms)" for name in ITL_PERCENTILES] + ['ITL_max(ms)']
+ITL_DUMP_SUFFIX = ".itl.bin"
+
+_RECORD_HEADER = struct.Struct('<III')
+
+
+def inter_token_gaps(token_times: Sequence[float]) -> array:
+    """Gaps in milliseconds between consecutive token chunk timestamps."""
+    return array('d', ((b - a) * 1000 for a, b in zip(token_times, token_times[1:])))
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linearly interpolated percentile (same method as numpy's default) of pre-sorted values."""
+    if not sorted_values:
+        raise ValueError("percentile of an empty sequence")
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def itl_summary(gaps: Sequence[float]) -> dict:
+    """Per-request ITL percentile columns, empty when fewer than two tokens were streamed."""
+    if not gaps:
+        return {name: '' for name in ITL_FIELDNAMES}
+    ordered = sorted(gaps)
+    summary = {f"ITL_{name}(ms)": f"{percentile(ordered, q):.3f}" for name, q in ITL_PERCENTILES.items()}
+    summary['ITL_max(ms)'] = f"{ordered[-1]:.3f}"
+    return summary
+
+
+def encode_itl_record(request: int, max_new_tokens: int, gaps: Sequence[float]) -> bytes:
+    return _RECORD_HEADER.pack(request, max_new_tokens, len(gaps)) + array('f', gaps).tobytes()
+
+
+def read_itl_dump(path) -> Iterator[Tuple[int, int, array]]:
+    """Yield (request, max_new_tokens, gaps_ms) records from a sidecar file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        request, max_new_tokens, n = _RECORD_HEADER.unpack_from(data, offset)
+        offset += _RECORD_HEADER.size
+        gaps = array('f')
+        gaps.frombytes(data[offset:offset + 4 * n])
+        offset += 4 * n
+        yield request, max_new_tokens, gaps
+
+
+def read_itl_gaps(path) -> np.ndarray:
+    """All gaps in a sidecar file, in ms, as one float32 array."""
+    gaps = [record[2] for record in read_itl_dump(path)]
+    return np.concatenate(gaps) if gaps else np.empty(0, dtype=np.float32)
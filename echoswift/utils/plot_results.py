@@ -1,93 +1,102 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
 from pathlib import Path
 
-def process_csv_files(directory_path):
-    user_number = int(''.join(filter(str.isdigit, directory_path.name)))
-    data = {}
-
-    csv_files = sorted(directory_path.glob('avg_*_input_tokens.csv'), 
-                       key=lambda x: int(''.join(filter(str.isdigit, x.stem))))
-    
-    for csv_file in csv_files:
-        df = pd.read_csv(csv_file)
-        for _, row in df.iterrows():
-            output_token = row['output tokens']
-            token_latency = row['latency_per_token(ms/token)']
-            throughput = row['throughput(tokens/second)']
-            ttft = row['TTFT(ms)']
-            data.setdefault(user_number, []).append((output_token, token_latency, throughput, ttft))
-
-    return data
-
-def write_to_csv(data, output_file):
-    with open(output_file, 'w') as f:
-        f.write('Number of Parallel Requests,Output Token,Token Latency (ms/token),Throughput (tokens/second),TTFT (ms)\n')
-        for num_Requests, values in sorted(data.items()):
-            for value in values:
-                f.write(f'{num_Requests},{value[0]},{value[1]},{value[2]},{value[3]}\n')
+from echoswift.store import FACETS, load_run, with_cell_labels
+from echoswift.utils.avg_locust_results import aggregate_results
+
+COLUMN_NAMES = {
+    'target': 'Target',
+    'users': 'Number of Parallel Requests',
+    'request rate': 'Request Rate',
+    'input tokens': 'Input Token',
+    'output tokens': 'Output Token',
+    'latency_per_token(ms/token)': 'Token Latency (ms/token)',
+    'throughput(tokens/second)': 'Throughput (tokens/second)',
+    'TTFT(ms)': 'TTFT (ms)',
+    'slo attainment': 'SLO Attainment',
+    'goodput(requests/second)': 'Goodput (requests/second)',
+    'goodput(tokens/second)': 'Goodput (tokens/second)',
+    'error rate': 'Error Rate',
+    'timeout rate': 'Timeout Rate',
+}
+
+
+def aggregate_cells(requests: pd.DataFrame, slo: dict = None) -> pd.DataFrame:
+    """
+    The per-cell summary of aggregate_results (per target, if any), cut to
+    the plotted metrics and labelled for the charts.
+    """
+    by = ['target'] if 'target' in requests.columns else []
+    cells = aggregate_results(with_cell_labels(requests).drop(columns=FACETS), by=by, slo=slo)
+    for label in FACETS:
+        cells[label] = cells[label].map(lambda v: "mixed" if pd.isna(v) else int(v))
+    columns = [c for c in COLUMN_NAMES if c in cells.columns]
+    return cells[columns].rename(columns=COLUMN_NAMES)
+
 
 def plot_line_chart(data, x_label, y_label, title, output_file):
+    """One line per (target, request rate,) input and output token count, against the number of parallel requests."""
     plt.figure(figsize=(10, 6))
 
-    x_values = data[x_label]
-    y_values = data[y_label]
-
-    num_Requests = sorted(set(x_values))
-    x_ticks_positions = np.arange(len(num_Requests))
-
-    plt.plot(x_ticks_positions, y_values, marker='o', label=y_label)
+    series = [c for c in ('Target', 'Request Rate', 'Input Token', 'Output Token') if c in data.columns]
+    for key, line in data.groupby(series, sort=True, dropna=False):
+        key = key if isinstance(key, tuple) else (key,)
+        label = ", ".join(f"{name}={value}" for name, value in zip(series, key) if not pd.isna(value))
+        plt.plot(line[x_label], line[y_label], marker='o', label=label)
+        for x, y in zip(line[x_label], line[y_label]):
+            plt.annotate(f'{y:.2f}', xy=(x, y), ha='center', va='bottom')
 
     plt.xlabel(x_label)
     plt.ylabel(y_label)
     plt.title(title)
+    plt.xticks(sorted(data[x_label].unique()))
 
-    for i, txt in enumerate(y_values):
-        plt.annotate(f'{txt:.2f}', xy=(x_ticks_positions[i], y_values.iloc[i]), ha='center', va='bottom')
-
-    plt.xticks(x_ticks_positions, [str(num) for num in num_Requests])
-    
     plt.legend()
     plt.grid(False)
     plt.tight_layout()
     plt.savefig(output_file)
     plt.close()
 
-def plot_benchmark_results(base_directory):
+def plot_benchmark_results(base_directory, slo: dict = None):
     base_directory = Path(base_directory)
     output_file = base_directory / 'aggregated_data.csv'
-    
-    data = {}
-    for directory in base_directory.iterdir():
-        if directory.is_dir() and "_User" in directory.name:
-            directory_data = process_csv_files(directory)
-            for num_Requests, values in directory_data.items():
-                data.setdefault(num_Requests, []).extend(values)
-
-    write_to_csv(data, output_file)
-    print(f"Aggregated data has been written to {output_file}")
 
-    df = pd.read_csv(output_file)
+    data = aggregate_cells(load_run(base_directory), slo)
+    data.to_csv(output_file, index=False)
+    print(f"Aggregated data has been written to {output_file}")
 
-    plot_line_chart(df[['Number of Parallel Requests', 'Token Latency (ms/token)']], 
-                    'Number of Parallel Requests', 'Token Latency (ms/token)', 
-                    'Parallel Requests vs Token Latency', 
+    plot_line_chart(data, 'Number of Parallel Requests', 'Token Latency (ms/token)',
+                    'Parallel Requests vs Token Latency',
                     base_directory / 'token_latency_plot.png')
 
-    plot_line_chart(df[['Number of Parallel Requests', 'Throughput (tokens/second)']], 
-                    'Number of Parallel Requests', 'Throughput (tokens/second)', 
-                    'Parallel Requests vs Throughput', 
+    plot_line_chart(data, 'Number of Parallel Requests', 'Throughput (tokens/second)',
+                    'Parallel Requests vs Throughput',
                     base_directory / 'throughput_plot.png')
 
-    plot_line_chart(df[['Number of Parallel Requests', 'TTFT (ms)']], 
-                    'Number of Parallel Requests', 'TTFT (ms)', 
-                    'Parallel Requests vs Time to First Token', 
+    plot_line_chart(data, 'Number of Parallel Requests', 'TTFT (ms)',
+                    'Parallel Requests vs Time to First Token',
                     base_directory / 'ttft_plot.png')
 
+    if 'Error Rate' in data.columns:
+        plot_line_chart(data, 'Number of Parallel Requests', 'Error Rate',
+                        'Parallel Requests vs Error Rate',
+                        base_directory / 'error_rate_plot.png')
+
+    if slo:
+        plot_line_chart(data, 'Number of Parallel Requests', 'Goodput (tokens/second)',
+                        'Parallel Requests vs Goodput',
+                        base_directory / 'goodput_plot.png')
+
+        plot_line_chart(data, 'Number of Parallel Requests', 'SLO Attainment',
+                        'Parallel Requests vs SLO Attainment',
+                        base_directory / 'slo_attainment_plot.png')
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Process CSV files and generate plots.')
     parser.add_argument('base_directory', type=str, help='The base directory containing the result directories.')
+    parser.add_argument('--slo', nargs='+', metavar='NAME=MS', default=[], help='Per-request SLOs, e.g. ttft=500 tpot=50')
     args = parser.parse_args()
-    plot_benchmark_results(args.base_directory)
\ No newline at end of file
+    slo = {name: float(value) for name, _, value in (item.partition('=') for item in args.slo)}
+    plot_benchmark_results(args.base_directory, slo or None)
@@ -0,0 +1,86 @@
+"""
+Load-generation worker for distributed runs.
+
+Started by ``echoswift.distributed.WorkerPool`` as a local subprocess or over
+SSH (``python3 -m echoswift.worker``). The worker reads JSON lines on stdin:
+the first line configures the async engine, every following line describes
+one benchmark cell (this worker's share of users and request rate). Results
+are written to stdout as JSON lines, ``{"row": {...}}`` per request (failed
+ones carry their error in the row) and ``{"done": <completed>}`` at the end
+of each cell. A ``{"stop": true}`` line cuts the running cell short: requests
+in flight finish, no new ones are sent, and ``done`` follows as usual.
+Logging goes to stderr.
+"""
+import json
+import logging
+import queue
+import sys
+import threading
+from pathlib import Path
+
+from echoswift.async_engine import AsyncLoadEngine
+
+
+def _emit(stream, message: dict):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+def _read(stdin, messages: queue.Queue, stop: threading.Event):
+    # Read ahead on a thread so a stop message reaches the cell that is running
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        message = json.loads(line)
+        if "stop" in message:
+            stop.set()
+        else:
+            messages.put(message)
+    messages.put(None)
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    engine = None
+    messages = queue.Queue()
+    stop = threading.Event()
+    threading.Thread(target=_read, args=(stdin, messages, stop), name="WorkerInput", daemon=True).start()
+
+    def emit(row):
+        _emit(stdout, {"row": row})
+        return stop.is_set()
+
+    try:
+        for message in iter(messages.get, None):
+            if "engine" in message:
+                engine = AsyncLoadEngine(**message["engine"])
+                continue
+            if engine is None:
+                raise ValueError("Worker received a cell before its engine configuration")
+
+            cell = message["cell"]
+            # A stop that arrived after the previous cell ended does not apply to this one
+            stop.clear()
+            completed = engine.run_cell(cell["users"], cell["input_tokens"], cell["max_new_tokens"],
+                                        Path(cell["dataset_file"]), None,
+                                        on_result=emit,
+                                        request_rate=cell.get("request_rate"),
+                                        arrival=cell.get("arrival", "poisson"),
+                                        seed=cell.get("seed"),
+                                        on_error=emit)
+            _emit(stdout, {"done": completed})
+    finally:
+        if engine:
+            engine.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    # Keep stdout for the result protocol; anything else printed goes to stderr
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    serve(sys.stdin, stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,11 @@ setup(
         "transformers",
         "datasets",
         "tabulate",
+        "aiohttp",
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
     entry_points={
         "console_scripts": [
             "echoswift=echoswift.cli:cli",
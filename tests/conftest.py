@@ -0,0 +1,83 @@
+import asyncio
+import csv
+import json
+import threading
+from contextlib import contextmanager
+
+import pytest
+from aiohttp import web
+
+from echoswift import async_engine
+
+
+class WhitespaceTokenizer:
+    """Stands in for a HuggingFace tokenizer: one token per word, whose id is the word's length."""
+
+    def __init__(self, vocab=None):
+        self.vocab = vocab or {"a": 0}
+
+    def encode(self, text):
+        return [len(word) for word in text.split()]
+
+    def get_vocab(self):
+        return self.vocab
+
+
+def write_dataset(path, prompts):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['Input_Prompt'])
+        writer.writeheader()
+        for prompt in prompts:
+            writer.writerow({'Input_Prompt': prompt})
+
+
+@pytest.fixture
+def whitespace_tokenizer(monkeypatch):
+    """Make the async engine load a WhitespaceTokenizer instead of downloading one."""
+    monkeypatch.setattr(async_engine, 'load_tokenizer', lambda name, revision: WhitespaceTokenizer())
+
+
+@pytest.fixture
+def dataset_file(tmp_path):
+    path = tmp_path / "Dataset_32.csv"
+    write_dataset(path, ['tell me a story'])
+    return path
+
+
+@pytest.fixture
+def vllm_stub():
+    async def completions(request):
+        body = await request.json()
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for i in range(body['max_tokens']):
+            chunk = {"choices": [{"text": f" tok{i}"}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post('/v1/completions', completions)
+    with serve_app(app) as base_url:
+        yield f"{base_url}/v1/completions"
+
+
+@contextmanager
+def serve_app(app):
+    """Run an aiohttp app on a free local port in a background thread; yields its base URL."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
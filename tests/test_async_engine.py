@@ -0,0 +1,60 @@
+import csv
+import random
+
+import pytest
+
+from echoswift.async_engine import AsyncLoadEngine, arrival_offsets
+from echoswift.result_sink import RESULT_FIELDNAMES
+from echoswift.utils.itl import read_itl_dump
+
+
+def test_run_cell_writes_locust_compatible_rows(whitespace_tokenizer, vllm_stub, dataset_file, tmp_path):
+    engine = AsyncLoadEngine(vllm_stub, "vLLM", "llama", max_requests=2)
+    output_file = tmp_path / "32_input_tokens.csv"
+    progress = []
+    try:
+        completed = engine.run_cell(3, 32, 4, dataset_file, output_file, on_result=progress.append)
+        completed += engine.run_cell(1, 32, 4, dataset_file, output_file, itl_dump_file=tmp_path / "itl.bin")
+    finally:
+        engine.close()
+
+    assert completed == 8
+    assert len(progress) == 6
+    with open(output_file) as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0].keys()) == RESULT_FIELDNAMES
+    assert len(rows) == 8
+    assert all(row['output_tokens'] == '4' and row['input_tokens'] == '4' for row in rows)
+    # The stub reports no usage and vLLM may pack several tokens per event, so the text is re-tokenized
+    assert all(row['output_tokens_source'] == 'tokenizer' and row['stopped_short'] == '0' for row in rows)
+    assert (dataset_file.parent / '.token_index').is_dir()
+    assert all(float(row['ITL_max(ms)']) >= float(row['ITL_p50(ms)']) for row in rows)
+
+    records = list(read_itl_dump(tmp_path / "itl.bin"))
+    assert [(request, max_new_tokens, len(gaps)) for request, max_new_tokens, gaps in records] == [(1, 4, 3), (2, 4, 3)]
+
+
+def test_arrival_offsets():
+    assert arrival_offsets(3, 2.0, "constant") == [0.0, 0.5, 1.0]
+    poisson = arrival_offsets(2000, 100.0, "poisson", random.Random(1))
+    assert poisson == sorted(poisson)
+    assert (len(poisson) - 1) / poisson[-1] == pytest.approx(100.0, rel=0.1)
+    with pytest.raises(ValueError):
+        arrival_offsets(3, 0, "constant")
+
+
+def test_open_loop_cell_reports_schedule(whitespace_tokenizer, vllm_stub, dataset_file, tmp_path):
+    engine = AsyncLoadEngine(vllm_stub, "vLLM", "llama", max_requests=5)
+    output_file = tmp_path / "32_input_tokens.csv"
+    try:
+        completed = engine.run_cell(2, 32, 4, dataset_file, output_file, request_rate=50.0, arrival="constant")
+    finally:
+        engine.close()
+
+    assert completed == 10
+    with open(output_file) as f:
+        rows = sorted(csv.DictReader(f), key=lambda row: int(row['request']))
+    assert {row['request_rate'] for row in rows} == {'50.0'}
+    offsets = [float(row['start_offset(s)']) for row in rows]
+    assert offsets[-1] == pytest.approx(9 / 50.0, abs=0.05)
+    assert all(float(row['send_lag(ms)']) >= 0 for row in rows)
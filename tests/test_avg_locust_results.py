@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from echoswift.utils.avg_locust_results import aggregate_results, calculate_averages, request_slos
+
+
+def make_results(n, users=4, input_tokens=32, output_tokens=(128, 256), seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for out in output_tokens:
+        frames.append(pd.DataFrame({
+            'request': np.arange(n),
+            'input_tokens': input_tokens,
+            'output_tokens': out,
+            'latency(ms)': rng.uniform(100, 200, n),
+            'throughput(tokens/second)': rng.uniform(10, 20, n),
+            'latency_per_token(ms/token)': rng.uniform(1, 2, n),
+            'TTFT(ms)': rng.uniform(5, 50, n),
+            'users': users,
+            'target_input_tokens': input_tokens,
+            'target_output_tokens': out,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_aggregate_groups_by_cell_columns_with_percentiles():
+    df = make_results(1000)
+    summary = aggregate_results(df)
+
+    assert summary['output tokens'].tolist() == [128, 256]
+    assert summary['requests'].tolist() == [1000, 1000]
+    cell = df[df['target_output_tokens'] == 256]['TTFT(ms)']
+    row = summary.iloc[1]
+    assert row['TTFT(ms)'] == pytest.approx(cell.mean())
+    assert row['TTFT(ms)_p99'] == pytest.approx(np.percentile(cell, 99))
+    assert row['TTFT(ms)_std'] == pytest.approx(cell.std())
+    assert row['latency(ms)_max'] == pytest.approx(df[df['target_output_tokens'] == 256]['latency(ms)'].max())
+
+
+def test_aggregate_keeps_percentiles_of_closed_loop_cells():
+    # Closed-loop rows leave request_rate empty, which becomes a NaN group key
+    df = make_results(50).assign(request_rate=np.nan)
+    summary = aggregate_results(df)
+
+    assert 'request rate' not in summary.columns
+    cell = df[df['target_output_tokens'] == 128]['latency_per_token(ms/token)']
+    assert summary.iloc[0]['latency_per_token(ms/token)_p95'] == pytest.approx(np.percentile(cell, 95))
+
+
+
+def test_aggregate_pools_itl_gaps_across_requests():
+    # Two requests, one with a tail stall: the mean of their p99s hides it, the pooled p99 does not
+    df = make_results(2, output_tokens=(4,)).assign(request_rate=np.nan)
+    gaps = [np.array([1.0] * 99 + [1.0]), np.array([1.0] * 90 + [100.0] * 10)]
+    for name, q in (('p50', 50), ('p90', 90), ('p99', 99)):
+        df[f'ITL_{name}(ms)'] = [np.percentile(g, q) for g in gaps]
+    df['ITL_max(ms)'] = [g.max() for g in gaps]
+    itl_gaps = pd.DataFrame({'gap(ms)': np.concatenate(gaps), 'users': 4, 'target_input_tokens': 32,
+                             'target_output_tokens': 4, 'request_rate': ''})
+
+    summary = aggregate_results(df).iloc[0]
+    assert 'ITL_p99(ms)' not in summary.index
+    assert summary['ITL_p99_mean(ms)'] == pytest.approx(df['ITL_p99(ms)'].mean())
+
+    pooled = aggregate_results(df, itl_gaps=itl_gaps).iloc[0]
+    assert pooled['ITL_p90(ms)'] == pytest.approx(np.percentile(np.concatenate(gaps), 90))
+    assert pooled['ITL_p99(ms)'] == pytest.approx(100.0)
+    assert pooled['ITL_max(ms)'] == 100.0
+
+def test_calculate_averages_handles_large_files(tmp_path):
+    input_file = tmp_path / "32_input_tokens.csv"
+    output_file = tmp_path / "avg_32_input_tokens.csv"
+    make_results(200_000, output_tokens=(256,)).to_csv(input_file, index=False)
+
+    calculate_averages(input_file, output_file)
+
+    avg = pd.read_csv(output_file)
+    assert avg.columns[0] == 'output tokens'
+    assert {'throughput(tokens/second)', 'TTFT(ms)_p95', 'latency(ms)_min'} <= set(avg.columns)
+    assert avg['requests'].tolist() == [200_000]
+
+
+def test_calculate_averages_labels_legacy_results(tmp_path):
+    input_file = tmp_path / "32_input_tokens.csv"
+    output_file = tmp_path / "avg_32_input_tokens.csv"
+    make_results(10, output_tokens=(64,)).drop(columns=['users', 'target_input_tokens', 'target_output_tokens']) \
+        .to_csv(input_file, index=False)
+
+    with pytest.raises(ValueError):
+        calculate_averages(input_file, output_file)
+    calculate_averages(input_file, output_file, tokens=[64])
+    assert pd.read_csv(output_file)['output tokens'].tolist() == [64]
+
+
+def test_slo_attainment_and_goodput():
+    # Ten requests sent one second apart, each taking one second: the cell spans 10s
+    df = make_results(10, output_tokens=(100,)).assign(**{
+        'start_epoch': 1.7e9 + np.arange(10),
+        'latency(ms)': 1000.0,
+        'TTFT(ms)': [100.0] * 6 + [900.0] * 4,
+        'latency_per_token(ms/token)': [5.0] * 8 + [np.nan] * 2,
+    })
+    summary = aggregate_results(df, slo={"ttft": 500, "tpot": 10}).iloc[0]
+
+    # Four requests miss the TTFT SLO, and two of those have no TPOT either
+    assert summary['slo attainment'] == pytest.approx(0.6)
+    assert summary['goodput(requests/second)'] == pytest.approx(0.6)
+    assert summary['goodput(tokens/second)'] == pytest.approx(60)
+    assert 'slo attainment' not in aggregate_results(df).columns
+
+    summary = aggregate_results(df, slo={"latency": 999}).iloc[0]
+    assert summary['slo attainment'] == 0 and summary['goodput(tokens/second)'] == 0
+
+
+def test_request_slos_are_validated():
+    assert request_slos({"TTFT": 500, "latency(ms)": 4000}) == {"TTFT(ms)": 500.0, "latency(ms)": 4000.0}
+    with pytest.raises(ValueError):
+        request_slos({"ttft_p99": 500})
+    with pytest.raises(ValueError):
+        request_slos({"tpot": 0})
@@ -42,7 +42,7 @@ def test_dataprep_command(mock_create_config, mock_download, runner):
     result = runner.invoke(cli, ['dataprep'])
     assert result.exit_code == 0
     mock_download.assert_called_once_with("sarthakdwi/EchoSwift-8k")
-    mock_create_config.assert_called_once_with('config.json')
+    mock_create_config.assert_called_once_with('config.json', tokenizer=None)
     assert "Downloading the filtered ShareGPT dataset..." in result.output
     assert "Creating configuration file..." in result.output
     assert "Data preparation completed." in result.output
@@ -53,7 +53,35 @@ def test_dataprep_command_custom_config(mock_create_config, mock_download, runne
     result = runner.invoke(cli, ['dataprep', '--config', 'custom_config.json'])
     assert result.exit_code == 0
     mock_download.assert_called_once_with("sarthakdwi/EchoSwift-8k")
-    mock_create_config.assert_called_once_with('custom_config.json')
+    mock_create_config.assert_called_once_with('custom_config.json', tokenizer=None)
+
+@patch('echoswift.cli.build_dataset_token_indexes', return_value=2)
+@patch('echoswift.cli.download_dataset_files')
+@patch('echoswift.cli.create_config')
+def test_dataprep_command_with_tokenizer(mock_create_config, mock_download, mock_build_index, runner):
+    result = runner.invoke(cli, ['dataprep', '--tokenizer', 'meta-llama/Meta-Llama-3-8B'])
+    assert result.exit_code == 0
+    mock_build_index.assert_called_once_with(Path("Input_Dataset"), 'meta-llama/Meta-Llama-3-8B', 'main', False)
+    mock_create_config.assert_called_once_with('config.json', tokenizer='meta-llama/Meta-Llama-3-8B')
+    assert "Indexed 2 dataset files." in result.output
+
+@patch('echoswift.cli.build_dataset_token_indexes', return_value=2)
+@patch('echoswift.cli.load_tokenizer')
+@patch('echoswift.cli.generate_synthetic_datasets')
+@patch('echoswift.cli.download_dataset_files')
+@patch('echoswift.cli.create_config')
+def test_dataprep_command_synthetic(mock_create_config, mock_download, mock_generate, mock_load_tokenizer,
+                                    mock_build_index, runner):
+    result = runner.invoke(cli, ['dataprep', '--synthetic', '--input-tokens', '128', '--input-tokens', '512',
+                                 '--prefix-ratio', '0.25', '--prefix-pool', '4'])
+    assert result.exit_code == 0
+    mock_download.assert_not_called()
+    mock_generate.assert_called_once_with(mock_load_tokenizer.return_value, (128, 512), Path("Input_Dataset"),
+                                          num_prompts=1000, prefix_ratio=0.25, prefix_pool_size=4,
+                                          length_distribution='fixed', length_spread=0.1, seed=0)
+    mock_build_index.assert_called_once_with(Path("Input_Dataset"), 'hf-internal-testing/llama-tokenizer', 'main', False)
+    mock_create_config.assert_called_once_with('config.json', tokenizer='hf-internal-testing/llama-tokenizer',
+                                               input_tokens=(128, 512))
 
 def test_start_command_without_config(runner):
     result = runner.invoke(cli, ['start'])
@@ -83,6 +111,8 @@ def test_start_command_with_config(mock_tabulate, mock_concat, mock_read_csv, mo
     mock_path.return_value.iterdir.return_value = [Mock()]
     
     mock_benchmark_instance = mock_echoswift.return_value
+    mock_benchmark_instance.sweep.return_value = [(3, 32, [(256, None)])]
+    mock_benchmark_instance.result_name.return_value = "32_input_tokens"
 
     mock_df = pd.DataFrame({
         'Users': [3],
@@ -105,11 +135,29 @@ def test_start_command_with_config(mock_tabulate, mock_concat, mock_read_csv, mo
         api_url=mock_config['base_url'],
         inference_server=mock_config['inference_server'],
         model_name=mock_config['model'],
+        seed=None,
         max_requests=mock_config['max_requests'],
         user_counts=mock_config['user_counts'],
         input_tokens=mock_config['input_tokens'],
         output_tokens=mock_config['output_tokens'],
-        dataset_dir=str(mock_path.return_value)
+        dataset_dir=str(mock_path.return_value),
+        engine='locust',
+        tokenizer='hf-internal-testing/llama-tokenizer',
+        tokenizer_revision='main',
+        dump_itl=False,
+        result_format='csv',
+        load_mode='closed',
+        request_rates=None,
+        arrival='poisson',
+        workers=None,
+        metrics_port=None,
+        log_generated_text=False,
+        server_metrics=None,
+        sessions=None,
+        lengths=None,
+        slo=None,
+        timeouts=None,
+        connections=None
     )
     mock_benchmark_instance.run_benchmark.assert_called_once()
     mock_read_csv.assert_called()
@@ -151,10 +199,25 @@ def test_plot_command_with_results_dir(mock_plot, runner, tmp_path):
     result = runner.invoke(cli, ['plot', '--results-dir', str(results_dir)])
     
     assert result.exit_code == 0
-    mock_plot.assert_called_once_with(results_dir)
+    mock_plot.assert_called_once_with(results_dir, slo=None)
     assert f"Plots have been generated and saved in {results_dir}" in result.output
 
 def test_plot_command_with_invalid_results_dir(runner):
     result = runner.invoke(cli, ['plot', '--results-dir', '/non/existent/path'])
     assert result.exit_code != 0
-    assert 'Error: Invalid value for \'--results-dir\'' in result.output
\ No newline at end of file
+    assert 'Error: Invalid value for \'--results-dir\'' in result.output
+
+@patch('echoswift.report.render_report')
+def test_report_command(mock_report, runner, tmp_path):
+    mock_report.return_value = tmp_path / "report.html"
+
+    result = runner.invoke(cli, ['report', '--results-dir', str(tmp_path)])
+
+    assert result.exit_code == 0
+    mock_report.assert_called_once_with(tmp_path, None)
+    assert f"Report written to {tmp_path / 'report.html'}" in result.output
+
+    mock_report.side_effect = ValueError("No per-request results found")
+    result = runner.invoke(cli, ['report', '--results-dir', str(tmp_path)])
+    assert result.exit_code != 0
+    assert "No per-request results found" in result.output
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from echoswift.cli import cli
+from echoswift.compare import IMPROVEMENT, NO_CHANGE, REGRESSION, compare_runs, relative_change
+
+
+def write_run(run_dir, ttft_scale=1.0, throughput_scale=1.0, n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    for users in (1, 8):
+        user_dir = run_dir / f"{users}_User"
+        user_dir.mkdir(parents=True)
+        pd.DataFrame({
+            'start_epoch': 1.7e9 + np.arange(n),
+            'input_tokens': 32,
+            'output_tokens': 64,
+            # The 8-user cell is the one that changes between runs
+            'TTFT(ms)': rng.gamma(4, 25, n) * (ttft_scale if users == 8 else 1),
+            'latency(ms)': rng.gamma(9, 100, n),
+            'throughput(tokens/second)': rng.normal(40, 4, n) * (throughput_scale if users == 8 else 1),
+            'latency_per_token(ms/token)': rng.normal(25, 2, n),
+            'users': users,
+            'target_input_tokens': 32,
+            'target_output_tokens': 64,
+            'request_rate': '',
+        }).to_csv(user_dir / "32_input_tokens.csv", index=False)
+    return run_dir
+
+
+def test_relative_change_interval():
+    rng = np.random.default_rng(1)
+    baseline = rng.normal(100, 10, 500)
+    estimate, low, high = relative_change(baseline, rng.normal(100, 10, 500), rng=rng)
+    assert low < 0 < high
+    estimate, low, high = relative_change(baseline, rng.normal(110, 10, 500), rng=rng)
+    assert 5 < low < estimate < high < 15
+    # Small samples give wide intervals
+    _, low, high = relative_change(baseline[:5], baseline[5:10] * 1.1, rng=rng)
+    assert high - low > 10
+
+
+def test_compare_flags_only_significant_changes(tmp_path):
+    baseline = write_run(tmp_path / "a", seed=0)
+    candidate = write_run(tmp_path / "b", ttft_scale=1.3, throughput_scale=1.2, seed=1)
+    comparison = compare_runs(baseline, candidate, resamples=500)
+
+    assert len(comparison) == 2 * 3
+    status = comparison.set_index(['users', 'metric'])['status']
+    assert status[(8, 'TTFT(ms)')] == REGRESSION
+    assert status[(8, 'throughput(tokens/second)')] == IMPROVEMENT
+    assert (status.loc[1] == NO_CHANGE).all()
+    assert status[(8, 'latency(ms)')] == NO_CHANGE
+
+    # The same change below its threshold is not a regression
+    comparison = compare_runs(baseline, candidate, thresholds={"ttft": 50}, resamples=500)
+    assert set(comparison['status']) == {NO_CHANGE}
+    with pytest.raises(ValueError):
+        compare_runs(baseline, candidate, thresholds={"goodput": 5})
+
+
+def test_compare_command_exit_code(tmp_path):
+    baseline = write_run(tmp_path / "a", seed=0)
+    candidate = write_run(tmp_path / "b", ttft_scale=1.3, seed=1)
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ['compare', str(baseline), str(tmp_path / "a"), '--resamples', '200'])
+    assert result.exit_code == 0
+    assert "No significant regressions in 6 comparisons" in result.output
+
+    output = tmp_path / "comparison.csv"
+    result = runner.invoke(cli, ['compare', str(baseline), str(candidate), '--threshold', 'ttft=10',
+                                 '--resamples', '200', '--output', str(output)])
+    assert result.exit_code == 3
+    assert "1 significant regression(s) in 2 comparisons" in result.output
+    assert pd.read_csv(output)['metric'].unique().tolist() == ['TTFT(ms)']
+
+    result = runner.invoke(cli, ['compare', str(baseline), str(candidate), '--threshold', 'ttft'])
+    assert result.exit_code == 2
+
+    # Matching cells without any tpot values cannot be compared
+    for results in candidate.glob("*_User/32_input_tokens.csv"):
+        pd.read_csv(results).assign(**{'latency_per_token(ms/token)': np.nan}).to_csv(results, index=False)
+    result = runner.invoke(cli, ['compare', str(baseline), str(candidate), '--threshold', 'tpot=5'])
+    assert result.exit_code == 1
+    assert "No common cells" in result.output
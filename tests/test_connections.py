@@ -0,0 +1,71 @@
+import time
+
+import pandas as pd
+import pytest
+import requests
+
+from conftest import serve_app
+from echoswift.async_engine import AsyncLoadEngine
+from echoswift.connections import NEW, REUSED, TimedHTTPAdapter, connection_phases, connection_settings
+from echoswift.mock_server import MockInferenceServer
+from echoswift.utils.avg_locust_results import aggregate_results
+
+
+def run_async_cell(base_url, dataset_file, output_file, connections=None):
+    engine = AsyncLoadEngine(base_url + "/v1/completions", "vLLM", "m", max_requests=3, connections=connections)
+    try:
+        engine.run_cell(2, 32, 8, dataset_file, output_file)
+    finally:
+        engine.close()
+    return pd.read_csv(output_file)
+
+
+def test_async_engine_records_connection_phases(whitespace_tokenizer, dataset_file, tmp_path):
+    server = MockInferenceServer(ttft_ms=50, tokens_per_second=1000)
+    with serve_app(server.build_app()) as base_url:
+        pooled = run_async_cell(base_url, dataset_file, tmp_path / "pooled.csv")
+        unpooled = run_async_cell(base_url, dataset_file, tmp_path / "unpooled.csv", {"keep_alive": False})
+
+    # The first wave opens one connection per user, later waves reuse them
+    assert pooled['connection'].tolist() == [NEW] * 2 + [REUSED] * 4
+    assert pooled['connect(ms)'].notna().tolist() == [True] * 2 + [False] * 4
+    assert (unpooled['connection'] == NEW).all() and unpooled['connect(ms)'].notna().all()
+    assert (pooled['http_version'] == 1.1).all()
+    # Headers arrive before the server's TTFT delay, the first chunk after it
+    assert (pooled['headers(ms)'] <= pooled['first_chunk(ms)']).all()
+    assert (pooled['first_chunk(ms)'] <= pooled['TTFT(ms)']).all()
+    assert (pooled['first_chunk(ms)'] >= 50).all()
+
+    summary = aggregate_results(pooled).iloc[0]
+    assert summary['new connection rate'] == pytest.approx(2 / 6)
+    assert summary['connect(ms)'] == pytest.approx(pooled['connect(ms)'].mean())
+
+
+def test_timed_adapter_tells_new_from_reused_connections():
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000)
+    payload = {"prompt": "hi", "max_tokens": 4, "stream": True}
+    with serve_app(server.build_app()) as base_url:
+        for keep_alive, expected in ((True, [NEW, REUSED, REUSED]), (False, [NEW] * 3)):
+            session = requests.Session()
+            session.mount("http://", TimedHTTPAdapter(pool_size=1))
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            connections = []
+            for _ in range(3):
+                start_time = time.perf_counter()
+                with session.post(base_url + "/v1/completions", json=payload, stream=True) as response:
+                    phases = connection_phases(response, start_time)
+                    response.content
+                connections.append(phases.get("connection"))
+                assert phases["http_version"] == "1.1"
+                assert (phases.get("connect") is not None) == (phases.get("connection") == NEW)
+                assert 0 < phases["headers"] < time.perf_counter() - start_time
+            assert connections == expected
+
+
+def test_connection_settings():
+    assert connection_settings() == {"keep_alive": True, "pool_size": None, "http2": False}
+    assert connection_settings({"keep_alive": False, "pool_size": 2})["pool_size"] == 2
+    for bad in ({"pool_size": 0}, {"pool_size": 1.5}, {"http2": True}, {"pipelining": True}):
+        with pytest.raises(ValueError):
+            connection_settings(bad)
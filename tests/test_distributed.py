@@ -0,0 +1,90 @@
+import csv
+from pathlib import Path
+
+import pytest
+
+from conftest import serve_app
+from echoswift.distributed import LOCAL_HOST, WorkerPool, split_users, worker_hosts
+from echoswift.mock_server import MockInferenceServer
+
+
+@pytest.fixture
+def local_tokenizer(tmp_path):
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"[UNK]": 0, "tell": 1, "me": 2, "a": 3, "story": 4}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    path = tmp_path / "tokenizer"
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]").save_pretrained(path)
+    return str(path)
+
+
+def test_split_users_spreads_remainder():
+    assert split_users(7, 3) == [3, 2, 2]
+    assert split_users(2, 4) == [1, 1, 0, 0]
+    assert sum(split_users(100, 7)) == 100
+
+
+def test_worker_hosts():
+    assert worker_hosts(2) == [LOCAL_HOST, LOCAL_HOST]
+    assert worker_hosts({"local": 1, "hosts": ["bench@10.0.0.5"]}) == [LOCAL_HOST, "bench@10.0.0.5"]
+    with pytest.raises(ValueError):
+        worker_hosts({"local": 0})
+    with pytest.raises(ValueError):
+        worker_hosts("many")
+
+
+def test_worker_pool_merges_tagged_rows(vllm_stub, local_tokenizer, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dataset_file = tmp_path / "Dataset_32.csv"
+    dataset_file.write_text("Input_Prompt\ntell me a story\n")
+    output_file = tmp_path / "32_input_tokens.csv"
+
+    pool = WorkerPool([LOCAL_HOST, LOCAL_HOST], vllm_stub, "vLLM", "llama", max_requests=2,
+                      tokenizer_name=local_tokenizer, logs_dir=tmp_path)
+    sent = []
+    for worker in pool._workers:
+        def record(message, send=worker.send):
+            sent.append(message)
+            send(message)
+        monkeypatch.setattr(worker, "send", record)
+    try:
+        completed = pool.run_cell(3, 32, 4, dataset_file, output_file)
+        completed += pool.run_cell(1, 32, 4, Path("Dataset_32.csv"), output_file)
+    finally:
+        pool.close()
+
+    with open(output_file, newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    # 3 users and then 1 user, max_requests=2 each, split across two workers
+    assert completed == len(rows) == 8
+    assert sorted(row['worker'] for row in rows) == ['0'] * 6 + ['1'] * 2
+    assert {row['host'] for row in rows} == {LOCAL_HOST}
+    assert {row['users'] for row in rows} == {'3', '1'}
+    # Workers may start in another directory, so they get the absolute dataset path
+    assert {message["cell"]["dataset_file"] for message in sent} == {str(dataset_file.resolve())}
+
+
+def test_worker_pool_stops_the_cell_when_on_result_returns_true(local_tokenizer, tmp_path):
+    dataset_file = tmp_path / "Dataset_32.csv"
+    dataset_file.write_text("Input_Prompt\ntell me a story\n")
+    output_file = tmp_path / "32_input_tokens.csv"
+    server = MockInferenceServer(ttft_ms=50, tokens_per_second=1000)
+
+    with serve_app(server.build_app()) as base_url:
+        pool = WorkerPool([LOCAL_HOST, LOCAL_HOST], base_url + "/v1/completions", "vLLM", "llama", max_requests=10,
+                          tokenizer_name=local_tokenizer)
+        try:
+            aborted = pool.run_cell(2, 32, 4, dataset_file, output_file, on_result=lambda row: True)
+            # The stopped cell's rows do not leak into the next one
+            completed = pool.run_cell(2, 32, 4, dataset_file, None)
+        finally:
+            pool.close()
+
+    with open(output_file, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert 2 <= aborted == len(rows) < 20
+    assert completed == 20
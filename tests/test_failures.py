@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import serve_app
+from echoswift.async_engine import AsyncLoadEngine
+from echoswift.mock_server import MockInferenceServer
+from echoswift.result_sink import ResultSink
+from echoswift.streaming import DEFAULT_TIMEOUTS, request_timeouts
+from echoswift.utils.avg_locust_results import aggregate_results, failed_requests
+
+
+def test_every_attempt_is_recorded(whitespace_tokenizer, dataset_file, tmp_path):
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000, error_rate=0.3, stall_rate=0.3, stall_ms=1000,
+                                 seed=3)
+    output_file = tmp_path / "32_input_tokens.csv"
+    errors = []
+    with serve_app(server.build_app()) as base_url:
+        engine = AsyncLoadEngine(base_url + "/v1/completions", "vLLM", "m", max_requests=5,
+                                 timeouts={"read": 0.2})
+        try:
+            completed = engine.run_cell(4, 32, 8, dataset_file, output_file, on_error=errors.append)
+        finally:
+            engine.close()
+
+    rows = pd.read_csv(output_file)
+    failed = failed_requests(rows)
+    assert len(rows) == 20 and completed == 20 - failed.sum() == 20 - len(errors)
+
+    rejected = rows[rows['http_status'] == 503]
+    assert len(rejected) and (rejected['error'] == "ClientResponseError").all()
+    assert (rejected['output_tokens'] == 0).all() and rejected['TTFT(ms)'].isna().all()
+
+    # Stalled streams time out halfway, keeping what arrived before the stall
+    stalled = rows[rows['timed_out'] == 1]
+    assert len(stalled) and (stalled['http_status'] == 200).all()
+    assert (stalled['output_tokens'] == 4).all() and stalled['TTFT(ms)'].notna().all()
+    assert stalled['throughput(tokens/second)'].isna().all()
+    assert (rows[~failed]['error'].isna()).all() and (rows[~failed]['output_tokens'] == 8).all()
+
+    summary = aggregate_results(rows).iloc[0]
+    assert summary['requests'] == 20
+    assert summary['error rate'] == pytest.approx(failed.mean())
+    assert summary['timeout rate'] == pytest.approx(len(stalled) / 20)
+    # The latency statistics only cover the requests that completed
+    assert summary['latency(ms)_max'] == pytest.approx(rows[~failed]['latency(ms)'].max())
+    assert summary['latency(ms)_max'] < 1000 * DEFAULT_TIMEOUTS["read"]
+
+
+def test_failed_requests_miss_the_slos():
+    df = pd.DataFrame({
+        'start_epoch': 1.7e9 + np.arange(4), 'input_tokens': 32, 'output_tokens': [16, 16, 8, 0],
+        'latency(ms)': [100.0, 100.0, 50.0, 10.0], 'TTFT(ms)': [10.0, 10.0, 10.0, np.nan],
+        'throughput(tokens/second)': [100.0, 300.0, np.nan, np.nan],
+        'latency_per_token(ms/token)': [5.0, 5.0, np.nan, np.nan],
+        'users': 1, 'target_input_tokens': 32, 'target_output_tokens': 16,
+        'http_status': [200, 200, 200, 503], 'error': [np.nan, np.nan, "TimeoutError", "ClientResponseError"],
+        'timed_out': [0, 0, 1, 0],
+    })
+    summary = aggregate_results(df, slo={"ttft": 500}).iloc[0]
+    assert summary['error rate'] == 0.5 and summary['timeout rate'] == 0.25
+    assert summary['throughput(tokens/second)'] == 200 and summary['TTFT(ms)'] == 10
+    assert summary['slo attainment'] == 0.5
+
+
+def test_parquet_results_keep_their_schema_across_failures(tmp_path):
+    path = tmp_path / "32_input_tokens.parquet"
+    sink = ResultSink(path, ['TTFT(ms)', 'error', 'timed_out'], "parquet", batch_size=1)
+    sink.write({'TTFT(ms)': '', 'error': "ClientConnectorError", 'timed_out': 0})
+    sink.flush()
+    sink.write({'TTFT(ms)': '12.5', 'error': '', 'timed_out': 0})
+    sink.close()
+    rows = pd.read_parquet(path)
+    assert failed_requests(rows).tolist() == [True, False]
+    assert rows['TTFT(ms)'].tolist()[1] == 12.5
+
+
+def test_request_timeouts():
+    assert request_timeouts(None) == DEFAULT_TIMEOUTS
+    assert request_timeouts({"total": 60, "read": None}) == {"connect": 30.0, "read": None, "total": 60.0}
+    with pytest.raises(ValueError):
+        request_timeouts({"first_token": 5})
+    with pytest.raises(ValueError):
+        request_timeouts({"connect": 0})
@@ -0,0 +1,111 @@
+import json
+import random
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from conftest import serve_app
+from echoswift.cli import cli
+from echoswift.lengths import length_distribution
+from echoswift.llm_inference_benchmark import EchoSwift
+from echoswift.mock_server import MockInferenceServer
+from echoswift.utils.avg_locust_results import length_buckets
+
+
+def samples(spec, n=2000):
+    sample = length_distribution(spec)
+    rng = random.Random(0)
+    return [sample(rng) for _ in range(n)]
+
+
+def test_length_distributions():
+    assert set(samples(7, 10)) == {7}
+    assert set(samples({"type": "empirical", "values": [3, 9]})) == {3, 9}
+    uniform = samples({"type": "uniform", "min": 10, "max": 20})
+    assert min(uniform) == 10 and max(uniform) == 20
+    normal = samples({"type": "normal", "mean": 10, "std": 20, "max": 30})
+    assert min(normal) == 1 and max(normal) == 30
+    lognormal = samples({"type": "lognormal", "mean": 200, "std": 300}, 20000)
+    assert 180 < sum(lognormal) / len(lognormal) < 220
+    assert sorted(lognormal)[len(lognormal) // 2] < 150  # Long right tail: median below the mean
+    mix = samples({"type": "mix", "components": [{"weight": 3, "type": "empirical", "values": [1]},
+                                                 {"weight": 1, "type": "empirical", "values": [2]}]})
+    assert 0.7 < mix.count(1) / len(mix) < 0.8
+
+    for spec in ({"type": "zipf"}, {"type": "normal", "mean": 10}, 0, "100", {"type": "mix", "components": []}):
+        with pytest.raises(ValueError):
+            length_distribution(spec)
+
+
+def test_length_buckets():
+    lengths = pd.Series([1, 2, 3, 100, 128, 129, 700])
+    assert length_buckets(lengths, [128, 512]).tolist() == ["1-128"] * 5 + ["129-512", "513+"]
+    assert length_buckets(lengths).tolist() == ["1", "2", "3-4", "65-128", "65-128", "129-256", "513-1024"]
+
+
+@pytest.mark.parametrize("prompts", ["dataset", "synthetic"])
+def test_mixed_lengths_run(whitespace_tokenizer, tmp_path, prompts):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\na b\na b c d e f g h\n")
+    (dataset_dir / "Dataset_64.csv").write_text("Input_Prompt\n" + " ".join(["w"] * 40) + "\n")
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000)
+    lengths = {
+        "input": {"type": "uniform", "min": 2, "max": 40} if prompts == "synthetic" else {"type": "empirical"},
+        "output": {"type": "mix", "components": [{"weight": 1, "type": "uniform", "min": 1, "max": 4},
+                                                 {"weight": 1, "type": "uniform", "min": 30, "max": 40}]},
+        "prompts": prompts,
+        "buckets": {"output": [8]},
+    }
+
+    with serve_app(server.build_app()) as base_url:
+        benchmark = EchoSwift(tmp_path / "results", base_url + "/v1/completions", "vLLM", "m", max_requests=10,
+                              user_counts=[3], dataset_dir=str(dataset_dir), engine="async", seed=1, lengths=lengths,
+                              dump_itl=True)
+        benchmark.run_benchmark()
+
+    user_dir = tmp_path / "results" / "3_User"
+    rows = pd.read_csv(user_dir / "mixed_lengths.csv")
+    assert len(rows) == 30
+    assert (rows['output_tokens'] == rows['target_output_tokens']).all()
+    assert rows['target_output_tokens'].between(1, 40).all() and rows['target_output_tokens'].nunique() > 3
+    if prompts == "synthetic":
+        assert (rows['input_tokens'] == rows['target_input_tokens']).all()
+        assert rows['input_tokens'].nunique() > 3
+    else:
+        # Empirical: prompts straight from every dataset file
+        assert set(rows['input_tokens']) <= {2, 8, 40} and rows['input_tokens'].nunique() > 1
+
+    summary = pd.read_csv(user_dir / "avg_mixed_lengths.csv")
+    assert summary['requests'].tolist() == [30]
+    assert summary['generated tokens'][0] == pytest.approx(rows['output_tokens'].mean(), abs=1e-3)
+    assert summary['ITL_p99(ms)'].notna().all()
+
+    by_bucket = pd.read_csv(user_dir / "avg_by_bucket_mixed_lengths.csv")
+    assert set(by_bucket['output bucket']) == {"1-8", "9+"}
+    assert by_bucket['requests'].sum() == 30
+
+
+
+def test_start_prints_the_mixed_lengths_summary(whitespace_tokenizer, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Input_Dataset").mkdir()
+    (tmp_path / "Input_Dataset" / "Dataset_32.csv").write_text("Input_Prompt\na b\na b c d\n")
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000)
+
+    with serve_app(server.build_app()) as base_url:
+        config = {"out_dir": "results", "base_url": base_url + "/v1/completions", "inference_server": "vLLM",
+                  "model": "m", "max_requests": 2, "user_counts": [2], "input_tokens": [32], "output_tokens": [8],
+                  "engine": "async", "lengths": {"input": {"type": "empirical"}, "output": 4}}
+        (tmp_path / "config.json").write_text(json.dumps(config))
+        result = CliRunner().invoke(cli, ['start', '--config', 'config.json'])
+
+    assert result.exit_code == 0, result.output
+    assert "mixed" in result.output and "Tests completed successfully" in result.output
+
+def test_lengths_need_the_async_engine_and_an_output_distribution():
+    with pytest.raises(ValueError):
+        EchoSwift("out", "http://host/v1/completions", "vLLM", "m", lengths={"output": 64})
+    with pytest.raises(ValueError):
+        EchoSwift("out", "http://host/v1/completions", "vLLM", "m", engine="async", lengths={"input": 64})
@@ -0,0 +1,75 @@
+import json
+
+import pandas as pd
+
+from conftest import serve_app
+from echoswift.llm_inference_benchmark import EchoSwift
+from echoswift.manifest import COMPLETE, FAILED, PARTIAL, CellManifest, cell_key
+from echoswift.mock_server import MockInferenceServer
+
+
+def test_cell_key_is_stable_and_parameter_sensitive():
+    params = {"api_url": "http://x", "users": 2, "output_tokens": 64}
+    assert cell_key(params) == cell_key(dict(reversed(list(params.items()))))
+    assert cell_key(params) != cell_key({**params, "users": 3})
+
+
+def test_manifest_tracks_cell_status(tmp_path):
+    manifest = CellManifest(tmp_path)
+    cell_file = tmp_path / "1_User" / "cells" / "a.csv"
+    cell_file.parent.mkdir(parents=True)
+    cell_file.write_text("request\n1\n")
+
+    manifest.start("a", {"users": 1}, cell_file, expected=2)
+    assert not manifest.is_complete("a")
+    assert manifest.finish("a", 1) == PARTIAL
+    assert CellManifest(tmp_path).cells["a"]["status"] == PARTIAL
+    manifest.start("a", {"users": 1}, cell_file, expected=2)
+    assert manifest.finish("a", 0) == FAILED
+    manifest.start("a", {"users": 1}, cell_file, expected=2)
+    assert manifest.finish("a", 2) == COMPLETE
+    assert CellManifest(tmp_path).is_complete("a")
+
+
+def test_rerun_skips_completed_cells(whitespace_tokenizer, tmp_path):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\ntell me a story\n")
+    output_dir = tmp_path / "results"
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000)
+
+    def run(**settings):
+        EchoSwift(output_dir, base_url + "/v1/completions", "vLLM", "mock", max_requests=2, user_counts=[2],
+                  input_tokens=[32], output_tokens=[4, 8], dataset_dir=str(dataset_dir), engine="async",
+                  **settings).run_benchmark()
+
+    with serve_app(server.build_app()) as base_url:
+        run()
+        assert server.requests_total == 8
+
+        # A rerun sends nothing and rebuilds the merged file without duplicating rows
+        run()
+        assert server.requests_total == 8
+        assert len(pd.read_csv(output_dir / "2_User" / "32_input_tokens.csv")) == 8
+
+        # Only the cell that did not complete is sent again
+        manifest_file = output_dir / "manifest.json"
+        manifest = json.loads(manifest_file.read_text())
+        failed = next(entry for entry in manifest["cells"].values() if entry["params"]["output_tokens"] == 8)
+        failed["status"] = FAILED
+        manifest_file.write_text(json.dumps(manifest))
+        run()
+        assert server.requests_total == 12
+
+        # Requesting ITL dumps re-runs the completed cells that have none, once
+        run(dump_itl=True)
+        assert server.requests_total == 20
+        assert len(list((output_dir / "2_User" / "cells").glob("*.itl.bin"))) == 2
+        run(dump_itl=True)
+        assert server.requests_total == 20
+
+    avg = pd.read_csv(output_dir / "2_User" / "avg_32_input_tokens.csv")
+    assert avg['output tokens'].tolist() == [4, 8]
+    assert avg['requests'].tolist() == [4, 4]
+    # With the dumps, the cells report percentiles of all their gaps next to the per-request means
+    assert avg[['ITL_p99(ms)', 'ITL_p99_mean(ms)']].notna().all().all()
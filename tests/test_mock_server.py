@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from conftest import serve_app
+from echoswift.async_engine import AsyncLoadEngine
+from echoswift.mock_server import MockInferenceServer
+from echoswift.streaming import StreamCollector, get_adapter
+
+ROUTES = {
+    "TGI": "/generate_stream",
+    "Ollama": "/api/generate",
+    "Llamacpp": "/completion",
+    "vLLM": "/v1/completions",
+    "NIMS": "/v1/chat/completions",
+}
+
+
+async def _collect(url, inference_server, max_new_tokens):
+    adapter = get_adapter(inference_server)
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        async with session.post(url, json=adapter.build_payload("hello", max_new_tokens, "mock")) as response:
+            collector = StreamCollector(adapter, start)
+            async for line in response.content:
+                if collector.feed(line):
+                    break
+    return collector
+
+
+@pytest.mark.parametrize("inference_server", sorted(ROUTES))
+def test_wire_formats_parse(inference_server):
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000)
+    with serve_app(server.build_app()) as base_url:
+        collector = asyncio.run(_collect(base_url + ROUTES[inference_server], inference_server, 5))
+
+    assert collector.token_events == 5
+    assert collector.parse_errors == 0
+    assert collector.text.split() == ["the", "of", "and", "to", "in"]
+    # Every server reports its own token count
+    assert collector.output_tokens() == (5, "server")
+
+
+def test_measured_timing_matches_injected(whitespace_tokenizer, dataset_file):
+    server = MockInferenceServer(ttft_ms=80, tokens_per_second=50)
+
+    rows = []
+    with serve_app(server.build_app()) as base_url:
+        engine = AsyncLoadEngine(base_url + ROUTES["vLLM"], "vLLM", "mock", max_requests=1)
+        try:
+            engine.run_cell(2, 32, 6, dataset_file, None, on_result=rows.append)
+        finally:
+            engine.close()
+
+    assert len(rows) == 2
+    for row in rows:
+        assert row['output_tokens'] == 6
+        assert 80 <= float(row['TTFT(ms)']) < 80 + 50
+        assert 20 <= float(row['ITL_p50(ms)']) < 20 + 10
+
+
+def test_max_concurrency_queues_requests():
+    server = MockInferenceServer(ttft_ms=50, tokens_per_second=1000, max_concurrency=1)
+
+    async def run(url):
+        return await asyncio.gather(*[_collect(url, "TGI", 1) for _ in range(3)])
+
+    with serve_app(server.build_app()) as base_url:
+        collectors = asyncio.run(run(base_url + ROUTES["TGI"]))
+
+    # One request at a time: the slowest waits for the two before it
+    assert max(c.ttft for c in collectors) >= 0.15
+    assert server.requests_total == 3
+
+
+def test_cancelled_waiting_request_leaves_the_queue():
+    server = MockInferenceServer(ttft_ms=0, max_concurrency=1)
+
+    async def run():
+        server._slots = asyncio.Semaphore(0)  # Every slot taken
+        waiting = asyncio.ensure_future(server._stream(None, 1, 'text/event-stream', lambda i, word, last: b""))
+        await asyncio.sleep(0.01)
+        assert server.requests_waiting == 1
+        # The client disconnects while the request is queued
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
+    assert server.requests_waiting == 0
@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import serve_app
+from echoswift.mock_server import MockInferenceServer
+from echoswift.multi_target import COMPARISON_FILE, MultiTargetBenchmark
+
+
+class RecordingServer(MockInferenceServer):
+    """Mock server that remembers the prompts it was sent."""
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.prompts = []
+
+    async def _vllm(self, request):
+        self.prompts.append((await request.json())['prompt'])
+        return await super()._vllm(request)
+
+
+def test_targets_get_identical_prompts_and_a_comparison(whitespace_tokenizer, tmp_path):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\n" + "".join(f"prompt {i}\n" for i in range(50)))
+    fast = RecordingServer(ttft_ms=0, tokens_per_second=1000)
+    slow = RecordingServer(ttft_ms=30, tokens_per_second=1000)
+
+    with serve_app(fast.build_app()) as fast_url, serve_app(slow.build_app()) as slow_url:
+        targets = [
+            {"name": "fast", "base_url": fast_url + "/v1/completions", "inference_server": "vLLM", "model": "a"},
+            {"name": "slow", "base_url": slow_url + "/v1/completions", "inference_server": "vLLM", "model": "b"},
+        ]
+        benchmark = MultiTargetBenchmark.from_targets(tmp_path / "results", targets, max_requests=3,
+                                                      user_counts=[1], input_tokens=[32], output_tokens=[4, 8],
+                                                      dataset_dir=str(dataset_dir), engine="async")
+        comparison = benchmark.run_benchmark()
+
+    # Closed-loop waves with one user: the request order is deterministic
+    assert len(fast.prompts) == 6
+    assert fast.prompts == slow.prompts
+    assert (tmp_path / "results" / "fast" / "1_User" / "avg_32_input_tokens.csv").exists()
+    assert (tmp_path / "results" / COMPARISON_FILE).exists()
+    assert comparison['target'].tolist() == ['fast', 'slow', 'fast', 'slow']
+    fast_ttft, slow_ttft = comparison[comparison['output tokens'] == 4]['TTFT(ms)']
+    assert slow_ttft > fast_ttft + 20
+
+
+def test_targets_need_unique_names():
+    target = {"base_url": "http://host:8000/v1/completions", "inference_server": "vLLM", "model": "m"}
+    with pytest.raises(ValueError):
+        MultiTargetBenchmark.from_targets("out", [target, target], engine="async")
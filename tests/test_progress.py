@@ -0,0 +1,54 @@
+import json
+import os
+import socket
+import urllib.request
+
+from echoswift.progress import ProgressTracker, progress_writer, register_tracker, start_metrics_server
+
+
+def test_tracker_counts_and_rolling_stats():
+    tracker = ProgressTracker("http://a", window=3)
+    tracker.start_cell(2, 32, 64)
+    for ttft in (10, 20, 30, 40):
+        tracker.record(ttft, 100.0)
+    assert tracker.record_message({"ttft_ms": 50, "throughput": 200.0})
+    assert not tracker.record_message({"failed": 1})
+
+    assert tracker.completed == 5
+    assert tracker.failed == 1
+    # Only the last three requests are in the window
+    assert tracker.rolling()["ttft_p50"] == 40
+    assert tracker.postfix() == {"failed": 1, "ttft": "40ms", "tok_s": "133.3"}
+
+
+def test_progress_writer_uses_pipe(monkeypatch):
+    read_fd, write_fd = os.pipe()
+    monkeypatch.setenv("PROGRESS_FD", str(write_fd))
+    write = progress_writer()
+    write(ttft_ms=12.5, throughput=80.0)
+    write(failed=1)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        messages = [json.loads(line) for line in pipe]
+    assert messages == [{"ttft_ms": 12.5, "throughput": 80.0}, {"failed": 1}]
+
+    monkeypatch.delenv("PROGRESS_FD")
+    assert progress_writer() is None
+
+
+def test_metrics_endpoint():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    tracker = ProgressTracker("http://metrics-test")
+    tracker.start_cell(4, 128, 256)
+    tracker.record(25.0, 90.0)
+    register_tracker(tracker)
+    server = start_metrics_server(port, host="127.0.0.1")
+    port = server.server_address[1]
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        body = response.read().decode()
+    assert 'echoswift_requests_completed_total{target="http://metrics-test"} 1' in body
+    assert 'echoswift_ttft_ms{target="http://metrics-test",quantile="0.99"} 25.000' in body
+    assert 'users="4"' in body
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+
+from conftest import write_dataset
+from echoswift.prompt_store import build_prompt_store, ensure_prompt_store, load_prompt_store, shared_prompt_store
+
+
+def test_store_roundtrip(tmp_path):
+    dataset = tmp_path / "Dataset_32.csv"
+    prompts = ["one two", "", "naïve café, \"quoted\"\nand multi-line", "日本語"]
+    write_dataset(dataset, prompts)
+
+    build_prompt_store(dataset)
+    store = load_prompt_store(dataset)
+    assert isinstance(store.buffer, np.memmap)
+    assert len(store) == 4 and list(store) == prompts
+    assert store[-1] == prompts[-1] and store[1:3] == prompts[1:3]
+    assert store.lengths.tolist() == [len(p.encode("utf-8")) for p in prompts]
+
+
+def test_store_is_rebuilt_when_the_dataset_changes(tmp_path):
+    dataset = tmp_path / "Dataset_32.csv"
+    write_dataset(dataset, ["a b"])
+    ensure_prompt_store(dataset)
+
+    write_dataset(dataset, ["c", "d e f"])
+    os.utime(dataset, ns=(1, 1))
+    assert load_prompt_store(dataset) is None
+    assert list(ensure_prompt_store(dataset)) == ["c", "d e f"]
+
+    write_dataset(dataset, [])
+    assert len(ensure_prompt_store(dataset)) == 0
+    assert len(load_prompt_store(dataset)) == 0
+
+
+def test_store_is_shared_within_a_process(tmp_path):
+    dataset = tmp_path / "Dataset_32.csv"
+    write_dataset(dataset, ["a b", "c"])
+    assert shared_prompt_store(dataset) is shared_prompt_store(dataset)
+    assert (tmp_path / ".prompt_store" / "Dataset_32.prompts.npy").exists()
+    assert not list((tmp_path / ".prompt_store").glob("*.partial"))
@@ -0,0 +1,64 @@
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import serve_app
+from echoswift.llm_inference_benchmark import EchoSwift
+from echoswift.mock_server import MockInferenceServer
+from echoswift.replay import TraceReplay, load_trace
+
+
+TRACE = [
+    {"timestamp": "2026-01-01T00:00:00.400Z", "input_tokens": 3, "output_tokens": 2},
+    {"timestamp": "2026-01-01T00:00:00Z", "input_tokens": 5, "output_tokens": 4},
+    {"timestamp": "2026-01-01T00:00:00.200Z", "input_tokens": 4, "output_tokens": 3, "prompt": "one two"},
+    {"timestamp": "2026-01-01T00:00:00.200Z", "input_tokens": 8, "output_tokens": 6},
+]
+
+
+def test_load_trace_sorts_and_offsets(tmp_path):
+    trace_file = tmp_path / "trace.jsonl"
+    trace_file.write_text("\n".join(json.dumps(entry) for entry in TRACE) + "\n")
+    trace = load_trace(trace_file)
+    assert [r["offset"] for r in trace] == pytest.approx([0.0, 0.2, 0.2, 0.4])
+    assert [r["input_tokens"] for r in trace] == [5, 4, 8, 3]
+
+    trace_file.write_text('{"timestamp": 1, "input_tokens": 3}\n')
+    with pytest.raises(ValueError, match="trace.jsonl:1"):
+        load_trace(trace_file)
+
+
+@pytest.mark.parametrize("prompts", ["dataset", "synthetic"])
+def test_replay_keeps_recorded_timing_and_lengths(whitespace_tokenizer, tmp_path, prompts):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\na b c\na b c d e\na b c d e f g h i\n")
+    trace_file = tmp_path / "trace.jsonl"
+    trace_file.write_text("\n".join(json.dumps(entry) for entry in TRACE) + "\n")
+    server = MockInferenceServer(ttft_ms=0, tokens_per_second=1000)
+
+    with serve_app(server.build_app()) as base_url:
+        benchmark = EchoSwift(tmp_path / "results", base_url + "/v1/completions", "vLLM", "m",
+                              dataset_dir=str(dataset_dir), engine="async")
+        replay = TraceReplay(benchmark, trace_file, speed=2.0, prompts=prompts)
+        summary = replay.run()
+
+    rows = pd.read_csv(tmp_path / "results" / "replay_trace" / "requests.csv").sort_values('start_offset(s)')
+    assert rows['target_input_tokens'].tolist()[0] == 5
+    assert sorted(rows['target_output_tokens']) == [2, 3, 4, 6]
+    assert (rows['output_tokens'] == rows['target_output_tokens']).all()
+    # Twice as fast: the last request goes out 0.2s after the first
+    assert rows['start_offset(s)'].max() - rows['start_offset(s)'].min() == pytest.approx(0.2, abs=0.05)
+    assert (rows['send_lag(ms)'] < 50).all()
+
+    by_target = dict(zip(rows['target_input_tokens'], rows['input_tokens']))
+    assert by_target[4] == 2  # The trace's own prompt is sent as recorded
+    if prompts == "synthetic":
+        assert by_target == {5: 5, 4: 2, 8: 8, 3: 3}
+    else:
+        # Closest dataset prompt: 9 tokens for 8
+        assert by_target == {5: 5, 4: 2, 8: 9, 3: 3}
+
+    assert summary['requests'].tolist() == [4]
+    assert (tmp_path / "results" / "replay_trace" / "summary.csv").exists()
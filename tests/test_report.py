@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from echoswift.report import latency_cdfs, render_report
+from echoswift.store import RUN_STORE, collect_results, load_run, with_cell_labels
+from echoswift.utils.plot_results import plot_benchmark_results
+
+
+def write_cell(path, users, input_tokens, output_tokens, n=50, ttft=100.0, request_rate=''):
+    rng = np.random.default_rng(users * 1000 + input_tokens)
+    pd.DataFrame({
+        'request': np.arange(n) // users + 1,
+        'start_epoch': 1.7e9 + np.arange(n),
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'latency(ms)': ttft + rng.exponential(500, n),
+        'throughput(tokens/second)': rng.normal(40, 5, n),
+        'latency_per_token(ms/token)': rng.normal(25, 2, n),
+        'TTFT(ms)': ttft * users + rng.exponential(20, n),
+        'users': users,
+        'target_input_tokens': input_tokens,
+        'target_output_tokens': output_tokens,
+        'request_rate': request_rate,
+    }).to_csv(path, index=False, mode='a', header=not path.exists())
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    for users in (1, 4):
+        user_dir = tmp_path / f"{users}_User"
+        (user_dir / "cells").mkdir(parents=True)
+        for input_tokens in (32, 64):
+            for output_tokens in (16, 128):
+                write_cell(user_dir / f"{input_tokens}_input_tokens.csv", users, input_tokens, output_tokens)
+        # Averages and cell files are not per-request results of the run
+        pd.DataFrame({'users': [users]}).to_csv(user_dir / "avg_32_input_tokens.csv", index=False)
+        write_cell(user_dir / "cells" / "32in_16out-abc.csv", users, 32, 16)
+    return tmp_path
+
+
+def test_store_collects_every_request(results_dir):
+    requests = load_run(results_dir)
+    assert (results_dir / RUN_STORE).exists()
+    assert len(requests) == 2 * 2 * 2 * 50
+    assert set(requests['source']) == {"1_User/32_input_tokens.csv", "1_User/64_input_tokens.csv",
+                                       "4_User/32_input_tokens.csv", "4_User/64_input_tokens.csv"}
+    assert 'target' not in requests.columns
+    assert requests['TTFT(ms)'].dtype == float
+
+    # New results make the store stale
+    write_cell(results_dir / "4_User" / "128_input_tokens.csv", 4, 128, 16)
+    store = results_dir / RUN_STORE
+    os.utime(store, (store.stat().st_mtime - 10,) * 2)
+    assert len(load_run(results_dir)) == 450
+
+
+def test_cdfs_are_quantiles_per_cell(results_dir):
+    requests = with_cell_labels(collect_results(results_dir))
+    cdfs = latency_cdfs(requests, 'TTFT(ms)', ['input tokens', 'output tokens', 'users'], points=11)
+    assert len(cdfs) == 8 * 11
+    cell = cdfs[(cdfs['input tokens'] == "32") & (cdfs['output tokens'] == "16") & (cdfs['users'] == 4)]
+    raw = requests[(requests['target_input_tokens'] == 32) & (requests['target_output_tokens'] == 16) &
+                   (requests['users'] == 4)]['TTFT(ms)']
+    assert cell['TTFT(ms)'].tolist() == pytest.approx(raw.quantile(np.linspace(0, 1, 11)).tolist())
+    assert cell['TTFT(ms)'].is_monotonic_increasing
+
+
+def test_report_and_plots(results_dir):
+    mixed_dir = results_dir / "2_User"
+    mixed_dir.mkdir()
+    for n in (10, 300, 2000):
+        write_cell(mixed_dir / "mixed_lengths.csv", 2, n, n // 10, n=5)
+
+    report = render_report(results_dir)
+    html = report.read_text()
+    assert html.count('<img src="data:image/png;base64,') == 5  # Three CDFs and two scaling charts
+    assert "mixed" in html and "415 requests in 9 cells" in html
+
+    plot_benchmark_results(results_dir)
+    aggregated = pd.read_csv(results_dir / "aggregated_data.csv")
+    assert len(aggregated) == 9
+    assert aggregated[aggregated['Input Token'] == "mixed"]['Number of Parallel Requests'].tolist() == [2]
+    for name in ("token_latency_plot.png", "throughput_plot.png", "ttft_plot.png"):
+        assert (results_dir / name).stat().st_size > 0
+    assert not (results_dir / "goodput_plot.png").exists()
+
+    plot_benchmark_results(results_dir, slo={"ttft": 150})
+    aggregated = pd.read_csv(results_dir / "aggregated_data.csv")
+    # TTFT grows with the number of users, so only single-user cells meet the SLO
+    attainment = aggregated.groupby('Number of Parallel Requests')['SLO Attainment'].mean()
+    assert attainment[1] > 0.5 and attainment[4] == 0
+    assert (aggregated['Goodput (tokens/second)'] <= aggregated['Goodput (requests/second)'] * 128).all()
+    for name in ("goodput_plot.png", "slo_attainment_plot.png"):
+        assert (results_dir / name).stat().st_size > 0
+
+
+def test_plots_keep_request_rates_apart(tmp_path):
+    user_dir = tmp_path / "4_User"
+    user_dir.mkdir()
+    for rate, ttft in ((1.0, 50.0), (8.0, 400.0)):
+        write_cell(user_dir / "32_input_tokens.csv", 4, 32, 16, ttft=ttft, request_rate=rate)
+
+    plot_benchmark_results(tmp_path, slo={"ttft": 1000})
+    aggregated = pd.read_csv(tmp_path / "aggregated_data.csv").set_index('Request Rate')
+    assert aggregated.index.tolist() == [1.0, 8.0]
+    assert aggregated.loc[1.0, 'TTFT (ms)'] < 400 < aggregated.loc[8.0, 'TTFT (ms)']
+    assert aggregated.loc[1.0, 'SLO Attainment'] == 1 and aggregated.loc[8.0, 'SLO Attainment'] < 1
+
+
+def test_multi_target_results_are_labelled(tmp_path):
+    for target in ("a", "b"):
+        (tmp_path / target / "1_User").mkdir(parents=True)
+        write_cell(tmp_path / target / "1_User" / "32_input_tokens.csv", 1, 32, 16, n=5)
+    requests = load_run(tmp_path)
+    assert requests.groupby('target').size().to_dict() == {"a": 5, "b": 5}
+    render_report(tmp_path)
+
+    plot_benchmark_results(tmp_path)
+    aggregated = pd.read_csv(tmp_path / "aggregated_data.csv")
+    assert aggregated['Target'].tolist() == ["a", "b"]
@@ -0,0 +1,51 @@
+import csv
+import threading
+
+import pytest
+
+from echoswift.result_sink import ResultSink, get_result_sink, close_all_sinks
+
+
+def test_csv_sink_batches_rows_from_concurrent_writers(tmp_path):
+    path = tmp_path / "results.csv"
+    sink = ResultSink(path, ['request', 'value'], batch_size=7)
+
+    def write_rows(worker):
+        for i in range(100):
+            sink.write({'request': worker, 'value': i})
+
+    threads = [threading.Thread(target=write_rows, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.flush()
+
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 400
+    sink.close()
+    with pytest.raises(RuntimeError):
+        sink.write({'request': 0, 'value': 0})
+
+
+def test_process_wide_sink_is_shared_and_closed(tmp_path):
+    path = tmp_path / "results.csv"
+    assert get_result_sink(path) is get_result_sink(path)
+    close_all_sinks()
+    assert get_result_sink(path) is not None
+    close_all_sinks()
+
+
+def test_parquet_sink_writes_numeric_columns(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "results.parquet"
+    sink = ResultSink(path, ['request', 'TTFT(ms)', 'ITL_p50(ms)'], fmt="parquet")
+    sink.write({'request': 1, 'TTFT(ms)': "12.500", 'ITL_p50(ms)': ''})
+    sink.write({'request': 2, 'TTFT(ms)': "7.250", 'ITL_p50(ms)': "1.000"})
+    sink.close()
+
+    df = pd.read_parquet(path)
+    assert df['TTFT(ms)'].tolist() == [12.5, 7.25]
+    assert df['ITL_p50(ms)'].isna().tolist() == [True, False]
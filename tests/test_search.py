@@ -0,0 +1,39 @@
+import pytest
+
+from conftest import serve_app
+from echoswift.llm_inference_benchmark import EchoSwift
+from echoswift.mock_server import MockInferenceServer
+from echoswift.search import SLO, SaturationSearch
+
+
+def test_slo_parsing_and_violation_budget():
+    slo = SLO("ttft_p99", 500)
+    assert slo.column == "TTFT(ms)_p99"
+    assert SLO("tpot_mean", 50).column == "latency_per_token(ms/token)"
+    # p99 of 100 requests interpolates between the 99th and 100th value
+    assert slo.violation_budget(100) == 1
+    assert SLO("latency_max", 1000).violation_budget(100) == 0
+    assert SLO("ttft_mean", 100).violation_budget(100) is None
+    with pytest.raises(ValueError):
+        SLO("throughput_p50", 10)
+    with pytest.raises(ValueError):
+        SLO("ttft_p42", 10)
+
+
+def test_search_finds_saturation_point(whitespace_tokenizer, tmp_path):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\ntell me a story\n")
+
+    # Two requests are served at a time and take ~40 ms each, so a third user queues past the TTFT SLO
+    server = MockInferenceServer(ttft_ms=30, tokens_per_second=100, max_concurrency=2)
+    with serve_app(server.build_app()) as base_url:
+        benchmark = EchoSwift(tmp_path / "results", base_url + "/generate_stream", "TGI", max_requests=2,
+                              input_tokens=[32], output_tokens=[2], dataset_dir=str(dataset_dir), engine="async")
+        saturation = SaturationSearch(benchmark, {"ttft_max": 55}, input_tokens=32, output_tokens=2, max_load=16)
+        best = saturation.run()
+
+    assert best == 2
+    assert [probe["load"] for probe in saturation.probes] == [1, 2, 4, 3]
+    assert saturation.probes[2]["aborted"]
+    assert (saturation.output_dir / "search_summary.csv").exists()
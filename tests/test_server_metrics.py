@@ -0,0 +1,55 @@
+import pandas as pd
+
+from conftest import serve_app
+from echoswift.llm_inference_benchmark import EchoSwift
+from echoswift.mock_server import MockInferenceServer
+from echoswift.server_metrics import SERVER_METRICS_SUFFIX, join_server_metrics, parse_prometheus
+
+
+def test_parse_prometheus_sums_labels_and_filters():
+    text = (
+        "# HELP vllm:num_requests_waiting Requests waiting\n"
+        "# TYPE vllm:num_requests_waiting gauge\n"
+        'vllm:num_requests_waiting{model_name="a"} 3.0\n'
+        'vllm:num_requests_waiting{model_name="b"} 2\n'
+        "vllm:num_requests_running 4 1700000000000\n"
+        "other_metric 1\n"
+    )
+    assert parse_prometheus(text, ["vllm:num_requests_waiting", "vllm:num_requests_running"]) == {
+        "vllm:num_requests_waiting": 5.0, "vllm:num_requests_running": 4.0}
+    assert parse_prometheus(text)["other_metric"] == 1.0
+
+
+def test_join_uses_latest_sample_of_the_same_cell():
+    results = pd.DataFrame({"start_epoch": [10.5, 12.0, 12.0], "TTFT(ms)": [1, 2, 3],
+                            "users": [1, 1, 2], "request_rate": [None, None, None]})
+    samples = pd.DataFrame({"timestamp": [10.0, 11.0, 11.5, 11.9], "queue": [0, 5, 7, 9],
+                            "users": [1, 1, 1, 2], "request_rate": [None, None, None, None]})
+    joined = join_server_metrics(results, samples).sort_values("TTFT(ms)")
+    assert joined["queue"].tolist() == [0, 7, 9]
+    assert joined["request_rate"].isna().all()
+
+
+def test_cells_are_joined_with_the_exporter_samples(whitespace_tokenizer, tmp_path):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\n" + "".join(f"prompt {i}\n" for i in range(50)))
+    # One request at a time, so concurrent users queue on the server
+    server = MockInferenceServer(ttft_ms=20, tokens_per_second=1000, max_concurrency=1)
+
+    with serve_app(server.build_app()) as base_url:
+        benchmark = EchoSwift(tmp_path / "results", base_url + "/v1/completions", "vLLM", "m", max_requests=2,
+                              user_counts=[4], input_tokens=[32], output_tokens=[4], dataset_dir=str(dataset_dir),
+                              engine="async", server_metrics={"url": base_url + "/metrics", "interval": 0.01})
+        benchmark.run_benchmark()
+
+    user_dir = tmp_path / "results" / "4_User"
+    samples = pd.read_csv(next((user_dir / "cells").glob(f"*{SERVER_METRICS_SUFFIX}")))
+    assert len(samples) > 1
+    assert samples["users"].eq(4).all()
+    assert samples["mock_requests_waiting"].max() > 0
+
+    joined = pd.read_csv(user_dir / "32_input_tokens_server_metrics.csv")
+    assert len(joined) == 8
+    assert (joined["server_timestamp"] <= joined["start_epoch"]).all()
+    assert joined["mock_requests_running"].notna().all()
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from conftest import serve_app
+from echoswift.async_engine import truncate_history
+from echoswift.llm_inference_benchmark import EchoSwift
+from echoswift.mock_server import MockInferenceServer
+from echoswift.streaming import get_adapter
+
+
+class RecordingChatServer(MockInferenceServer):
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.conversations = []
+
+    async def _chat(self, request):
+        self.conversations.append((await request.json())['messages'])
+        return await super()._chat(request)
+
+
+def message(role, tokens):
+    return {"role": role, "content": "w " * tokens}, tokens
+
+
+def test_truncate_history_drops_oldest_turns():
+    history = [message("user", 10), message("assistant", 20), message("user", 10), message("assistant", 20),
+               message("user", 10)]
+    assert truncate_history(history) == history
+    assert truncate_history(history, 45) == history[2:]
+    # Never starts with an assistant reply, and always keeps the newest message
+    assert truncate_history(history, 35) == history[4:]
+    assert truncate_history(history, 5) == history[4:]
+
+
+def test_completion_servers_get_a_transcript():
+    messages = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"},
+                {"role": "user", "content": "bye"}]
+    assert get_adapter("vLLM").build_chat_payload(messages, 8, "m")["prompt"] == \
+        "User: hi\nAssistant: hello\nUser: bye\nAssistant:"
+    assert get_adapter("NIMS").build_chat_payload(messages, 8, "m")["messages"] == messages
+
+
+def test_sessions_resend_growing_history(whitespace_tokenizer, tmp_path):
+    dataset_dir = tmp_path / "Input_Dataset"
+    dataset_dir.mkdir()
+    (dataset_dir / "Dataset_32.csv").write_text("Input_Prompt\n" + "".join(f"question {i}\n" for i in range(20)))
+    server = RecordingChatServer(ttft_ms=0, tokens_per_second=1000)
+
+    with serve_app(server.build_app()) as base_url:
+        benchmark = EchoSwift(tmp_path / "results", base_url + "/v1/chat/completions", "NIMS", "m", max_requests=4,
+                              user_counts=[2], input_tokens=[32], output_tokens=[5], dataset_dir=str(dataset_dir),
+                              engine="async", sessions={"turns": 3, "think_time": 0.01})
+        benchmark.run_benchmark()
+
+    # Per user: one 3-turn conversation, then the first turn of the next
+    assert sorted(len(m) for m in server.conversations) == [1, 1, 1, 1, 3, 3, 5, 5]
+    third_turn = next(m for m in server.conversations if len(m) == 5)
+    assert [m["role"] for m in third_turn] == ["user", "assistant", "user", "assistant", "user"]
+    assert third_turn[1]["content"].split() == ["the", "of", "and", "to", "in"]
+
+    user_dir = tmp_path / "results" / "2_User"
+    rows = pd.read_csv(user_dir / "32_input_tokens.csv")
+    assert sorted(rows['turn']) == [1, 1, 1, 1, 2, 2, 3, 3]
+    assert rows['session'].nunique() == 4
+    # Context: 2 prompt tokens per question plus 5 per reply
+    assert sorted(rows[rows['turn'] == 3]['input_tokens']) == [16, 16]
+
+    by_turn = pd.read_csv(user_dir / "avg_by_turn_32_input_tokens.csv")
+    assert by_turn['turn'].tolist() == [1, 2, 3]
+    assert by_turn['prompt tokens'].tolist() == [2, 9, 16]
+    assert by_turn['requests'].tolist() == [4, 2, 2]
+
+
+def test_sessions_need_the_async_engine():
+    with pytest.raises(ValueError):
+        EchoSwift("out", "http://host/v1/chat/completions", "NIMS", "m", sessions={"turns": 2})
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from echoswift.streaming import ADAPTERS, SERVER_USAGE, STREAM_EVENTS, TOKENIZER, StreamCollector, get_adapter
+from echoswift.token_counter import TokenCounter
+
+
+def sse(event):
+    return f"data: {json.dumps(event)}".encode()
+
+
+STREAMS = {
+    "TGI": [sse({"token": {"text": "Hel"}}), b"", sse({"token": {"text": "lo"}})],
+    "Ollama": [json.dumps({"response": "Hel"}).encode(), json.dumps({"response": "lo", "done": True}).encode()],
+    "Llamacpp": [sse({"content": "Hel"}), sse({"content": "lo"})],
+    "vLLM": [sse({"choices": [{"text": "Hel"}]}), sse({"choices": [{"text": "lo"}]}), b"data: [DONE]"],
+    "NIMS": [sse({"choices": [{"delta": {"role": "assistant"}}]}),
+             sse({"choices": [{"delta": {"content": "Hel"}}]}),
+             sse({"choices": [{"delta": {"content": "lo"}}]}), b"data: [DONE]"],
+    "OpenAI": [sse({"choices": [{"delta": {"content": "Hel"}}]}), sse({"choices": [{"delta": {"content": "lo"}}]}),
+               sse({"choices": [], "usage": {"completion_tokens": 2}}), b"data: [DONE]"],
+}
+
+
+@pytest.mark.parametrize("server", sorted(STREAMS))
+def test_collector_parses_every_registered_server(server):
+    collector = StreamCollector(get_adapter(server), start_time=10.0)
+    now = 10.0
+    for line in STREAMS[server]:
+        now += 0.5
+        if collector.feed(line, now=now):
+            break
+
+    assert collector.text == "Hello"
+    assert collector.token_events == 2
+    assert collector.ttft == pytest.approx(0.5 if server != "NIMS" else 1.0)
+    assert len(collector.token_times) == 2
+    assert collector.parse_errors == 0
+
+
+def test_collector_counts_parse_errors_and_can_drop_text():
+    collector = StreamCollector(get_adapter("vLLM"), start_time=0.0, keep_text=False)
+    assert not collector.feed(b"data: {not json")
+    assert not collector.feed(b": keep-alive comment")
+    assert not collector.feed(sse({"choices": [{"text": "x"}]}))
+    assert collector.feed(b"data: [DONE]")
+    assert collector.parse_errors == 1
+    assert collector.token_events == 1
+    assert collector.text == ""
+
+
+def test_every_server_is_registered():
+    assert set(ADAPTERS) == {"TGI", "Ollama", "Llamacpp", "vLLM", "NIMS", "OpenAI"}
+    assert get_adapter("vLLM").build_payload("hi", 8, "llama")["max_tokens"] == 8
+    with pytest.raises(ValueError):
+        get_adapter("Unknown")
+
+
+@pytest.mark.parametrize("server, final_event, expected", [
+    ("TGI", {"token": {"text": ""}, "details": {"generated_tokens": 7}}, (7, SERVER_USAGE)),
+    ("Ollama", {"response": "", "done": True, "eval_count": 7}, (7, SERVER_USAGE)),
+    ("Llamacpp", {"content": "", "stop": True, "timings": {"predicted_n": 7}}, (7, SERVER_USAGE)),
+    ("vLLM", {"choices": [], "usage": {"completion_tokens": 7}}, (7, SERVER_USAGE)),
+    ("Llamacpp", {"content": "", "stop": False}, (2, STREAM_EVENTS)),
+    ("vLLM", {"choices": [{"text": ""}]}, (None, TOKENIZER)),
+])
+def test_output_tokens_prefer_server_usage(server, final_event, expected):
+    adapter = get_adapter(server)
+    collector = StreamCollector(adapter, start_time=0.0)
+    for line in STREAMS[server][:2]:
+        collector.feed(line, now=1.0)
+    if adapter.framing == "ndjson":
+        collector.feed(json.dumps(final_event).encode())
+    else:
+        collector.feed(sse(final_event))
+    assert collector.output_tokens() == expected
+    assert collector.parse_errors == 0
+
+
+def test_token_counter_batches_in_background():
+    class BatchTokenizer:
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, texts, add_special_tokens=True):
+            self.calls.append(len(texts))
+            return {"input_ids": [text.split() for text in texts]}
+
+    tokenizer = BatchTokenizer()
+    counter = TokenCounter(tokenizer)
+    futures = [counter.submit("a b c"), counter.submit(""), counter.submit("a")]
+    assert [f.result(timeout=5) for f in futures] == [3, 0, 1]
+    counter.close()
+    assert sum(tokenizer.calls) == 3
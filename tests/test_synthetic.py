@@ -0,0 +1,61 @@
+import csv
+
+import pytest
+
+from echoswift.synthetic import SYNTHETIC_META_FILE, generate_synthetic_datasets
+
+
+class PieceTokenizer:
+    """Sentencepiece-like: a BOS token, whole-word pieces, and unknown words split per character."""
+
+    def __init__(self, words):
+        self.vocab = {f"▁{w}": i for i, w in enumerate(words, start=1)}
+
+    def encode(self, text):
+        ids = [0]
+        for word in text.split():
+            ids.extend([self.vocab[f"▁{word}"]] if f"▁{word}" in self.vocab else list(word))
+        return ids
+
+    def get_vocab(self):
+        return self.vocab
+
+
+def read(path):
+    with open(path) as f:
+        return [row['Input_Prompt'] for row in csv.DictReader(f)]
+
+
+def test_prompts_have_exact_lengths_and_shared_prefixes(tmp_path):
+    tokenizer = PieceTokenizer(["alpha", "beta", "gamma", "delta", "Upper", "x1"])
+    files = generate_synthetic_datasets(tokenizer, [16, 40], tmp_path, num_prompts=30, prefix_ratio=0.5,
+                                        prefix_pool_size=2, seed=1)
+
+    assert [f.name for f in files] == ["Dataset_16.csv", "Dataset_40.csv"]
+    for n, path in zip([16, 40], files):
+        prompts = read(path)
+        assert len(prompts) == 30
+        assert {len(tokenizer.encode(p)) for p in prompts} == {n}
+        assert len({tuple(tokenizer.encode(p)[:1 + n // 2]) for p in prompts}) == 2
+        # Only lowercase whole-word tokens and the single-token fallback words are used
+        assert not {w for p in prompts for w in p.split()} & {"Upper", "x1"}
+    assert (tmp_path / SYNTHETIC_META_FILE).exists()
+
+    # Same seed, same prompts
+    again = generate_synthetic_datasets(tokenizer, [16], tmp_path / "again", num_prompts=30, prefix_ratio=0.5,
+                                        prefix_pool_size=2, seed=1)
+    assert read(again[0]) == read(files[0])
+
+
+def test_length_distribution(tmp_path):
+    tokenizer = PieceTokenizer(["alpha", "beta", "gamma"])
+    path, = generate_synthetic_datasets(tokenizer, [100], tmp_path, num_prompts=200, length_distribution="uniform",
+                                        length_spread=0.2)
+    lengths = [len(tokenizer.encode(p)) for p in read(path)]
+    assert 80 <= min(lengths) < max(lengths) <= 120
+    assert 95 < sum(lengths) / len(lengths) < 105
+
+    with pytest.raises(ValueError):
+        generate_synthetic_datasets(tokenizer, [100], tmp_path, prefix_ratio=1.0)
+    with pytest.raises(ValueError):
+        generate_synthetic_datasets(tokenizer, [100], tmp_path, length_distribution="zipf")
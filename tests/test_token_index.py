@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from conftest import WhitespaceTokenizer, write_dataset
+from echoswift.token_index import build_token_index, ensure_token_index, load_token_index
+
+
+def test_index_roundtrip_with_token_ids(tmp_path):
+    dataset = tmp_path / "Dataset_32.csv"
+    write_dataset(dataset, ["one two", "three", "four five six"])
+
+    build_token_index(dataset, WhitespaceTokenizer(), "tok", store_ids=True)
+    index = load_token_index(dataset, "tok")
+
+    assert list(index.counts) == [2, 1, 3]
+    assert list(index.token_ids(2)) == [4, 4, 3]
+    assert load_token_index(dataset, "other-tok") is None
+
+
+def test_index_rebuilt_when_dataset_or_tokenizer_changes(tmp_path):
+    dataset = tmp_path / "Dataset_32.csv"
+    write_dataset(dataset, ["one two"])
+    ensure_token_index(dataset, "tok", tokenizer=WhitespaceTokenizer())
+
+    write_dataset(dataset, ["one two", "three four five"])
+    os.utime(dataset, ns=(0, 0))
+    assert load_token_index(dataset, "tok") is None
+    assert list(ensure_token_index(dataset, "tok", tokenizer=WhitespaceTokenizer()).counts) == [2, 3]
+
+    old_fingerprint = load_token_index(dataset, "tok").meta["tokenizer_fingerprint"]
+    assert load_token_index(dataset, "tok", fingerprint="changed") is None
+    rebuilt = ensure_token_index(dataset, "tok", tokenizer=WhitespaceTokenizer(vocab={"b": 1}))
+    assert rebuilt.meta["tokenizer_fingerprint"] != old_fingerprint
+
+
+def test_index_files_are_replaced_atomically(tmp_path):
+    dataset = tmp_path / "Dataset_32.csv"
+    write_dataset(dataset, ["one two", "three"])
+    build_token_index(dataset, WhitespaceTokenizer(), "tok", store_ids=True)
+    index = load_token_index(dataset, "tok", store_ids=True)
+    files = list((tmp_path / ".token_index").rglob("*"))
+    assert not [f for f in files if f.name.endswith(".partial")]
+
+    # Offsets left over from another build of the dataset are not paired with these ids
+    offsets = next(f for f in files if f.name.endswith(".offsets.npy"))
+    np.save(offsets, np.asarray(index.offsets)[:-1])
+    assert load_token_index(dataset, "tok") is None